@@ -0,0 +1,243 @@
+"""
+Analyse des temps d'attente (arrivée -> prise en charge) et de traitement
+(prise en charge -> fin) à partir d'agrégats horaires précalculés.
+
+Les triages terminés sont agrégés une seule fois, par lots et par service,
+dans `analytique_rollup` (compteurs et sommes) et `analytique_histogramme`
+(histogrammes à classes logarithmiques fixes, additionnables). Les rapports
+ne lisent que ces tables : les percentiles sont interpolés dans les
+histogrammes fusionnés.
+
+Usage :
+    python analytique.py                 # mise à jour incrémentale
+    python analytique.py --boucle 300    # toutes les 5 minutes
+"""
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+from mysql.connector import Error
+
+NIVEAUX = ('red', 'orange', 'yellow', 'green')
+METRIQUES = ('attente', 'traitement')
+
+# Bornes des classes en secondes: 0, puis de 30 s à 48 h en progression géométrique
+BORNES = np.concatenate([[0.0], np.geomspace(30, 48 * 3600, 30)])
+NB_CLASSES = len(BORNES)
+
+PERCENTILES = (50, 90, 95)
+
+GROUPES = {
+    'niveau': "niveau_triage",
+    'evaluateur': "utilisateur_id",
+    'heure': "HOUR(heure)"
+}
+
+
+def classer(durees):
+    """Indice de classe de chaque durée (la dernière classe est ouverte)"""
+    return np.clip(np.searchsorted(BORNES, durees, side='right') - 1, 0, NB_CLASSES - 1)
+
+
+def agreger_lot(lignes):
+    """Agréger un lot de triages terminés par (service, heure, niveau, évaluateur), de façon vectorisée.
+
+    `lignes` contient (id, utilisateur_id, niveau_triage, date_triage,
+    date_prise_en_charge, date_fin_prise_en_charge, service).
+    """
+    brut = np.array(lignes, dtype=object)
+    utilisateurs = brut[:, 1].astype(np.int64)
+    niveaux = np.array([NIVEAUX.index(n) for n in brut[:, 2]], dtype=np.int64)
+    arrivee = brut[:, 3].astype('datetime64[s]').astype(np.int64)
+    # Un patient passé directement à 'termine' n'a pas de date de prise en charge
+    prise = np.array([d or np.datetime64('NaT') for d in brut[:, 4]], dtype='datetime64[s]')
+    fin = brut[:, 5].astype('datetime64[s]').astype(np.int64)
+    services, codes_service = np.unique(brut[:, 6].astype(str), return_inverse=True)
+
+    avec_prise = ~np.isnat(prise)
+    prise_s = np.where(avec_prise, prise.astype(np.int64), 0)
+    attente = np.where(avec_prise, np.maximum(prise_s - arrivee, 0), 0).astype(np.float64)
+    traitement = np.where(avec_prise, np.maximum(fin - prise_s, 0), 0).astype(np.float64)
+
+    cles = np.stack([codes_service.ravel(), arrivee // 3600, niveaux, utilisateurs], axis=1)
+    groupes, inverse = np.unique(cles, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    nb_groupes = len(groupes)
+
+    nb = np.bincount(inverse, minlength=nb_groupes)
+    nb_prises = np.bincount(inverse, weights=avec_prise, minlength=nb_groupes)
+    somme_attente = np.bincount(inverse, weights=attente, minlength=nb_groupes)
+    somme_traitement = np.bincount(inverse, weights=traitement, minlength=nb_groupes)
+
+    histogrammes = {}
+    for metrique, durees in (('attente', attente), ('traitement', traitement)):
+        hist = np.zeros((nb_groupes, NB_CLASSES), dtype=np.int64)
+        np.add.at(hist, (inverse[avec_prise], classer(durees[avec_prise])), 1)
+        histogrammes[metrique] = hist
+
+    rollups, classes = [], []
+    for g, (code_service, heure, niveau, utilisateur) in enumerate(groupes):
+        service = str(services[code_service])
+        # Dates naïves (heure locale du serveur) converties sans décalage
+        heure_dt = datetime.utcfromtimestamp(int(heure) * 3600)
+        rollups.append((service, heure_dt, NIVEAUX[niveau], int(utilisateur), int(nb[g]), int(nb_prises[g]),
+                        float(somme_attente[g]), float(somme_traitement[g])))
+        for metrique, hist in histogrammes.items():
+            for classe in np.flatnonzero(hist[g]):
+                classes.append((service, heure_dt, NIVEAUX[niveau], int(utilisateur), metrique,
+                                int(classe), int(hist[g, classe])))
+    return rollups, classes
+
+
+def integrer_lot(cursor, lignes):
+    """Ajouter aux agrégats un lot de triages terminés (format de agreger_lot), sans valider"""
+    rollups, classes = agreger_lot(lignes)
+    cursor.executemany("""
+        INSERT INTO analytique_rollup
+            (service, heure, niveau_triage, utilisateur_id, nb, nb_pris_en_charge,
+             somme_attente_s, somme_traitement_s)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            nb = nb + VALUES(nb),
+            nb_pris_en_charge = nb_pris_en_charge + VALUES(nb_pris_en_charge),
+            somme_attente_s = somme_attente_s + VALUES(somme_attente_s),
+            somme_traitement_s = somme_traitement_s + VALUES(somme_traitement_s)
+    """, rollups)
+    cursor.executemany("""
+        INSERT INTO analytique_histogramme
+            (service, heure, niveau_triage, utilisateur_id, metrique, classe, nb)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE nb = nb + VALUES(nb)
+    """, classes)
+
+
+def mettre_a_jour_rollups(get_db_connection, taille_lot=5000):
+    """Intégrer aux agrégats les triages terminés depuis le dernier passage"""
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError("Connexion à la base de données impossible")
+
+    total = 0
+    try:
+        cursor = connection.cursor()
+        while True:
+            # Le verrou sur l'état sérialise les mises à jour concurrentes
+            cursor.execute("""
+                SELECT derniere_fin, dernier_id FROM analytique_etat WHERE id = 1 FOR UPDATE
+            """)
+            derniere_fin, dernier_id = cursor.fetchone()
+            cursor.execute("""
+                SELECT id, utilisateur_id, niveau_triage, date_triage,
+                       date_prise_en_charge, date_fin_prise_en_charge, service
+                FROM triages
+                WHERE statut = 'termine'
+                  AND date_fin_prise_en_charge <= NOW() - INTERVAL 5 SECOND
+                  AND (date_fin_prise_en_charge > %s
+                       OR (date_fin_prise_en_charge = %s AND id > %s))
+                ORDER BY date_fin_prise_en_charge, id
+                LIMIT %s
+            """, (derniere_fin, derniere_fin, dernier_id, taille_lot))
+            lignes = cursor.fetchall()
+            if not lignes:
+                connection.rollback()
+                break
+
+            integrer_lot(cursor, lignes)
+            cursor.execute("""
+                UPDATE analytique_etat SET derniere_fin = %s, dernier_id = %s, date_execution = NOW() WHERE id = 1
+            """, (lignes[-1][5], lignes[-1][0]))
+            connection.commit()
+            total += len(lignes)
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return total
+
+
+def percentiles_histogramme(comptes, percentiles=PERCENTILES):
+    """Percentiles (secondes) interpolés linéairement dans un histogramme à classes BORNES"""
+    total = comptes.sum()
+    if not total:
+        return {f"p{p}": None for p in percentiles}
+    cumul = np.cumsum(comptes)
+    largeurs = np.append(np.diff(BORNES), BORNES[-1] - BORNES[-2])
+    resultat = {}
+    for p in percentiles:
+        rang = total * p / 100
+        classe = int(np.searchsorted(cumul, rang))
+        avant = cumul[classe - 1] if classe else 0
+        fraction = (rang - avant) / comptes[classe] if comptes[classe] else 0
+        resultat[f"p{p}"] = round(float(BORNES[classe] + fraction * largeurs[classe]), 1)
+    return resultat
+
+
+def rapport_attentes(get_db_connection, debut, fin, groupe='niveau', service=None):
+    """Percentiles d'attente et de traitement par groupe, lus dans les agrégats (tous services si None)"""
+    colonne = GROUPES[groupe]
+    connection = get_db_connection(lecture=True)
+    if not connection:
+        raise RuntimeError("Connexion à la base de données impossible")
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT {colonne} as groupe, SUM(nb), SUM(nb_pris_en_charge),
+                   SUM(somme_attente_s), SUM(somme_traitement_s)
+            FROM analytique_rollup
+            WHERE (%s IS NULL OR service = %s) AND heure >= %s AND heure < %s
+            GROUP BY groupe
+        """, (service, service, debut, fin))
+        sommes = {ligne[0]: ligne[1:] for ligne in cursor.fetchall()}
+
+        cursor.execute(f"""
+            SELECT {colonne} as groupe, metrique, classe, SUM(nb)
+            FROM analytique_histogramme
+            WHERE (%s IS NULL OR service = %s) AND heure >= %s AND heure < %s
+            GROUP BY groupe, metrique, classe
+        """, (service, service, debut, fin))
+        histogrammes = {}
+        for valeur, metrique, classe, nb in cursor.fetchall():
+            hist = histogrammes.setdefault((valeur, metrique), np.zeros(NB_CLASSES, dtype=np.int64))
+            hist[classe] = nb
+
+        noms = {}
+        if groupe == 'evaluateur' and sommes:
+            cursor.execute(f"""
+                SELECT id, prenom, nom FROM utilisateurs WHERE id IN ({", ".join(["%s"] * len(sommes))})
+            """, list(sommes))
+            noms = {i: f"{prenom} {nom}" for i, prenom, nom in cursor.fetchall()}
+    finally:
+        connection.close()
+
+    resultats = []
+    for valeur, (nb, nb_pris, somme_attente, somme_traitement) in sorted(sommes.items()):
+        entree = {'groupe': valeur, 'nb_termines': int(nb)}
+        if groupe == 'evaluateur':
+            entree['evaluateur'] = noms.get(valeur)
+        for metrique, somme in (('attente', somme_attente), ('traitement', somme_traitement)):
+            hist = histogrammes.get((valeur, metrique), np.zeros(NB_CLASSES, dtype=np.int64))
+            entree[metrique] = dict(
+                percentiles_histogramme(hist),
+                moyenne=round(float(somme) / int(nb_pris), 1) if nb_pris else None
+            )
+        resultats.append(entree)
+    return resultats
+
+
+if __name__ == '__main__':
+    from app import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Mettre à jour les agrégats horaires des temps d'attente")
+    parser.add_argument('--taille-lot', type=int, default=5000)
+    parser.add_argument('--boucle', type=float, help="Relancer toutes les N secondes")
+    args = parser.parse_args()
+
+    while True:
+        debut = time.time()
+        nb = mettre_a_jour_rollups(get_db_connection, args.taille_lot)
+        print(f"📈 {nb} triages agrégés en {time.time() - debut:.1f}s")
+        if not args.boucle:
+            break
+        time.sleep(args.boucle)
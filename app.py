@@ -1,57 +1,143 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, make_response
-import joblib
-import pandas as pd
-import numpy as np
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, make_response, send_from_directory, abort, has_request_context
 import os
-import mysql.connector
-from mysql.connector import Error
 from werkzeug.security import check_password_hash, generate_password_hash
 from datetime import datetime, timedelta
 import json
 from functools import wraps
 import re
-from sklearn.preprocessing import StandardScaler, LabelEncoder
 import io
+import base64
+import binascii
+import time
+import gzip
+import hashlib
+import mimetypes
+import atexit
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timezone
+from markupsafe import Markup
+from validation import valider, ErreurValidation, EnregistrementTriage, CODES_TABAGISME
 
-# Initialiser Flask
-app = Flask(__name__)
+# Initialiser Flask (les fichiers statiques sont servis par servir_statique)
+app = Flask(__name__, static_folder=None)
 app.secret_key = 'votre_cle_secrete_triage_medical_2024'
 
+STATIC_DIR = os.path.join(app.root_path, 'static')
+# Réponses HTML/JSON compressées à la volée au-delà de ce seuil (octets)
+GZIP_SEUIL = int(os.environ.get('TRIAGE_GZIP_SEUIL', '1024'))
+GZIP_NIVEAU = 6
+TYPES_COMPRESSIBLES = {'text/html', 'application/json'}
+
 # Configuration de la base de données MySQL
 DB_CONFIG = {
-    'host': 'localhost',
+    'host': os.environ.get('TRIAGE_DB_HOST', 'localhost'),
+    'port': int(os.environ.get('TRIAGE_DB_PORT', '3306')),
     'database': 'medicaal_triage_ai',
     'user': 'root',
     'password': '',
     'charset': 'utf8mb4'
 }
 
+# Réplique en lecture (optionnelle): mêmes identifiants que le primaire
+DB_REPLICA_CONFIG = dict(
+    DB_CONFIG,
+    host=os.environ['TRIAGE_DB_REPLICA_HOST'],
+    port=int(os.environ.get('TRIAGE_DB_REPLICA_PORT', '3306'))
+) if os.environ.get('TRIAGE_DB_REPLICA_HOST') else None
+# Retard de réplication toléré (secondes) avant de revenir au primaire
+REPLICA_RETARD_MAX = float(os.environ.get('TRIAGE_REPLICA_RETARD_MAX', '5'))
+REPLICA_VERIF_SECONDES = 5
+# Routes en lecture seule dont les requêtes peuvent aller sur la réplique
+ROUTES_LECTURE = set(os.environ.get(
+    'TRIAGE_ROUTES_LECTURE',
+    'dashboard,historique,rechercher_patient,detail_patient,export_historique_pdf,api_analytique_attentes,'
+    'api_timeline_patient,api_tendances_patient,changements_file'
+).split(','))
+# Service (département / site) des comptes sans service renseigné
+SERVICE_DEFAUT = os.environ.get('TRIAGE_SERVICE_DEFAUT', 'Urgences')
+# Mise à jour incrémentale des agrégats d'analyse (secondes, 0 pour désactiver)
+ANALYTIQUE_INTERVALLE = float(os.environ.get('TRIAGE_ANALYTIQUE_INTERVALLE', '300'))
+
+# Lecture transparente de triages_archive (voir database_partitionnement.sql et archivage.py)
+ARCHIVAGE_ACTIF = os.environ.get('TRIAGE_ARCHIVAGE', '0') == '1'
+ETAT_ARCHIVAGE_TTL = 60
+
+# Pool de connexions partagé par les routes et les requêtes parallèles
+DB_POOL_SIZE = int(os.environ.get('TRIAGE_DB_POOL_SIZE', '10'))
+# Délai maximal d'une requête de lecture lancée en parallèle (secondes)
+REQUETE_TIMEOUT = float(os.environ.get('TRIAGE_REQUETE_TIMEOUT', '2.0'))
+
+# Dossier des artefacts du modèle (modifiable pour déployer un jeu réentraîné)
+MODELE_DIR = os.environ.get('TRIAGE_MODELE_DIR', '.')
+
+# Fichiers composant un jeu d'artefacts du modèle
+FICHIERS_MODELE = {
+    'model': 'modele_triage_medical.pkl',
+    'scaler': 'scaler_triage.pkl',
+    'label_encoders': 'encoders_triage.pkl',
+    'target_encoder': 'target_encoder_triage.pkl'
+}
+
+# Ordre des 16 colonnes attendues par le modèle
+FEATURES_MODELE = [
+    'age', 'gender', 'chest_pain_type', 'blood_pressure', 'cholesterol',
+    'max_heart_rate', 'exercise_angina', 'plasma_glucose', 'skin_thickness',
+    'insulin', 'bmi', 'diabetes_pedigree', 'hypertension', 'heart_disease',
+    'residence_urban', 'smoking_status'
+]
+
+LIBELLES_FEATURES = {
+    'age': 'Âge', 'gender': 'Sexe', 'chest_pain_type': 'Type de douleur thoracique',
+    'blood_pressure': 'Tension artérielle', 'cholesterol': 'Cholestérol',
+    'max_heart_rate': 'Fréquence cardiaque max', 'exercise_angina': "Angine d'effort",
+    'plasma_glucose': 'Glycémie', 'skin_thickness': 'Épaisseur cutanée', 'insulin': 'Insuline',
+    'bmi': 'IMC', 'diabetes_pedigree': 'Prédisposition au diabète', 'hypertension': 'Hypertension',
+    'heart_disease': 'Maladie cardiaque', 'residence_urban': 'Résidence urbaine',
+    'smoking_status': 'Tabagisme'
+}
+
+# Contributions des variables calculées et enregistrées avec chaque triage
+EXPLICATIONS_ACTIVES = os.environ.get('TRIAGE_EXPLICATIONS', '1') == '1'
+
+# Surveillance en ligne de la dérive des données reçues (voir derive.py)
+DERIVE_ACTIVE = os.environ.get('TRIAGE_DERIVE', '1') == '1'
+DERIVE_FENETRE = int(os.environ.get('TRIAGE_DERIVE_FENETRE', '5000'))
+DERIVE_SEUIL = float(os.environ.get('TRIAGE_DERIVE_SEUIL', '0.25'))
+
+# Backend d'inférence: 'local' (thread de la requête) ou 'pool' (processus dédiés)
+INFERENCE_BACKEND = os.environ.get('TRIAGE_INFERENCE', 'local')
+INFERENCE_WORKERS = int(os.environ.get('TRIAGE_INFERENCE_WORKERS', '0')) or None
+
 # Variables globales pour le modèle IA
 model = None
 scaler = None
 label_encoders = {}
 target_encoder = None
+pool_inference = None
+explications_modele = {'modele': None, 'tableaux': None}
+moniteur_derive = None
 
 def load_ai_model():
     """Charger le modèle IA et les encodeurs"""
     global model, scaler, label_encoders, target_encoder
     
     try:
-        model_files = [
-            'modele_triage_medical.pkl',
-            'scaler_triage.pkl', 
-            'encoders_triage.pkl',
-            'target_encoder_triage.pkl'
-        ]
+        import joblib
         
-        if not all(os.path.exists(f) for f in model_files):
+        model_files = {nom: os.path.join(MODELE_DIR, fichier) for nom, fichier in FICHIERS_MODELE.items()}
+        
+        if not all(os.path.exists(f) for f in model_files.values()):
             print("⚠️ Fichiers du modèle non trouvés, création d'un modèle basé sur les règles médicales...")
             create_medical_rules_model()
         else:
-            model = joblib.load('modele_triage_medical.pkl')
-            scaler = joblib.load('scaler_triage.pkl')
-            label_encoders = joblib.load('encoders_triage.pkl')
-            target_encoder = joblib.load('target_encoder_triage.pkl')
+            model = joblib.load(model_files['model'])
+            scaler = joblib.load(model_files['scaler'])
+            label_encoders = joblib.load(model_files['label_encoders'])
+            target_encoder = joblib.load(model_files['target_encoder'])
+            from derive import charger_reference
+            initialiser_derive(charger_reference(MODELE_DIR))
         
         print("✅ Modèle IA chargé avec succès!")
         return True
@@ -65,7 +151,10 @@ def create_medical_rules_model():
     """Créer un modèle basé sur des règles médicales réalistes"""
     global model, scaler, label_encoders, target_encoder
     
+    import numpy as np
+    import pandas as pd
     from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler, LabelEncoder
     
     print("✅ Création d'un modèle basé sur des règles médicales...")
     
@@ -151,75 +240,788 @@ def create_medical_rules_model():
     model.fit(X_scaled, y_encoded)
     
     label_encoders = {}
+    
+    from derive import construire_reference
+    initialiser_derive(construire_reference(
+        X.to_numpy(dtype=np.float64), target_encoder.inverse_transform(model.predict(X_scaled)), FEATURES_MODELE))
     print("✅ Modèle médical créé avec succès!")
 
-def predire_triage_patient(patient_data):
-    """Prédire le niveau de triage d'un patient"""
+def initialiser_derive(reference):
+    """(Re)créer le moniteur de dérive du modèle chargé, à partir de sa référence"""
+    global moniteur_derive
+    moniteur_derive = None
+    if not DERIVE_ACTIVE or not reference:
+        return
     try:
-        model_features = [
-            float(patient_data['age']),
-            float(patient_data['gender']),
-            float(patient_data['chest_pain_type']),
-            float(patient_data['blood_pressure']),
-            float(patient_data['cholesterol']),
-            float(patient_data['max_heart_rate']),
-            float(patient_data['exercise_angina']),
-            float(patient_data['plasma_glucose']),
-            float(patient_data['skin_thickness']),
-            float(patient_data['insulin']),
-            float(patient_data['bmi']),
-            float(patient_data['diabetes_pedigree']),
-            float(patient_data['hypertension']),
-            float(patient_data['heart_disease']),
-            1 if patient_data['Residence_type'] == 'Urban' else 0,
-            {'never smoked': 0, 'formerly smoked': 1, 'smokes': 2}.get(patient_data['smoking_status'], 0)
-        ]
-        
-        X = np.array(model_features).reshape(1, -1)
-        X_scaled = scaler.transform(X)
-        
-        prediction = model.predict(X_scaled)[0]
-        predicted_class = target_encoder.inverse_transform([prediction])[0]
-        
-        probabilities = {}
-        if hasattr(model, 'predict_proba'):
-            proba = model.predict_proba(X_scaled)[0]
+        from derive import MoniteurDerive
+        moniteur_derive = MoniteurDerive(reference, FEATURES_MODELE, fenetre=DERIVE_FENETRE,
+                                         seuil_alerte=DERIVE_SEUIL)
+    except (KeyError, ValueError) as e:
+        print(f"⚠️ Référence de dérive inutilisable: {e}")
+
+def demarrer_pool_inference():
+    """Démarrer le pool de processus d'inférence si le backend 'pool' est configuré"""
+    global pool_inference
+    
+    if INFERENCE_BACKEND != 'pool' or model is None or not hasattr(model, 'predict_proba'):
+        return False
+    
+    try:
+        from pool_inference import PoolInference
+        pool_inference = PoolInference(model, scaler, nb_workers=INFERENCE_WORKERS)
+        # Sans arrêt explicite, le bloc de mémoire partagée survit au processus
+        atexit.register(pool_inference.arreter)
+        print(f"✅ Pool d'inférence démarré ({pool_inference.nb_workers} workers)")
+        return True
+    except Exception as e:
+        print(f"❌ Erreur démarrage pool d'inférence: {e}")
+        pool_inference = None
+        return False
+
+def calculer_probabilites(X):
+    """Probabilités par classe, via le pool d'inférence si disponible"""
+    if pool_inference is not None:
+        try:
+            return pool_inference.predire_proba(X)
+        except Exception as e:
+            print(f"⚠️ Pool d'inférence indisponible, inférence locale: {e}")
+    return model.predict_proba(scaler.transform(X))
+
+def vecteur_patient(patient_data):
+    """Les 16 valeurs du modèle, dans l'ordre de FEATURES_MODELE"""
+    if isinstance(patient_data, EnregistrementTriage):
+        return patient_data.vecteur()
+    return [
+        float(patient_data['age']),
+        float(patient_data['gender']),
+        float(patient_data['chest_pain_type']),
+        float(patient_data['blood_pressure']),
+        float(patient_data['cholesterol']),
+        float(patient_data['max_heart_rate']),
+        float(patient_data['exercise_angina']),
+        float(patient_data['plasma_glucose']),
+        float(patient_data['skin_thickness']),
+        float(patient_data['insulin']),
+        float(patient_data['bmi']),
+        float(patient_data['diabetes_pedigree']),
+        float(patient_data['hypertension']),
+        float(patient_data['heart_disease']),
+        1 if patient_data['Residence_type'] == 'Urban' else 0,
+        CODES_TABAGISME.get(patient_data['smoking_status'], 0)
+    ]
+
+URGENCE_SCORES = {'red': 95, 'orange': 75, 'yellow': 50, 'green': 25}
+PRIORITES = {'red': 1, 'orange': 2, 'yellow': 3, 'green': 4}
+
+def predire_triage_lot(X):
+    """Niveau, probabilités, score d'urgence et priorité de chaque ligne de X (n x 16)"""
+    import numpy as np
+    
+    resultats = []
+    if hasattr(model, 'predict_proba'):
+        proba = calculer_probabilites(X)
+        niveaux = target_encoder.inverse_transform(model.classes_[np.argmax(proba, axis=1)])
+        for ligne, predicted_class in zip(proba, niveaux):
+            probabilities = {}
             for i, classe in enumerate(target_encoder.classes_):
-                probabilities[classe] = f"{proba[i] * 100:.1f}%"
-        else:
+                probabilities[classe] = f"{ligne[i] * 100:.1f}%"
+            resultats.append((predicted_class, probabilities))
+    else:
+        niveaux = target_encoder.inverse_transform(model.predict(scaler.transform(X)))
+        for predicted_class in niveaux:
             base_probs = {'red': 10, 'orange': 20, 'yellow': 30, 'green': 40}
             base_probs[predicted_class] = 70
             total = sum(base_probs.values())
+            probabilities = {}
             for classe in base_probs:
                 probabilities[classe] = f"{(base_probs[classe] / total) * 100:.1f}%"
-        
-        urgence_scores = {'red': 95, 'orange': 75, 'yellow': 50, 'green': 25}
-        priorites = {'red': 1, 'orange': 2, 'yellow': 3, 'green': 4}
-        score_urgence = urgence_scores.get(predicted_class, 50)
-        priorite = priorites.get(predicted_class, 3)
-        
-        return predicted_class, probabilities, score_urgence, priorite
+            resultats.append((predicted_class, probabilities))
+    
+    return [
+        (predicted_class, probabilities, URGENCE_SCORES.get(predicted_class, 50), PRIORITES.get(predicted_class, 3))
+        for predicted_class, probabilities in resultats
+    ]
+
+def predire_triage_patient(patient_data):
+    """Prédire le niveau de triage d'un patient"""
+    try:
+        import numpy as np
+        vecteur = vecteur_patient(patient_data)
+        resultat = predire_triage_lot(np.array(vecteur).reshape(1, -1))[0]
+        if moniteur_derive is not None:
+            moniteur_derive.observer(vecteur, resultat[0])
+        return resultat
         
     except Exception as e:
         print(f"❌ Erreur prédiction: {e}")
         return 'yellow', {'red': '10%', 'orange': '20%', 'yellow': '40%', 'green': '30%'}, 50, 3
 
+def expliquer_predictions(X, niveaux):
+    """Contributions de chaque variable au niveau prédit, pour un lot de patients.
+    
+    Renvoie un dict par ligne ({'unite', 'biais', 'contributions'}), ou None
+    si les explications sont désactivées ou le modèle non pris en charge.
+    """
+    if not EXPLICATIONS_ACTIVES or model is None:
+        return [None] * len(niveaux)
+    try:
+        import numpy as np
+        from explications import compiler_explications, expliquer
+        
+        # Tableaux compilés une fois par modèle chargé
+        if explications_modele['modele'] is not model:
+            explications_modele.update(modele=model, tableaux=compiler_explications(model, scaler))
+        t = explications_modele['tableaux']
+        if t is None:
+            return [None] * len(niveaux)
+        
+        biais, contributions = expliquer(t, np.asarray(X, dtype=np.float64))
+        colonnes = np.searchsorted(model.classes_, target_encoder.transform(niveaux))
+        return [
+            {
+                'unite': t['unite'],
+                'biais': round(float(biais[k]), 4),
+                'contributions': {nom: round(float(v), 4) for nom, v in zip(FEATURES_MODELE, contributions[i, :, k])}
+            }
+            for i, k in enumerate(colonnes)
+        ]
+    except Exception as e:
+        print(f"⚠️ Explications indisponibles: {e}")
+        return [None] * len(niveaux)
+
+def principales_contributions(explication, nombre=6):
+    """Variables les plus influentes (libellé, contribution), par valeur absolue décroissante"""
+    if not explication:
+        return []
+    tri = sorted(explication['contributions'].items(), key=lambda item: abs(item[1]), reverse=True)
+    return [(LIBELLES_FEATURES.get(nom, nom), valeur) for nom, valeur in tri[:nombre]]
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
+            if request.path.startswith(('/api/', '/queue/')):
+                return jsonify({'erreur': 'non_authentifie', 'message': 'Connexion requise'}), 401
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
-def get_db_connection():
+def service_courant():
+    """Service de l'utilisateur connecté: toutes les files et compteurs y sont restreints"""
+    return session.get('service') or SERVICE_DEFAUT
+
+class Error(Exception):
+    """Remplacée par mysql.connector.Error au premier accès à la base (voir charger_mysql)"""
+
+def charger_mysql():
+    """Importer mysql.connector au premier accès à la base plutôt qu'au chargement du module"""
+    global Error
+    import mysql.connector
+    Error = mysql.connector.Error
+    return mysql.connector
+
+pools_bd = {}
+verrou_pool_bd = threading.Lock()
+executeur_requetes = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix='requetes')
+
+etat_replique = {'verifie_a': 0, 'retard': None, 'utilisable': False}
+verrou_etat_replique = threading.Lock()
+stats_routage = {'primaire': 0, 'replique': 0, 'replique_echecs': 0}
+
+def _connexion_pool(nom, config):
+    connecteur = charger_mysql()
+    from mysql.connector import pooling
+    from mysql.connector.errors import PoolError
+    
+    pool = pools_bd.get(nom)
+    if pool is None:
+        with verrou_pool_bd:
+            pool = pools_bd.get(nom)
+            if pool is None:
+                # Pas de reset de session au retour dans le pool: les instructions
+                # préparées de la connexion restent valides d'une requête à l'autre
+                pool = pooling.MySQLConnectionPool(pool_name=f'triage_{nom}', pool_size=DB_POOL_SIZE,
+                                                   pool_reset_session=False, **config)
+                pools_bd[nom] = pool
+    try:
+        connection = pool.get_connection()
+    except PoolError:
+        # Pool épuisé: connexion directe plutôt que de faire attendre la requête
+        return connecteur.connect(**config)
+    if connection.in_transaction:
+        # Transaction laissée ouverte par l'utilisateur précédent (lecture seule ou erreur)
+        connection.rollback()
+    return connection
+
+def mesurer_retard_replique():
+    """Retard de la réplique en secondes, None si la réplication est arrêtée"""
+    connection = _connexion_pool('replique', DB_REPLICA_CONFIG)
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+            ligne = cursor.fetchone()
+            return ligne and ligne.get('Seconds_Behind_Source')
+        except Error:
+            # Serveurs antérieurs à MySQL 8.0.22
+            cursor.execute("SHOW SLAVE STATUS")
+            ligne = cursor.fetchone()
+            return ligne and ligne.get('Seconds_Behind_Master')
+    finally:
+        connection.close()
+
+def replique_utilisable():
+    if not DB_REPLICA_CONFIG:
+        return False
+    if time.time() - etat_replique['verifie_a'] >= REPLICA_VERIF_SECONDES:
+        with verrou_etat_replique:
+            if time.time() - etat_replique['verifie_a'] >= REPLICA_VERIF_SECONDES:
+                etat_replique['verifie_a'] = time.time()
+                try:
+                    retard = mesurer_retard_replique()
+                except Error as e:
+                    print(f"⚠️ Réplique injoignable: {e}")
+                    retard = None
+                etat_replique['retard'] = retard
+                etat_replique['utilisable'] = retard is not None and retard <= REPLICA_RETARD_MAX
+    return etat_replique['utilisable']
+
+def marquer_ecriture():
+    """Les lectures de cet utilisateur restent sur le primaire le temps que la réplique rattrape"""
+    session['derniere_ecriture'] = time.time()
+
+def lecture_replique_autorisee():
+    if not replique_utilisable():
+        return False
+    if has_request_context():
+        if request.endpoint not in ROUTES_LECTURE:
+            return False
+        if time.time() - session.get('derniere_ecriture', 0) < REPLICA_RETARD_MAX + 1:
+            return False
+    return True
+
+def get_db_connection(lecture=False):
+    """Connexion au primaire, ou à la réplique pour une lecture quand c'est possible"""
+    if lecture and lecture_replique_autorisee():
+        try:
+            connection = _connexion_pool('replique', DB_REPLICA_CONFIG)
+            stats_routage['replique'] += 1
+            return connection
+        except Error as e:
+            print(f"⚠️ Réplique indisponible, lecture sur le primaire: {e}")
+            stats_routage['replique_echecs'] += 1
+            etat_replique['utilisable'] = False
+    try:
+        connection = _connexion_pool('primaire', DB_CONFIG)
+        stats_routage['primaire'] += 1
         return connection
     except Error as e:
         print(f"❌ Erreur connexion BD: {e}")
         return None
 
+def rapport_routage():
+    return dict(stats_routage,
+                replique_configuree=DB_REPLICA_CONFIG is not None,
+                replique_retard=etat_replique['retard'],
+                replique_utilisable=etat_replique['utilisable'])
+
+# Vérification des mots de passe hors du thread de la requête
+HACHAGE_WORKERS = int(os.environ.get('TRIAGE_HACHAGE_WORKERS', str(os.cpu_count() or 2)))
+HACHAGE_FILE_MAX = int(os.environ.get('TRIAGE_HACHAGE_FILE_MAX', '64'))
+HACHAGE_TIMEOUT = float(os.environ.get('TRIAGE_HACHAGE_TIMEOUT', '10'))
+# Paramètres de hachage visés: les anciens hash sont recalculés à la connexion
+METHODE_HACHAGE = os.environ.get('TRIAGE_METHODE_HACHAGE', 'pbkdf2:sha256:600000')
+# Écritures de derniere_connexion regroupées
+CONNEXIONS_FLUSH_SECONDES = float(os.environ.get('TRIAGE_CONNEXIONS_FLUSH', '5'))
+CONNEXIONS_LOT_MAX = 200
+# Fragments HTML rendus gardés en mémoire (file d'attente, statistiques...)
+FRAGMENTS_CACHE_MAX = 256
+
+# Requêtes fréquentes exécutées en instructions préparées côté serveur
+INDICE_TIMEOUT = f"/*+ MAX_EXECUTION_TIME({int(REQUETE_TIMEOUT * 1000)}) */"
+
+def triages_filtres(condition, params, archive=False):
+    """Clause FROM, clause WHERE et paramètres pour lire les triages filtrés par `condition`.
+    
+    Avec l'archive, la condition est répétée dans chaque branche de l'UNION ALL:
+    MySQL ne pousse le filtre extérieur dans une table dérivée à union qu'à partir
+    de la 8.0.29, sans quoi les deux tables seraient lues en entier.
+    """
+    if not archive:
+        return 'triages t', f'WHERE {condition}', list(params)
+    union = (f"(SELECT * FROM triages t WHERE {condition} "
+             f"UNION ALL SELECT * FROM triages_archive t WHERE {condition}) t")
+    return union, '', list(params) * 2
+
+# Les filtres optionnels valent NULL quand ils ne sont pas utilisés, ce qui
+# permet une seule instruction préparée pour toutes les combinaisons
+FILTRE_HISTORIQUE = """t.utilisateur_id = %s
+          AND (%s IS NULL OR t.niveau_triage = %s)
+          AND (%s IS NULL OR DATE(t.date_triage) >= %s)
+          AND (%s IS NULL OR DATE(t.date_triage) <= %s)"""
+
+REQUETES_PREPAREES = {
+    'login_utilisateur': """
+        SELECT id, username, email, password_hash, nom, prenom, role, service 
+        FROM utilisateurs 
+        WHERE email = %s AND actif = TRUE
+    """,
+    'patient_par_nom': """
+        SELECT id FROM patients WHERE nom = %s AND prenom = %s
+    """,
+    'file_attente': f"""
+        SELECT {INDICE_TIMEOUT}
+            t.id as triage_id,
+            t.niveau_triage, 
+            t.date_triage, 
+            t.score_urgence,
+            t.priorite,
+            p.id as patient_id,
+            p.nom, 
+            p.prenom,
+            p.sexe,
+            t.age,
+            u.nom as evaluateur_nom,
+            u.prenom as evaluateur_prenom,
+            u.role as evaluateur_role,
+            t.statut
+        FROM triages t
+        JOIN patients p ON t.patient_id = p.id
+        JOIN utilisateurs u ON t.utilisateur_id = u.id
+        WHERE t.service = %s AND t.statut = 'en_attente'
+        ORDER BY t.priorite ASC, t.score_urgence DESC, t.date_triage ASC
+        LIMIT 20
+    """,
+    # Version des données: identifiants et dates de modification maximaux (index seuls)
+    'filigrane': """
+        SELECT 
+            (SELECT MAX(id) FROM triages) as max_triage,
+            (SELECT UNIX_TIMESTAMP(MAX(date_modification)) FROM triages) as maj_triages,
+            (SELECT MAX(id) FROM patients) as max_patient,
+            (SELECT UNIX_TIMESTAMP(MAX(date_modification)) FROM patients) as maj_patients,
+            UNIX_TIMESTAMP(NOW()) as maintenant
+    """,
+    # Même version restreinte à un service: l'activité des autres services ne l'invalide pas
+    'filigrane_service': """
+        SELECT 
+            (SELECT UNIX_TIMESTAMP(MAX(date_modification)) FROM triages WHERE service = %s) as maj_triages,
+            (SELECT MAX(id) FROM patients) as max_patient,
+            (SELECT UNIX_TIMESTAMP(MAX(date_modification)) FROM patients) as maj_patients,
+            UNIX_TIMESTAMP(NOW()) as maintenant
+    """,
+    'historique_total': f"""
+        SELECT {INDICE_TIMEOUT} COUNT(*) as total
+        FROM triages t
+        JOIN patients p ON t.patient_id = p.id
+        WHERE {FILTRE_HISTORIQUE}
+    """,
+    'historique_page': f"""
+        SELECT {INDICE_TIMEOUT}
+            t.id,
+            t.niveau_triage,
+            t.date_triage,
+            t.score_urgence,
+            t.priorite,
+            t.statut,
+            t.date_prise_en_charge,
+            t.date_fin_prise_en_charge,
+            p.nom as patient_nom,
+            p.prenom as patient_prenom,
+            p.sexe as patient_sexe,
+            t.age,
+            t.blood_pressure,
+            t.cholesterol,
+            t.max_heart_rate,
+            mc.nom as medecin_charge_nom,
+            mc.prenom as medecin_charge_prenom,
+            mc.role as medecin_charge_role
+        FROM triages t
+        JOIN patients p ON t.patient_id = p.id
+        LEFT JOIN utilisateurs mc ON t.medecin_charge_id = mc.id
+        WHERE {FILTRE_HISTORIQUE}
+        ORDER BY t.date_triage DESC
+        LIMIT %s OFFSET %s
+    """
+}
+
+# Variantes incluant l'archive, utilisées seulement quand la période demandée l'exige;
+# leurs paramètres de filtre sont passés deux fois (une par branche de l'union)
+_source_archive, _, _ = triages_filtres(FILTRE_HISTORIQUE, (), archive=True)
+for _nom in ('historique_total', 'historique_page'):
+    REQUETES_PREPAREES[_nom + '_archive'] = (REQUETES_PREPAREES[_nom]
+        .replace(f'WHERE {FILTRE_HISTORIQUE}', '')
+        .replace('FROM triages t', f'FROM {_source_archive}'))
+
+stats_requetes = {nom: {'executions': 0, 'preparations': 0, 'erreurs': 0, 'temps_total_ms': 0.0}
+                  for nom in REQUETES_PREPAREES}
+verrou_stats_requetes = threading.Lock()
+
+def executer_preparee(connection, nom, params=(), mode='all'):
+    """Exécuter une requête du registre, préparée une seule fois par connexion du pool"""
+    # Les curseurs préparés sont attachés à la connexion physique, qui survit au pool
+    cnx = getattr(connection, '_cnx', connection)
+    curseurs = cnx.__dict__.setdefault('instructions_preparees', {})
+    
+    debut = time.perf_counter()
+    for tentative in range(2):
+        cursor = curseurs.get(nom)
+        nouvelle = cursor is None
+        if nouvelle:
+            cursor = cnx.cursor(prepared=True, dictionary=True)
+            curseurs[nom] = cursor
+        try:
+            cursor.execute(REQUETES_PREPAREES[nom], tuple(params))
+            lignes = cursor.fetchall()
+            break
+        except Error:
+            # Instruction invalidée (reconnexion, DDL...): on la prépare à nouveau
+            curseurs.pop(nom, None)
+            with verrou_stats_requetes:
+                stats_requetes[nom]['erreurs'] += 1
+            if tentative or nouvelle:
+                raise
+    
+    with verrou_stats_requetes:
+        stats = stats_requetes[nom]
+        stats['executions'] += 1
+        stats['preparations'] += nouvelle
+        stats['temps_total_ms'] += (time.perf_counter() - debut) * 1000
+    
+    if mode == 'one':
+        return lignes[0] if lignes else None
+    return lignes
+
+def rapport_requetes_preparees():
+    with verrou_stats_requetes:
+        return {
+            nom: dict(stats, temps_moyen_ms=round(stats['temps_total_ms'] / stats['executions'], 3)
+                      if stats['executions'] else None)
+            for nom, stats in stats_requetes.items()
+        }
+
+def _executer_requete_lecture(sql, params, mode, timeout, lecture):
+    connection = get_db_connection(lecture=lecture)
+    if not connection:
+        raise Error("Connexion impossible")
+    try:
+        if sql in REQUETES_PREPAREES:
+            return executer_preparee(connection, sql, params or (), mode)
+        cursor = connection.cursor(dictionary=True)
+        # Le serveur abandonne lui-même la requête au-delà du délai
+        sql = re.sub(r'^\s*SELECT', f'SELECT /*+ MAX_EXECUTION_TIME({int(timeout * 1000)}) */', sql, count=1)
+        cursor.execute(sql, params or ())
+        return cursor.fetchone() if mode == 'one' else cursor.fetchall()
+    finally:
+        connection.close()
+
+def executer_requetes_paralleles(requetes, timeout=REQUETE_TIMEOUT):
+    """Exécuter des requêtes de lecture indépendantes en parallèle, chacune sur sa connexion.
+    
+    `requetes` associe un nom à (sql, params, mode) avec mode 'one' ou 'all';
+    `sql` peut aussi être le nom d'une requête de REQUETES_PREPAREES.
+    Renvoie (resultats, erreurs): une requête en échec ou hors délai est absente
+    de `resultats` et son nom figure dans `erreurs`.
+    """
+    # Le routage dépend de la session: il est décidé dans le thread de la requête
+    lecture = lecture_replique_autorisee()
+    futures = {
+        executeur_requetes.submit(_executer_requete_lecture, sql, params, mode, timeout, lecture): nom
+        for nom, (sql, params, mode) in requetes.items()
+    }
+    terminees, hors_delai = wait(futures, timeout=timeout)
+    
+    resultats, erreurs = {}, {}
+    for future in terminees:
+        nom = futures[future]
+        try:
+            resultats[nom] = future.result()
+        except Exception as e:
+            erreurs[nom] = str(e)
+    for future in hors_delai:
+        future.cancel()
+        erreurs[futures[future]] = 'délai dépassé'
+    
+    if erreurs:
+        print(f"⚠️ Requêtes partielles: {erreurs}")
+    return resultats, erreurs
+
+executeur_hachage = ThreadPoolExecutor(max_workers=HACHAGE_WORKERS, thread_name_prefix='hachage')
+places_hachage = threading.BoundedSemaphore(HACHAGE_WORKERS + HACHAGE_FILE_MAX)
+stats_hachage = {'verifications': 0, 'rejets': 0, 'rehachages': 0, 'en_file': 0,
+                 'attente_totale_ms': 0.0, 'calcul_total_ms': 0.0}
+verrou_stats_hachage = threading.Lock()
+
+def _verifier_hash(password_hash, password, soumis_a):
+    debut = time.perf_counter()
+    try:
+        return check_password_hash(password_hash, password)
+    finally:
+        fin = time.perf_counter()
+        with verrou_stats_hachage:
+            stats_hachage['en_file'] -= 1
+            stats_hachage['verifications'] += 1
+            stats_hachage['attente_totale_ms'] += (debut - soumis_a) * 1000
+            stats_hachage['calcul_total_ms'] += (fin - debut) * 1000
+        places_hachage.release()
+
+def verifier_mot_de_passe(password_hash, password):
+    """Vérifier un mot de passe dans le pool de hachage borné.
+    
+    Renvoie None si la file est pleine ou si le délai est dépassé.
+    """
+    if not places_hachage.acquire(timeout=HACHAGE_TIMEOUT):
+        with verrou_stats_hachage:
+            stats_hachage['rejets'] += 1
+        return None
+    with verrou_stats_hachage:
+        stats_hachage['en_file'] += 1
+    future = executeur_hachage.submit(_verifier_hash, password_hash, password, time.perf_counter())
+    try:
+        return future.result(timeout=HACHAGE_TIMEOUT)
+    except Exception as e:
+        print(f"❌ Erreur vérification mot de passe: {e}")
+        return None
+
+def iterations_pbkdf2(methode):
+    """Itérations d'une méthode 'pbkdf2:<algo>:<itérations>', None pour une autre méthode"""
+    parties = methode.split(':')
+    if parties[0] != 'pbkdf2' or len(parties) < 3:
+        return None
+    try:
+        return int(parties[2])
+    except ValueError:
+        return None
+
+ITERATIONS_HACHAGE = iterations_pbkdf2(METHODE_HACHAGE)
+
+def hash_obsolete(password_hash):
+    """Vrai pour un hash pbkdf2 moins itéré que METHODE_HACHAGE (scrypt et autres méthodes gardés)"""
+    if ITERATIONS_HACHAGE is None:
+        return False
+    iterations = iterations_pbkdf2(password_hash.split('$', 1)[0])
+    return iterations is not None and iterations < ITERATIONS_HACHAGE
+
+def _rehacher(user_id, password):
+    nouveau_hash = generate_password_hash(password, method=METHODE_HACHAGE)
+    connection = get_db_connection()
+    if connection:
+        try:
+            cursor = connection.cursor()
+            cursor.execute("UPDATE utilisateurs SET password_hash = %s WHERE id = %s", (nouveau_hash, user_id))
+            connection.commit()
+            with verrou_stats_hachage:
+                stats_hachage['rehachages'] += 1
+        except Error as e:
+            print(f"❌ Erreur mise à jour du hash: {e}")
+        finally:
+            connection.close()
+
+def planifier_rehachage(user_id, password):
+    """Recalculer en arrière-plan un hash aux paramètres dépassés"""
+    executeur_hachage.submit(_rehacher, user_id, password)
+
+connexions_en_attente = {}
+verrou_connexions = threading.Lock()
+signal_connexions = threading.Event()
+
+def enregistrer_connexion(user_id):
+    """Mémoriser la date de connexion; l'écriture en base est faite par lots"""
+    with verrou_connexions:
+        connexions_en_attente[user_id] = datetime.now()
+        if len(connexions_en_attente) >= CONNEXIONS_LOT_MAX:
+            signal_connexions.set()
+
+def flush_connexions():
+    with verrou_connexions:
+        lot = dict(connexions_en_attente)
+        connexions_en_attente.clear()
+    if not lot:
+        return 0
+    
+    connection = get_db_connection()
+    if not connection:
+        with verrou_connexions:
+            for user_id, date in lot.items():
+                connexions_en_attente.setdefault(user_id, date)
+        return 0
+    try:
+        cas = " ".join(["WHEN %s THEN %s"] * len(lot))
+        params = [v for item in lot.items() for v in item] + list(lot)
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            UPDATE utilisateurs 
+            SET derniere_connexion = CASE id {cas} END
+            WHERE id IN ({", ".join(["%s"] * len(lot))})
+        """, params)
+        connection.commit()
+        return len(lot)
+    except Error as e:
+        print(f"❌ Erreur écriture des connexions: {e}")
+        return 0
+    finally:
+        connection.close()
+
+def _boucle_flush_connexions():
+    while True:
+        signal_connexions.wait(CONNEXIONS_FLUSH_SECONDES)
+        signal_connexions.clear()
+        flush_connexions()
+
+threading.Thread(target=_boucle_flush_connexions, daemon=True, name='flush-connexions').start()
+atexit.register(flush_connexions)
+
+def rapport_hachage():
+    with verrou_stats_hachage:
+        stats = dict(stats_hachage)
+    if stats['verifications']:
+        stats['attente_moyenne_ms'] = round(stats['attente_totale_ms'] / stats['verifications'], 1)
+        stats['calcul_moyen_ms'] = round(stats['calcul_total_ms'] / stats['verifications'], 1)
+    stats['connexions_en_attente'] = len(connexions_en_attente)
+    return stats
+
+cache_fragments = OrderedDict()
+verrou_cache_fragments = threading.Lock()
+
+etat_archivage_cache = {'lu_a': 0, 'etat': None}
+
+def etat_archivage():
+    """Limite et compteurs de l'archive (relus au plus toutes les minutes)"""
+    if not ARCHIVAGE_ACTIF:
+        return None
+    if time.time() - etat_archivage_cache['lu_a'] < ETAT_ARCHIVAGE_TTL:
+        return etat_archivage_cache['etat']
+    
+    connection = get_db_connection()
+    if not connection:
+        return etat_archivage_cache['etat']
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM archivage_etat WHERE id = 1")
+        etat_archivage_cache.update(etat=cursor.fetchone(), lu_a=time.time())
+    except Error as e:
+        print(f"❌ Erreur lecture état archivage: {e}")
+    finally:
+        connection.close()
+    return etat_archivage_cache['etat']
+
+def archive_requise(date_debut=''):
+    """Vrai si une période commençant à `date_debut` (vide: depuis toujours) touche l'archive"""
+    etat = etat_archivage()
+    if not etat or not etat['date_max_archivee']:
+        return False
+    if not date_debut:
+        return True
+    try:
+        return datetime.strptime(date_debut, '%Y-%m-%d').date() <= etat['date_max_archivee'].date()
+    except ValueError:
+        return True
+
+def archive_requise_pour(colonne, valeur, date_debut=''):
+    """Vrai si les triages d'un patient ou d'un utilisateur depuis `date_debut` touchent l'archive.
+    
+    La borne basse réelle est le plus ancien triage archivé de `colonne` = `valeur`,
+    lu sur index (idx_patient_date / idx_utilisateur_date) : l'union avec l'archive
+    n'est faite que s'il existe un triage archivé dans la période demandée.
+    """
+    if colonne not in ('patient_id', 'utilisateur_id'):
+        raise ValueError(f"Colonne non indexée: {colonne}")
+    if not archive_requise(date_debut):
+        return False
+    try:
+        borne = datetime.strptime(date_debut, '%Y-%m-%d') if date_debut else None
+    except ValueError:
+        borne = None
+    
+    connection = get_db_connection(lecture=True)
+    if not connection:
+        return True
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT 1 FROM triages_archive
+            WHERE {colonne} = %s AND (%s IS NULL OR date_triage >= %s)
+            LIMIT 1
+        """, (valeur, borne, borne))
+        return cursor.fetchone() is not None
+    except Error as e:
+        print(f"❌ Erreur lecture archive: {e}")
+        return True
+    finally:
+        connection.close()
+
+def calculer_filigrane(service=None):
+    """Version courante des données triages/patients, ou None si indisponible.
+    
+    Avec `service`, seuls les triages de ce service sont pris en compte.
+    `stable` est faux si la dernière modification date de moins de 2 secondes:
+    la précision de date_modification ne permet alors pas de garantir que la
+    version ne changera pas dans la même seconde.
+    """
+    connection = get_db_connection(lecture=True)
+    if not connection:
+        return None
+    try:
+        if service:
+            ligne = executer_preparee(connection, 'filigrane_service', (service,), 'one')
+        else:
+            ligne = executer_preparee(connection, 'filigrane', (), 'one')
+    except Error as e:
+        print(f"❌ Erreur filigrane: {e}")
+        return None
+    finally:
+        connection.close()
+    
+    derniere_maj = max(float(ligne['maj_triages'] or 0), float(ligne['maj_patients'] or 0))
+    return {
+        'version': (service, ligne.get('max_triage'), ligne['maj_triages'], ligne['max_patient'], ligne['maj_patients']),
+        'date': datetime.fromtimestamp(derniere_maj, timezone.utc) if derniere_maj else None,
+        'stable': float(ligne['maintenant']) - derniere_maj >= 2
+    }
+
+def etag_page(filigrane, *cles):
+    """ETag d'une page pour une version des données et des paramètres donnés"""
+    if not filigrane or not filigrane['stable']:
+        return None
+    return hashlib.sha1(repr((filigrane['version'],) + cles).encode()).hexdigest()
+
+def reponse_non_modifiee(etag, filigrane):
+    """Réponse 304 si le client possède déjà cette version de la page"""
+    if not etag:
+        return None
+    if request.if_none_match:
+        # Comparaison faible: l'ETag des réponses compressées est marqué W/
+        a_jour = request.if_none_match.contains_weak(etag)
+    else:
+        a_jour = bool(request.if_modified_since and filigrane['date']
+                      and filigrane['date'].replace(microsecond=0) <= request.if_modified_since)
+    if not a_jour:
+        return None
+    response = make_response('', 304)
+    return ajouter_entetes_validation(response, etag, filigrane)
+
+def ajouter_entetes_validation(response, etag, filigrane):
+    # Le navigateur garde la page mais doit la revalider à chaque rechargement
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if etag:
+        response.set_etag(etag)
+        if filigrane['date']:
+            response.last_modified = filigrane['date']
+    return response
+
+def fragment_en_cache(cle):
+    with verrou_cache_fragments:
+        html = cache_fragments.get(cle)
+        if html is not None:
+            cache_fragments.move_to_end(cle)
+        return html
+
+def mettre_fragment_en_cache(cle, html):
+    with verrou_cache_fragments:
+        cache_fragments[cle] = html
+        cache_fragments.move_to_end(cle)
+        while len(cache_fragments) > FRAGMENTS_CACHE_MAX:
+            cache_fragments.popitem(last=False)
+
 def generer_username(email, nom, prenom):
     """Génère un username unique basé sur l'email et le nom"""
     base_username = email.split('@')[0]
@@ -254,6 +1056,85 @@ def generer_username(email, nom, prenom):
     
     return base_username
 
+empreintes_statiques = {}
+
+@app.template_global()
+def url_statique(chemin):
+    """URL d'un fichier statique avec l'empreinte de son contenu (cache longue durée)"""
+    fichier = os.path.join(STATIC_DIR, chemin)
+    mtime = os.path.getmtime(fichier)
+    empreinte = empreintes_statiques.get(chemin)
+    if not empreinte or empreinte[0] != mtime:
+        with open(fichier, 'rb') as f:
+            empreinte = (mtime, hashlib.md5(f.read()).hexdigest()[:10])
+        empreintes_statiques[chemin] = empreinte
+    return url_for('static', filename=chemin, v=empreinte[1])
+
+def precompresser_statiques():
+    """Créer ou mettre à jour les versions .gz des CSS/JS statiques"""
+    nb = 0
+    for dossier, _, fichiers in os.walk(STATIC_DIR):
+        for nom in fichiers:
+            if not nom.endswith(('.css', '.js')):
+                continue
+            source = os.path.join(dossier, nom)
+            cible = source + '.gz'
+            if os.path.exists(cible) and os.path.getmtime(cible) >= os.path.getmtime(source):
+                continue
+            with open(source, 'rb') as f_in, gzip.open(cible, 'wb', compresslevel=9) as f_out:
+                f_out.write(f_in.read())
+            nb += 1
+    return nb
+
+def accepte_gzip():
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+@app.route('/static/<path:filename>', endpoint='static')
+def servir_statique(filename):
+    source = os.path.join(STATIC_DIR, filename)
+    if not os.path.isfile(source):
+        abort(404)
+    
+    compresse = source + '.gz'
+    if accepte_gzip() and os.path.isfile(compresse) and os.path.getmtime(compresse) >= os.path.getmtime(source):
+        response = send_from_directory(STATIC_DIR, filename + '.gz',
+                                       mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(STATIC_DIR, filename)
+    
+    response.vary.add('Accept-Encoding')
+    if request.args.get('v'):
+        # URL avec empreinte: le contenu ne change jamais pour cette URL
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    return response
+
+@app.after_request
+def compresser_reponse(response):
+    """Compression gzip à la volée des réponses HTML et JSON"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype not in TYPES_COMPRESSIBLES
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    if not accepte_gzip():
+        return response
+    
+    contenu = response.get_data()
+    if len(contenu) < GZIP_SEUIL:
+        return response
+    
+    response.set_data(gzip.compress(contenu, compresslevel=GZIP_NIVEAU))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, _ = response.get_etag()
+    if etag:
+        # Même représentation logique, octets différents
+        response.set_etag(etag, weak=True)
+    return response
+
 @app.template_filter('strftime')
 def datetime_filter(date, format='%d/%m/%Y à %H:%M'):
     if date:
@@ -276,6 +1157,7 @@ def inscription():
         confirm_password = request.form.get('confirm_password', '')
         role = request.form.get('role', '')
         numero_licence = request.form.get('numero_licence', '').strip()
+        service = request.form.get('service', '').strip() or SERVICE_DEFAUT
         
         if not all([nom, prenom, email, password, confirm_password, role]):
             flash('Veuillez remplir tous les champs obligatoires.', 'error')
@@ -290,7 +1172,7 @@ def inscription():
             return render_template('inscription.html')
         
         username = generer_username(email, nom, prenom)
-        password_hash = generate_password_hash(password)
+        password_hash = generate_password_hash(password, method=METHODE_HACHAGE)
         
         connection = get_db_connection()
         if connection:
@@ -307,8 +1189,8 @@ def inscription():
                 cursor.execute("""
                     INSERT INTO utilisateurs 
                     (username, email, password_hash, nom, prenom, role, service, numero_licence, actif) 
-                    VALUES (%s, %s, %s, %s, %s, %s, 'Urgences', %s, TRUE)
-                """, (username, email, password_hash, nom, prenom, role, numero_licence))
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, TRUE)
+                """, (username, email, password_hash, nom, prenom, role, service, numero_licence))
                 
                 connection.commit()
                 flash('Inscription réussie! Vous pouvez maintenant vous connecter.', 'success')
@@ -337,35 +1219,35 @@ def login():
         connection = get_db_connection()
         if connection:
             try:
-                cursor = connection.cursor(dictionary=True)
-                
-                cursor.execute("""
-                    SELECT id, username, email, password_hash, nom, prenom, role 
-                    FROM utilisateurs 
-                    WHERE email = %s AND actif = TRUE
-                """, (email,))
-                user = cursor.fetchone()
-                
-                if user and check_password_hash(user['password_hash'], password):
-                    session['user_id'] = user['id']
-                    session['username'] = user['username']
-                    session['email'] = user['email']
-                    session['nom'] = user['nom']
-                    session['prenom'] = user['prenom']
-                    session['role'] = user['role']
-                    
-                    cursor.execute("UPDATE utilisateurs SET derniere_connexion = NOW() WHERE id = %s", (user['id'],))
-                    connection.commit()
-                    
-                    flash('Connexion réussie!', 'success')
-                    return redirect(url_for('dashboard'))
-                else:
-                    flash('Email ou mot de passe incorrect.', 'error')
-                    
+                user = executer_preparee(connection, 'login_utilisateur', (email,), 'one')
             except Error as e:
                 flash(f'Erreur de base de données: {e}', 'error')
+                return render_template('login.html')
             finally:
+                # La connexion retourne au pool avant le calcul du hash
                 connection.close()
+            
+            valide = verifier_mot_de_passe(user['password_hash'], password) if user else False
+            
+            if valide is None:
+                flash('Serveur occupé, veuillez réessayer dans quelques instants.', 'error')
+            elif valide:
+                session['user_id'] = user['id']
+                session['username'] = user['username']
+                session['email'] = user['email']
+                session['nom'] = user['nom']
+                session['prenom'] = user['prenom']
+                session['role'] = user['role']
+                session['service'] = user['service'] or SERVICE_DEFAUT
+                
+                enregistrer_connexion(user['id'])
+                if hash_obsolete(user['password_hash']):
+                    planifier_rehachage(user['id'], password)
+                
+                flash('Connexion réussie!', 'success')
+                return redirect(url_for('dashboard'))
+            else:
+                flash('Email ou mot de passe incorrect.', 'error')
         else:
             flash('Erreur de connexion à la base de données.', 'error')
     
@@ -383,74 +1265,68 @@ def logout():
 def triage():
     return render_template('triage.html', user=session)
 
+def enregistrer_triage(connection, enregistrement, nom, prenom, niveau_triage, probabilites,
+                       explication, score_urgence, priorite):
+    """Insérer le triage (et le patient s'il est nouveau); renvoie l'id du triage sans valider.
+    
+    Le journal est écrit en dernier: l'appelant valide aussitôt (voir journaliser_evenement).
+    """
+    cursor = connection.cursor()
+    
+    patient = executer_preparee(connection, 'patient_par_nom', (nom, prenom), 'one')
+    
+    if not patient:
+        cursor.execute("""
+            INSERT INTO patients (nom, prenom, date_naissance, sexe, telephone)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (nom, prenom, '1990-01-01', 'M' if enregistrement.gender == 1 else 'F', ''))
+        patient_id = cursor.lastrowid
+    else:
+        patient_id = patient['id']
+    
+    cursor.execute("""
+        INSERT INTO triages (
+            patient_id, utilisateur_id, service, age, sexe_code, chest_pain_type,
+            blood_pressure, cholesterol, max_heart_rate, exercise_angina,
+            plasma_glucose, skin_thickness, insulin, bmi, diabetes_pedigree,
+            hypertension, heart_disease, residence_type, smoking_status,
+            niveau_triage, score_urgence, probabilites, contributions, priorite, statut
+        ) VALUES (
+            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+        )
+    """, (patient_id, session['user_id'], service_courant()) + enregistrement.valeurs_sql() + (
+        niveau_triage, score_urgence, json.dumps(probabilites),
+        json.dumps(explication) if explication else None, priorite, 'en_attente'
+    ))
+    triage_id = cursor.lastrowid
+    journaliser_evenement(connection, triage_id, 'creation', service_courant(), session['user_id'])
+    return triage_id
+
 @app.route('/predire', methods=['POST'])
 @login_required
 def predire():
     try:
-        patient_data = {}
         nom = request.form.get('nom', 'Patient')
         prenom = request.form.get('prenom', 'Anonyme')
         
-        required_fields = [
-            'age', 'gender', 'chest_pain_type', 'blood_pressure', 'cholesterol',
-            'max_heart_rate', 'exercise_angina', 'plasma_glucose', 'skin_thickness',
-            'insulin', 'bmi', 'diabetes_pedigree', 'hypertension', 'heart_disease',
-            'Residence_type', 'smoking_status'
-        ]
-        
-        for field in required_fields:
-            value = request.form.get(field)
-            if value is None or value == '':
-                flash(f'Le champ {field} est requis', 'error')
-                return redirect(url_for('triage'))
-            patient_data[field] = value
+        try:
+            enregistrement = valider(request.form)
+        except ErreurValidation as e:
+            for erreur in e.erreurs:
+                flash(f"Le champ {erreur['champ']} est invalide: {erreur['message']}", 'error')
+            return redirect(url_for('triage'))
         
-        niveau_triage, probabilites, score_urgence, priorite = predire_triage_patient(patient_data)
+        niveau_triage, probabilites, score_urgence, priorite = predire_triage_patient(enregistrement)
+        explication = expliquer_predictions([enregistrement.vecteur()], [niveau_triage])[0]
         
         triage_id = None
         connection = get_db_connection()
         if connection:
             try:
-                cursor = connection.cursor()
-                
-                cursor.execute("""
-                    SELECT id FROM patients WHERE nom = %s AND prenom = %s
-                """, (nom, prenom))
-                patient = cursor.fetchone()
-                
-                if not patient:
-                    cursor.execute("""
-                        INSERT INTO patients (nom, prenom, date_naissance, sexe, telephone)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (nom, prenom, '1990-01-01', 'M' if patient_data['gender'] == '1' else 'F', ''))
-                    patient_id = cursor.lastrowid
-                else:
-                    patient_id = patient[0]
-                
-                cursor.execute("""
-                    INSERT INTO triages (
-                        patient_id, utilisateur_id, age, sexe_code, chest_pain_type,
-                        blood_pressure, cholesterol, max_heart_rate, exercise_angina,
-                        plasma_glucose, skin_thickness, insulin, bmi, diabetes_pedigree,
-                        hypertension, heart_disease, residence_type, smoking_status,
-                        niveau_triage, score_urgence, probabilites, priorite, statut
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    )
-                """, (
-                    patient_id, session['user_id'], int(patient_data['age']), int(patient_data['gender']),
-                    int(patient_data['chest_pain_type']), int(patient_data['blood_pressure']),
-                    int(patient_data['cholesterol']), int(patient_data['max_heart_rate']),
-                    int(patient_data['exercise_angina']), float(patient_data['plasma_glucose']),
-                    float(patient_data['skin_thickness']), float(patient_data['insulin']),
-                    float(patient_data['bmi']), float(patient_data['diabetes_pedigree']),
-                    int(patient_data['hypertension']), int(patient_data['heart_disease']),
-                    patient_data['Residence_type'], patient_data['smoking_status'],
-                    niveau_triage, score_urgence, json.dumps(probabilites), priorite, 'en_attente'
-                ))
-                
-                triage_id = cursor.lastrowid
+                triage_id = enregistrer_triage(connection, enregistrement, nom, prenom, niveau_triage,
+                                               probabilites, explication, score_urgence, priorite)
                 connection.commit()
+                marquer_ecriture()
                 
             except Error as e:
                 print(f"❌ Erreur sauvegarde BD: {e}")
@@ -463,11 +1339,15 @@ def predire():
             'niveau_triage': niveau_triage,
             'score_urgence': score_urgence,
             'probabilites': probabilites,
+            'explication': {
+                'unite': explication['unite'],
+                'principales': principales_contributions(explication)
+            } if explication else None,
             'patient_info': {
-                'age': patient_data['age'],
-                'genre': 'Homme' if patient_data['gender'] == '1' else 'Femme',
-                'tension': patient_data['blood_pressure'],
-                'cholesterol': patient_data['cholesterol']
+                'age': enregistrement.age,
+                'genre': 'Homme' if enregistrement.gender == 1 else 'Femme',
+                'tension': enregistrement.blood_pressure,
+                'cholesterol': enregistrement.cholesterol
             },
             'triage_id': triage_id,
             'date_triage': datetime.now()
@@ -480,6 +1360,55 @@ def predire():
         flash(f'Erreur lors de la prédiction: {str(e)}', 'error')
         return redirect(url_for('triage'))
 
+@app.route('/api/triages', methods=['POST'])
+@login_required
+def api_creer_triage():
+    """Triage d'un patient envoyé en JSON par un appareil ou un dossier patient informatisé"""
+    donnees = request.get_json(silent=True)
+    if not isinstance(donnees, dict):
+        return jsonify({'erreur': 'corps_invalide', 'message': 'Objet JSON attendu'}), 400
+    
+    erreurs = [
+        {'champ': cle, 'code': 'type', 'message': "texte de 100 caractères au plus attendu"}
+        for cle in ('nom', 'prenom')
+        if cle in donnees and not (isinstance(donnees[cle], str) and 0 < len(donnees[cle].strip()) <= 100)
+    ]
+    try:
+        enregistrement = valider(donnees)
+    except ErreurValidation as e:
+        erreurs += e.erreurs
+    if erreurs:
+        return jsonify({'erreur': 'validation', 'details': erreurs}), 400
+    
+    nom = donnees.get('nom', 'Patient').strip()
+    prenom = donnees.get('prenom', 'Anonyme').strip()
+    niveau_triage, probabilites, score_urgence, priorite = predire_triage_patient(enregistrement)
+    explication = expliquer_predictions([enregistrement.vecteur()], [niveau_triage])[0]
+    
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({'erreur': 'base_indisponible', 'message': 'Connexion à la base de données impossible'}), 503
+    try:
+        triage_id = enregistrer_triage(connection, enregistrement, nom, prenom, niveau_triage,
+                                       probabilites, explication, score_urgence, priorite)
+        connection.commit()
+        marquer_ecriture()
+    except Error as e:
+        print(f"❌ Erreur sauvegarde BD: {e}")
+        return jsonify({'erreur': 'base_indisponible', 'message': 'Enregistrement impossible'}), 503
+    finally:
+        connection.close()
+    
+    return jsonify({
+        'triage_id': triage_id,
+        'niveau_triage': niveau_triage,
+        'score_urgence': score_urgence,
+        'priorite': priorite,
+        'probabilites': probabilites,
+        'explication': explication,
+        'donnees': enregistrement.en_dict()
+    }), 201
+
 @app.route('/resultats')
 @login_required
 def resultats():
@@ -518,205 +1447,189 @@ def resultats():
                          triage=triage_data, 
                          info=info)
 
+# Requêtes du dashboard: (sql, portée des paramètres, mode), la portée étant
+# le service courant ('service') ou l'utilisateur connecté ('utilisateur')
+REQUETES_DASHBOARD = {
+    'total_triages': ("SELECT COUNT(*) as total FROM triages WHERE service = %s", 'service', 'one'),
+    'total_archives': ("SELECT * FROM archivage_service WHERE service = %s", 'service', 'one'),
+    # Avec l'archive, les patients déjà comptés dans archivage_service.nb_patients sont exclus
+    'total_patients': (f"""
+        SELECT COUNT(DISTINCT t.patient_id) as total FROM triages t
+        WHERE t.service = %s
+        {'''AND NOT EXISTS (
+            SELECT 1 FROM archivage_patients a WHERE a.service = t.service AND a.patient_id = t.patient_id
+        )''' if ARCHIVAGE_ACTIF else ""}
+    """, 'service', 'one'),
+    'distribution': ("""
+        SELECT niveau_triage, COUNT(*) as count 
+        FROM triages 
+        WHERE service = %s
+        GROUP BY niveau_triage
+        ORDER BY 
+            CASE niveau_triage 
+                WHEN 'red' THEN 1 
+                WHEN 'orange' THEN 2 
+                WHEN 'yellow' THEN 3 
+                WHEN 'green' THEN 4 
+            END
+    """, 'service', 'all'),
+    'patients_attente': ('file_attente', 'service', 'all'),
+    'recent_triages': ("""
+        SELECT 
+            t.niveau_triage, 
+            t.date_triage, 
+            t.score_urgence,
+            p.nom, 
+            p.prenom, 
+            u.nom as evaluateur_nom,
+            u.prenom as evaluateur_prenom,
+            u.role as evaluateur_role,
+            t.statut
+        FROM triages t
+        JOIN patients p ON t.patient_id = p.id
+        JOIN utilisateurs u ON t.utilisateur_id = u.id
+        WHERE t.utilisateur_id = %s AND t.statut != 'en_attente'
+        ORDER BY t.date_triage DESC
+        LIMIT 10
+    """, 'utilisateur', 'all')
+}
+
+# Fragment -> (requêtes nécessaires, propre à l'utilisateur)
+FRAGMENTS_DASHBOARD = {
+    'stats': (('total_triages', 'total_archives', 'total_patients', 'distribution', 'patients_attente'), False),
+    'file_attente': (('patients_attente',), False),
+    'distribution': (('distribution', 'total_triages', 'total_archives'), False),
+    'activite': (('recent_triages',), True)
+}
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    connection = get_db_connection()
-    stats = {}
-    patients_attente = []
+    service = service_courant()
+    filigrane = calculer_filigrane(service)
+    etag = etag_page(filigrane, 'dashboard', session['user_id'], session.get('nom'), session.get('prenom'))
+    non_modifiee = reponse_non_modifiee(etag, filigrane)
+    if non_modifiee:
+        return non_modifiee
     
-    if connection:
-        try:
-            cursor = connection.cursor(dictionary=True)
-            
-            cursor.execute("SELECT COUNT(*) as total FROM triages")
-            result = cursor.fetchone()
-            stats['total_triages'] = result['total'] if result else 0
-            
-            cursor.execute("SELECT COUNT(*) as total FROM patients")
-            result = cursor.fetchone()
-            stats['total_patients'] = result['total'] if result else 0
-            
-            cursor.execute("""
-                SELECT niveau_triage, COUNT(*) as count 
-                FROM triages 
-                GROUP BY niveau_triage
-                ORDER BY 
-                    CASE niveau_triage 
-                        WHEN 'red' THEN 1 
-                        WHEN 'orange' THEN 2 
-                        WHEN 'yellow' THEN 3 
-                        WHEN 'green' THEN 4 
-                    END
-            """)
-            stats['distribution'] = cursor.fetchall()
-            
-            cursor.execute("""
-                SELECT 
-                    t.id as triage_id,
-                    t.niveau_triage, 
-                    t.date_triage, 
-                    t.score_urgence,
-                    t.priorite,
-                    p.nom, 
-                    p.prenom,
-                    p.sexe,
-                    t.age,
-                    u.nom as evaluateur_nom,
-                    u.prenom as evaluateur_prenom,
-                    u.role as evaluateur_role,
-                    t.statut
-                FROM triages t
-                JOIN patients p ON t.patient_id = p.id
-                JOIN utilisateurs u ON t.utilisateur_id = u.id
-                WHERE t.statut = 'en_attente'
-                ORDER BY t.priorite ASC, t.score_urgence DESC, t.date_triage ASC
-                LIMIT 20
-            """)
-            patients_attente = cursor.fetchall()
-            
-            cursor.execute("""
-                SELECT 
-                    t.niveau_triage, 
-                    t.date_triage, 
-                    t.score_urgence,
-                    p.nom, 
-                    p.prenom, 
-                    u.nom as evaluateur_nom,
-                    u.prenom as evaluateur_prenom,
-                    u.role as evaluateur_role,
-                    t.statut
-                FROM triages t
-                JOIN patients p ON t.patient_id = p.id
-                JOIN utilisateurs u ON t.utilisateur_id = u.id
-                WHERE t.utilisateur_id = %s AND t.statut != 'en_attente'
-                ORDER BY t.date_triage DESC
-                LIMIT 10
-            """, (session['user_id'],))
-            stats['recent_triages'] = cursor.fetchall()
-            
-        except Error as e:
-            print(f"❌ Erreur dashboard: {e}")
-            stats = {
-                'total_triages': 0,
-                'total_patients': 0,
-                'distribution': [],
-                'recent_triages': []
-            }
-        finally:
-            connection.close()
+    # Seuls les fragments absents du cache déclenchent leurs requêtes; les
+    # fragments communs sont partagés par les utilisateurs d'un même service
+    fragments, cles_manquantes = {}, {}
+    for nom, (requetes, par_utilisateur) in FRAGMENTS_DASHBOARD.items():
+        cle = (nom, filigrane['version'], session['user_id'] if par_utilisateur else service) if etag else None
+        html = fragment_en_cache(cle) if cle else None
+        if html is None:
+            cles_manquantes[nom] = cle
+        else:
+            fragments[nom] = Markup(html)
     
-    return render_template('dashboard.html', 
-                         user=session, 
-                         stats=stats, 
-                         patients_attente=patients_attente)
+    requetes = {r for nom in cles_manquantes for r in FRAGMENTS_DASHBOARD[nom][0]}
+    if not ARCHIVAGE_ACTIF:
+        requetes.discard('total_archives')
+    params = {'service': (service,), 'utilisateur': (session['user_id'],)}
+    resultats, erreurs = executer_requetes_paralleles({
+        nom: (sql, params[portee], mode)
+        for nom, (sql, portee, mode) in REQUETES_DASHBOARD.items() if nom in requetes
+    }) if requetes else ({}, {})
+    
+    # Les triages archivés restent comptés dans les totaux du service
+    archives = resultats.get('total_archives') or {}
+    distribution = [
+        dict(niveau, count=niveau['count'] + archives.get(f"nb_{niveau['niveau_triage']}", 0))
+        for niveau in resultats.get('distribution', [])
+    ]
+    
+    # Résultats partiels: une requête en échec n'empêche pas l'affichage des autres
+    contexte = {
+        'stats': {
+            'total_triages': (resultats.get('total_triages') or {}).get('total', 0) + archives.get('nb_triages', 0),
+            'total_patients': (resultats.get('total_patients') or {}).get('total', 0) + archives.get('nb_patients', 0),
+            'distribution': distribution,
+            'recent_triages': resultats.get('recent_triages', [])
+        },
+        'patients_attente': resultats.get('patients_attente', [])
+    }
+    for nom, cle in cles_manquantes.items():
+        html = render_template(f'dashboard_{nom}.html', user=session, service=service, **contexte)
+        # Un fragment rendu à partir d'une requête en échec n'est pas mis en cache
+        if cle and not erreurs.keys() & set(FRAGMENTS_DASHBOARD[nom][0]):
+            mettre_fragment_en_cache(cle, html)
+        fragments[nom] = Markup(html)
+    
+    response = make_response(render_template('dashboard.html', 
+                                             user=session, 
+                                             service=service,
+                                             fragments=fragments))
+    return ajouter_entetes_validation(response, etag if not erreurs else None, filigrane)
 
 @app.route('/historique')
 @login_required
 def historique():
-    connection = get_db_connection()
-    historique_data = []
-    stats_personnelles = {}
-    
     page = request.args.get('page', 1, type=int)
     per_page = 20
     niveau_filtre = request.args.get('niveau', '')
     date_debut = request.args.get('date_debut', '')
     date_fin = request.args.get('date_fin', '')
     
-    if connection:
-        try:
-            cursor = connection.cursor(dictionary=True)
-            
-            where_conditions = ["t.utilisateur_id = %s"]
-            params = [session['user_id']]
-            
-            if niveau_filtre:
-                where_conditions.append("t.niveau_triage = %s")
-                params.append(niveau_filtre)
-            
-            if date_debut:
-                where_conditions.append("DATE(t.date_triage) >= %s")
-                params.append(date_debut)
-                
-            if date_fin:
-                where_conditions.append("DATE(t.date_triage) <= %s")
-                params.append(date_fin)
-            
-            where_clause = " AND ".join(where_conditions)
-            
-            cursor.execute(f"""
-                SELECT COUNT(*) as total
-                FROM triages t
-                JOIN patients p ON t.patient_id = p.id
-                WHERE {where_clause}
-            """, params)
-            
-            total = cursor.fetchone()['total']
-            
-            offset = (page - 1) * per_page
-            cursor.execute(f"""
-                SELECT 
-                    t.id,
-                    t.niveau_triage,
-                    t.date_triage,
-                    t.score_urgence,
-                    t.priorite,
-                    t.statut,
-                    t.date_prise_en_charge,
-                    t.date_fin_prise_en_charge,
-                    p.nom as patient_nom,
-                    p.prenom as patient_prenom,
-                    p.sexe as patient_sexe,
-                    t.age,
-                    t.blood_pressure,
-                    t.cholesterol,
-                    t.max_heart_rate,
-                    mc.nom as medecin_charge_nom,
-                    mc.prenom as medecin_charge_prenom,
-                    mc.role as medecin_charge_role
-                FROM triages t
-                JOIN patients p ON t.patient_id = p.id
-                LEFT JOIN utilisateurs mc ON t.medecin_charge_id = mc.id
-                WHERE {where_clause}
-                ORDER BY t.date_triage DESC
-                LIMIT %s OFFSET %s
-            """, params + [per_page, offset])
-            
-            historique_data = cursor.fetchall()
-            
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_mes_triages,
-                    COUNT(CASE WHEN niveau_triage = 'red' THEN 1 END) as mes_critiques,
-                    COUNT(CASE WHEN niveau_triage = 'orange' THEN 1 END) as mes_urgents,
-                    COUNT(CASE WHEN niveau_triage = 'yellow' THEN 1 END) as mes_moderes,
-                    COUNT(CASE WHEN niveau_triage = 'green' THEN 1 END) as mes_stables,
-                    AVG(score_urgence) as score_moyen,
-                    MIN(date_triage) as premier_triage,
-                    MAX(date_triage) as dernier_triage
-                FROM triages
-                WHERE utilisateur_id = %s
-            """, (session['user_id'],))
-            
-            stats_personnelles = cursor.fetchone()
-            
-        except Error as e:
-            print(f"❌ Erreur historique: {e}")
-            total = 0
-        finally:
-            connection.close()
+    filigrane = calculer_filigrane()
+    cles_page = ('historique', session['user_id'], session.get('nom'), session.get('prenom'),
+                 page, niveau_filtre, date_debut, date_fin)
+    etag = etag_page(filigrane, *cles_page)
+    non_modifiee = reponse_non_modifiee(etag, filigrane)
+    if non_modifiee:
+        return non_modifiee
+    
+    cle_cache = (filigrane['version'],) + cles_page if etag else None
+    html = fragment_en_cache(cle_cache) if cle_cache else None
+    if html is not None:
+        return ajouter_entetes_validation(make_response(html), etag, filigrane)
     
-    total_pages = (total + per_page - 1) // per_page if 'total' in locals() else 1
+    # Filtres absents passés à NULL (voir REQUETES_PREPAREES)
+    filtres_sql = []
+    for valeur in (niveau_filtre, date_debut, date_fin):
+        filtres_sql += [valeur or None, valeur or None]
+    params = [session['user_id']] + filtres_sql
+    offset = (page - 1) * per_page
     
-    return render_template('historique.html', 
+    suffixe = '_archive' if archive_requise_pour('utilisateur_id', session['user_id'], date_debut) else ''
+    if suffixe:
+        params = params * 2
+    # Sans filtre de date, la page et les statistiques couvrent la même période
+    archive_stats = suffixe if not date_debut else archive_requise_pour('utilisateur_id', session['user_id'])
+    source_stats, filtre_stats, params_stats = triages_filtres(
+        't.utilisateur_id = %s', (session['user_id'],), bool(archive_stats))
+    
+    resultats, erreurs = executer_requetes_paralleles({
+        'total': ('historique_total' + suffixe, params, 'one'),
+        'historique': ('historique_page' + suffixe, params + [per_page, offset], 'all'),
+        'stats': (f"""
+            SELECT 
+                COUNT(*) as total_mes_triages,
+                COUNT(CASE WHEN niveau_triage = 'red' THEN 1 END) as mes_critiques,
+                COUNT(CASE WHEN niveau_triage = 'orange' THEN 1 END) as mes_urgents,
+                COUNT(CASE WHEN niveau_triage = 'yellow' THEN 1 END) as mes_moderes,
+                COUNT(CASE WHEN niveau_triage = 'green' THEN 1 END) as mes_stables,
+                AVG(score_urgence) as score_moyen,
+                MIN(date_triage) as premier_triage,
+                MAX(date_triage) as dernier_triage
+            FROM {source_stats}
+            {filtre_stats}
+        """, params_stats, 'one')
+    })
+    
+    historique_data = resultats.get('historique', [])
+    stats_personnelles = resultats.get('stats') or {}
+    total = (resultats.get('total') or {}).get('total', 0)
+    total_pages = (total + per_page - 1) // per_page if total else 1
+    
+    html = render_template('historique.html', 
                          user=session,
                          historique=historique_data,
                          stats=stats_personnelles,
                          pagination={
                              'page': page,
                              'per_page': per_page,
-                             'total': total if 'total' in locals() else 0,
+                             'total': total,
                              'total_pages': total_pages
                          },
                          filtres={
@@ -724,6 +1637,130 @@ def historique():
                              'date_debut': date_debut,
                              'date_fin': date_fin
                          })
+    if cle_cache and not erreurs:
+        mettre_fragment_en_cache(cle_cache, html)
+    
+    return ajouter_entetes_validation(make_response(html), etag if not erreurs else None, filigrane)
+
+# Transitions de statut autorisées; 'termine' est définitif
+TRANSITIONS_STATUT = {
+    'en_attente': {'en_cours', 'termine'},
+    'en_cours': {'en_attente', 'termine'},
+    'termine': set()
+}
+# Statuts d'origine acceptés pour chaque statut visé
+STATUTS_ORIGINE = {
+    statut: tuple(origine for origine, cibles in TRANSITIONS_STATUT.items() if statut in cibles)
+    for statut in TRANSITIONS_STATUT
+}
+# Colonnes mises à jour avec chaque statut visé (%s: utilisateur)
+MISES_A_JOUR_STATUT = {
+    'en_cours': "medecin_charge_id = %s, date_prise_en_charge = NOW()",
+    'termine': "date_fin_prise_en_charge = NOW()",
+    # Patient remis en file: il n'est plus pris en charge
+    'en_attente': "medecin_charge_id = NULL, date_prise_en_charge = NULL"
+}
+
+class TransitionInvalide(Exception):
+    pass
+
+def journaliser_evenement(connection, triage_id, type_evenement, service, utilisateur_id):
+    """Ajouter au journal des changements l'état courant du triage, dans la transaction en cours.
+    
+    Le numéro vient du compteur du service, dont la ligne reste verrouillée
+    jusqu'au commit: les numéros sont attribués dans l'ordre des commits, et
+    un client qui a lu jusqu'à `since` ne peut pas manquer un événement validé
+    plus tard avec un numéro inférieur. Ce verrou sérialise les écritures du
+    service: l'appel doit être la dernière instruction avant le commit, pour
+    qu'il ne soit tenu que le temps de celui-ci.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        INSERT INTO evenements_sequence (service, valeur) VALUES (%s, LAST_INSERT_ID(1))
+        ON DUPLICATE KEY UPDATE valeur = LAST_INSERT_ID(valeur + 1)
+    """, (service,))
+    cursor.execute("""
+        INSERT INTO triages_evenements (
+            service, seq, triage_id, type_evenement, statut, niveau_triage,
+            priorite, score_urgence, utilisateur_id
+        )
+        SELECT service, LAST_INSERT_ID(), id, %s, statut, niveau_triage, priorite, score_urgence, %s
+        FROM triages WHERE id = %s
+    """, (type_evenement, utilisateur_id, triage_id))
+
+def changer_statut(connection, triage_id, nouveau_statut, utilisateur_id, service=None):
+    """Appliquer une transition de statut en une seule écriture conditionnelle.
+    
+    La condition sur le statut courant rend l'opération sûre sans verrou
+    préalable; la transaction n'est pas validée ici, mais doit l'être aussitôt
+    après (voir journaliser_evenement).
+    """
+    if nouveau_statut not in TRANSITIONS_STATUT:
+        raise TransitionInvalide(f"Statut inconnu: {nouveau_statut}")
+    
+    mise_a_jour = MISES_A_JOUR_STATUT[nouveau_statut]
+    origines = STATUTS_ORIGINE[nouveau_statut]
+    params = ((utilisateur_id,) if '%s' in mise_a_jour else ()) + (nouveau_statut, triage_id) + origines
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        UPDATE triages 
+        SET {mise_a_jour}, statut = %s
+        WHERE id = %s AND statut IN ({", ".join(["%s"] * len(origines))})
+        {"AND service = %s" if service else ""}
+    """, params + ((service,) if service else ()))
+    if cursor.rowcount:
+        if not service:
+            cursor.execute("SELECT service FROM triages WHERE id = %s", (triage_id,))
+            service = cursor.fetchone()[0]
+        journaliser_evenement(connection, triage_id, 'statut', service, utilisateur_id)
+        return
+    
+    # Échec: on relit le statut seulement pour expliquer le refus
+    cursor.execute("SELECT statut, service FROM triages WHERE id = %s", (triage_id,))
+    ligne = cursor.fetchone()
+    if not ligne or (service and ligne[1] != service):
+        raise TransitionInvalide("Ce patient n'existe pas dans votre service.")
+    raise TransitionInvalide(f"Transition impossible: {ligne[0]} → {nouveau_statut}")
+
+def prendre_patient_suivant(connection, service, utilisateur_id):
+    """Réserver atomiquement le triage en attente le plus prioritaire du service.
+    
+    SKIP LOCKED ignore les lignes déjà verrouillées par un autre praticien:
+    des prises en charge simultanées obtiennent chacune un patient différent,
+    sans nouvel essai; elles n'attendent que le commit d'une autre écriture du
+    service, le temps du compteur du journal. Renvoie None si la file est vide.
+    """
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT t.id
+        FROM triages t
+        WHERE t.service = %s AND t.statut = 'en_attente'
+        ORDER BY t.priorite ASC, t.score_urgence DESC, t.date_triage ASC
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    """, (service,))
+    ligne = cursor.fetchone()
+    if not ligne:
+        connection.rollback()
+        return None
+    
+    cursor.execute("""
+        UPDATE triages 
+        SET statut = 'en_cours', medecin_charge_id = %s, date_prise_en_charge = NOW()
+        WHERE id = %s
+    """, (utilisateur_id, ligne['id']))
+    cursor.execute("""
+        SELECT t.id as triage_id, t.niveau_triage, t.score_urgence, t.priorite, t.date_triage,
+               p.id as patient_id, p.nom, p.prenom
+        FROM triages t
+        JOIN patients p ON t.patient_id = p.id
+        WHERE t.id = %s
+    """, (ligne['id'],))
+    triage = cursor.fetchone()
+    # Dernière instruction avant le commit (voir journaliser_evenement)
+    journaliser_evenement(connection, ligne['id'], 'statut', service, utilisateur_id)
+    connection.commit()
+    return triage
 
 @app.route('/prendre_en_charge/<int:triage_id>')
 @login_required
@@ -731,57 +1768,144 @@ def prendre_en_charge(triage_id):
     connection = get_db_connection()
     if connection:
         try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                UPDATE triages 
-                SET statut = 'en_cours', 
-                    medecin_charge_id = %s,
-                    date_prise_en_charge = NOW()
-                WHERE id = %s AND statut = 'en_attente'
-            """, (session['user_id'], triage_id))
-            
-            if cursor.rowcount > 0:
-                connection.commit()
-                flash('Patient pris en charge avec succès!', 'success')
+            changer_statut(connection, triage_id, 'en_cours', session['user_id'], service_courant())
+            connection.commit()
+            marquer_ecriture()
+            flash('Patient pris en charge avec succès!', 'success')
+        except TransitionInvalide:
+            connection.rollback()
+            flash('Erreur: Ce patient n\'est plus disponible.', 'error')
+        except Error as e:
+            connection.rollback()
+            flash(f'Erreur: {e}', 'error')
+        finally:
+            connection.close()
+    
+    return redirect(url_for('dashboard'))
+
+@app.route('/prendre_en_charge/suivant', methods=['POST'])
+@login_required
+def prendre_en_charge_suivant():
+    connection = get_db_connection()
+    if connection:
+        try:
+            triage = prendre_patient_suivant(connection, service_courant(), session['user_id'])
+            if triage:
+                marquer_ecriture()
+                flash(f"Patient pris en charge: {triage['nom']} {triage['prenom']}", 'success')
             else:
-                flash('Erreur: Ce patient n\'est plus disponible.', 'error')
-                
+                flash('Aucun patient en attente.', 'info')
         except Error as e:
+            connection.rollback()
             flash(f'Erreur: {e}', 'error')
         finally:
             connection.close()
     
     return redirect(url_for('dashboard'))
 
+@app.route('/api/file/suivant', methods=['POST'])
+@login_required
+def api_file_suivant():
+    """Prise en charge du patient suivant pour les terminaux (JSON)"""
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({'erreur': 'Connexion à la base de données impossible'}), 503
+    try:
+        triage = prendre_patient_suivant(connection, service_courant(), session['user_id'])
+    except Error as e:
+        connection.rollback()
+        print(f"❌ Erreur prise en charge: {e}")
+        return jsonify({'erreur': 'Prise en charge impossible'}), 503
+    finally:
+        connection.close()
+    
+    if not triage:
+        return jsonify({'triage': None}), 404
+    marquer_ecriture()
+    triage['date_triage'] = triage['date_triage'].isoformat() if triage['date_triage'] else None
+    return jsonify({'triage': triage})
+
+CHANGEMENTS_LIMITE_MAX = 1000
+
+@app.route('/queue/changes')
+@login_required
+def changements_file():
+    """Événements de la file du service postérieurs à `since`, dans l'ordre des numéros.
+    
+    since=0 renvoie le journal compacté, soit le dernier état de chaque triage
+    encore suivi. Si la compaction a purgé des événements postérieurs à
+    `since`, la réponse est 410 et le client repart de since=0.
+    """
+    try:
+        depuis = int(request.args.get('since', 0))
+        limite = min(int(request.args.get('limite', 500)), CHANGEMENTS_LIMITE_MAX)
+    except ValueError:
+        return jsonify({'erreur': 'Paramètre since ou limite invalide'}), 400
+    if depuis < 0 or limite < 1:
+        return jsonify({'erreur': 'Paramètre since ou limite invalide'}), 400
+    
+    service = service_courant()
+    connection = get_db_connection(lecture=True)
+    if not connection:
+        return jsonify({'erreur': 'Connexion à la base de données impossible'}), 503
+    try:
+        # Les deux lectures partagent l'instantané de la transaction
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT valeur, seq_purge FROM evenements_sequence WHERE service = %s", (service,))
+        sequence = cursor.fetchone() or {'valeur': 0, 'seq_purge': 0}
+        if 0 < depuis < sequence['seq_purge']:
+            return jsonify({
+                'erreur': 'resynchronisation',
+                'message': 'Événements compactés depuis ce numéro, reprendre avec since=0',
+                'seq_purge': sequence['seq_purge']
+            }), 410
+        
+        cursor.execute("""
+            SELECT e.seq, e.triage_id, e.type_evenement, e.statut, e.niveau_triage, e.priorite,
+                   e.score_urgence, e.utilisateur_id, e.date_evenement,
+                   t.patient_id, p.nom, p.prenom, t.date_triage
+            FROM triages_evenements e
+            LEFT JOIN triages t ON t.id = e.triage_id
+            LEFT JOIN patients p ON p.id = t.patient_id
+            WHERE e.service = %s AND e.seq > %s
+            ORDER BY e.seq
+            LIMIT %s
+        """, (service, depuis, limite + 1))
+        evenements = cursor.fetchall()
+    except Error as e:
+        print(f"❌ Erreur journal des changements: {e}")
+        return jsonify({'erreur': 'Journal des changements indisponible'}), 503
+    finally:
+        connection.close()
+    
+    plus = len(evenements) > limite
+    evenements = [ligne_json(ligne) for ligne in evenements[:limite]]
+    return jsonify({
+        'service': service,
+        'evenements': evenements,
+        'seq': evenements[-1]['seq'] if evenements else depuis,
+        'plus': plus
+    })
+
 @app.route('/modifier_statut_patient/<int:triage_id>/<string:nouveau_statut>')
 @login_required  
 def modifier_statut_patient(triage_id, nouveau_statut):
-    if nouveau_statut not in ['en_attente', 'en_cours', 'termine']:
+    if nouveau_statut not in TRANSITIONS_STATUT:
         flash('Statut invalide', 'error')
         return redirect(url_for('dashboard'))
     
     connection = get_db_connection()
     if connection:
         try:
-            cursor = connection.cursor()
-            
-            if nouveau_statut == 'termine':
-                cursor.execute("""
-                    UPDATE triages 
-                    SET statut = %s, date_fin_prise_en_charge = NOW()
-                    WHERE id = %s
-                """, (nouveau_statut, triage_id))
-            else:
-                cursor.execute("""
-                    UPDATE triages 
-                    SET statut = %s
-                    WHERE id = %s
-                """, (nouveau_statut, triage_id))
-            
+            changer_statut(connection, triage_id, nouveau_statut, session['user_id'], service_courant())
             connection.commit()
+            marquer_ecriture()
             flash(f'Statut mis à jour: {nouveau_statut}', 'success')
-            
+        except TransitionInvalide as e:
+            connection.rollback()
+            flash(f'Erreur: {e}', 'error')
         except Error as e:
+            connection.rollback()
             flash(f'Erreur: {e}', 'error')
         finally:
             connection.close()
@@ -796,7 +1920,7 @@ def rechercher_patient():
     if len(query) < 2:
         return jsonify([])
     
-    connection = get_db_connection()
+    connection = get_db_connection(lecture=True)
     results = []
     
     if connection:
@@ -808,12 +1932,12 @@ def rechercher_patient():
                     COUNT(t.id) as nb_triages,
                     MAX(t.date_triage) as dernier_triage
                 FROM patients p
-                LEFT JOIN triages t ON p.id = t.patient_id
+                JOIN triages t ON p.id = t.patient_id AND t.service = %s
                 WHERE p.nom LIKE %s OR p.prenom LIKE %s
                 GROUP BY p.id
                 ORDER BY dernier_triage DESC
                 LIMIT 10
-            """, (f'%{query}%', f'%{query}%'))
+            """, (service_courant(), f'%{query}%', f'%{query}%'))
             
             results = cursor.fetchall()
             
@@ -828,54 +1952,289 @@ def rechercher_patient():
     
     return jsonify(results)
 
+# Colonnes de la chronologie d'un patient pouvant être demandées (?champs=...)
+CHAMPS_TIMELINE = {
+    'id': 't.id',
+    'date_triage': 't.date_triage',
+    'niveau_triage': 't.niveau_triage',
+    'score_urgence': 't.score_urgence',
+    'priorite': 't.priorite',
+    'statut': 't.statut',
+    'service': 't.service',
+    'age': 't.age',
+    'blood_pressure': 't.blood_pressure',
+    'cholesterol': 't.cholesterol',
+    'max_heart_rate': 't.max_heart_rate',
+    'plasma_glucose': 't.plasma_glucose',
+    'bmi': 't.bmi',
+    'date_prise_en_charge': 't.date_prise_en_charge',
+    'date_fin_prise_en_charge': 't.date_fin_prise_en_charge',
+    'probabilites': 't.probabilites',
+    'contributions': 't.contributions',
+    'evaluateur': "CONCAT(u.prenom, ' ', u.nom)",
+    'medecin_charge': "CONCAT(mc.prenom, ' ', mc.nom)"
+}
+# Jointures ajoutées seulement si leur colonne est demandée
+JOINTURES_TIMELINE = {
+    'evaluateur': "JOIN utilisateurs u ON t.utilisateur_id = u.id",
+    'medecin_charge': "LEFT JOIN utilisateurs mc ON t.medecin_charge_id = mc.id"
+}
+CHAMPS_TIMELINE_DEFAUT = ('niveau_triage', 'score_urgence', 'statut', 'service', 'evaluateur')
+TIMELINE_LIMITE_MAX = 100
+
+MESURES_TENDANCES = ('blood_pressure', 'max_heart_rate', 'plasma_glucose', 'cholesterol', 'bmi')
+TENDANCES_POINTS_MAX = 500
+
+def encoder_curseur(date_triage, triage_id):
+    return base64.urlsafe_b64encode(f"{date_triage.isoformat()}|{triage_id}".encode()).decode()
+
+def decoder_curseur(curseur):
+    """(date_triage, id) d'un curseur de pagination; ValueError s'il est invalide"""
+    try:
+        date_iso, triage_id = base64.urlsafe_b64decode(curseur.encode()).decode().split('|')
+        return datetime.fromisoformat(date_iso), int(triage_id)
+    except (UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+
+def ligne_json(ligne):
+    """Dates en ISO 8601 et colonnes JSON décodées"""
+    for cle, valeur in ligne.items():
+        if isinstance(valeur, datetime):
+            ligne[cle] = valeur.isoformat()
+        elif cle in ('probabilites', 'contributions') and isinstance(valeur, (str, bytes)):
+            ligne[cle] = json.loads(valeur)
+    return ligne
+
 @app.route('/patient/<int:patient_id>')
 @login_required
 def detail_patient(patient_id):
-    connection = get_db_connection()
-    patient_info = None
-    historique_patient = []
+    # Résumé seulement: la chronologie et les tendances sont chargées à la demande
+    source, filtre, params = triages_filtres(
+        't.patient_id = %s', (patient_id,), archive_requise_pour('patient_id', patient_id))
+    resultats, erreurs = executer_requetes_paralleles({
+        'patient': ("""
+            SELECT * FROM patients WHERE id = %s
+        """, (patient_id,), 'one'),
+        'resume': (f"""
+            SELECT 
+                COUNT(*) as nb_triages,
+                MIN(date_triage) as premier_triage,
+                MAX(date_triage) as dernier_triage,
+                COUNT(CASE WHEN niveau_triage = 'red' THEN 1 END) as nb_critiques,
+                COUNT(CASE WHEN niveau_triage = 'orange' THEN 1 END) as nb_urgents,
+                COUNT(CASE WHEN niveau_triage = 'yellow' THEN 1 END) as nb_moderes,
+                COUNT(CASE WHEN niveau_triage = 'green' THEN 1 END) as nb_stables
+            FROM {source}
+            {filtre}
+        """, params, 'one')
+    })
     
-    if connection:
-        try:
-            cursor = connection.cursor(dictionary=True)
-            
-            cursor.execute("""
-                SELECT * FROM patients WHERE id = %s
-            """, (patient_id,))
-            patient_info = cursor.fetchone()
-            
-            if not patient_info:
-                flash('Patient non trouvé', 'error')
-                return redirect(url_for('dashboard'))
-            
-            cursor.execute("""
-                SELECT 
-                    t.*,
-                    u.nom as evaluateur_nom,
-                    u.prenom as evaluateur_prenom,
-                    u.role as evaluateur_role,
-                    mc.nom as medecin_charge_nom,
-                    mc.prenom as medecin_charge_prenom,
-                    mc.role as medecin_charge_role
-                FROM triages t
-                JOIN utilisateurs u ON t.utilisateur_id = u.id
-                LEFT JOIN utilisateurs mc ON t.medecin_charge_id = mc.id
-                WHERE t.patient_id = %s
-                ORDER BY t.date_triage DESC
-            """, (patient_id,))
-            
-            historique_patient = cursor.fetchall()
-            
-        except Error as e:
-            flash(f'Erreur: {e}', 'error')
-            return redirect(url_for('dashboard'))
-        finally:
-            connection.close()
+    if 'patient' in erreurs:
+        flash(f"Erreur: {erreurs['patient']}", 'error')
+        return redirect(url_for('dashboard'))
+    
+    patient_info = resultats['patient']
+    if not patient_info:
+        flash('Patient non trouvé', 'error')
+        return redirect(url_for('dashboard'))
     
     return render_template('detail_patient.html',
                          user=session,
                          patient=patient_info,
-                         historique=historique_patient)
+                         resume=resultats.get('resume') or {},
+                         mesures=MESURES_TENDANCES)
+
+@app.route('/api/patients/<int:patient_id>/timeline')
+@login_required
+def api_timeline_patient(patient_id):
+    """Triages d'un patient, du plus récent au plus ancien, par pages (curseur sur date_triage, id)"""
+    demandes = request.args.get('champs')
+    champs = [c for c in demandes.split(',') if c] if demandes else list(CHAMPS_TIMELINE_DEFAUT)
+    inconnus = [c for c in champs if c not in CHAMPS_TIMELINE]
+    if inconnus:
+        return jsonify({'erreur': 'champs_invalides', 'details': inconnus,
+                        'champs_disponibles': sorted(CHAMPS_TIMELINE)}), 400
+    # La pagination a toujours besoin de la date et de l'identifiant
+    champs = ['id', 'date_triage'] + [c for c in champs if c not in ('id', 'date_triage')]
+    
+    limite = max(1, min(request.args.get('limite', 20, type=int), TIMELINE_LIMITE_MAX))
+    condition, params = 't.patient_id = %s', [patient_id]
+    if request.args.get('curseur'):
+        try:
+            date_curseur, id_curseur = decoder_curseur(request.args['curseur'])
+        except ValueError:
+            return jsonify({'erreur': 'curseur_invalide'}), 400
+        condition += " AND (t.date_triage < %s OR (t.date_triage = %s AND t.id < %s))"
+        params += [date_curseur, date_curseur, id_curseur]
+    
+    source, filtre, params = triages_filtres(condition, params, archive_requise_pour('patient_id', patient_id))
+    colonnes = ",\n                ".join(f"{CHAMPS_TIMELINE[c]} as {c}" for c in champs)
+    jointures = "\n            ".join(JOINTURES_TIMELINE[c] for c in champs if c in JOINTURES_TIMELINE)
+    
+    connection = get_db_connection(lecture=True)
+    if not connection:
+        return jsonify({'erreur': 'base_indisponible'}), 503
+    try:
+        cursor = connection.cursor(dictionary=True)
+        # Une ligne de plus que la page pour savoir s'il en reste
+        cursor.execute(f"""
+            SELECT {INDICE_TIMEOUT}
+                {colonnes}
+            FROM {source}
+            {jointures}
+            {filtre}
+            ORDER BY t.date_triage DESC, t.id DESC
+            LIMIT %s
+        """, params + [limite + 1])
+        lignes = cursor.fetchall()
+    except Error as e:
+        print(f"❌ Erreur chronologie patient: {e}")
+        return jsonify({'erreur': 'base_indisponible'}), 503
+    finally:
+        connection.close()
+    
+    suite = len(lignes) > limite
+    lignes = lignes[:limite]
+    return jsonify({
+        'triages': [ligne_json(ligne) for ligne in lignes],
+        'curseur_suivant': encoder_curseur(lignes[-1]['date_triage'], lignes[-1]['id']) if suite else None
+    })
+
+@app.route('/api/patients/<int:patient_id>/tendances')
+@login_required
+def api_tendances_patient(patient_id):
+    """Évolution des constantes réduite côté serveur à au plus `points` intervalles de temps"""
+    demandees = request.args.get('mesures')
+    mesures = [m for m in demandees.split(',') if m] if demandees else list(MESURES_TENDANCES[:3])
+    if not mesures or any(m not in MESURES_TENDANCES for m in mesures):
+        return jsonify({'erreur': 'mesures_invalides', 'mesures_disponibles': MESURES_TENDANCES}), 400
+    points = max(2, min(request.args.get('points', 100, type=int), TENDANCES_POINTS_MAX))
+    
+    source, filtre, params = triages_filtres(
+        't.patient_id = %s', (patient_id,), archive_requise_pour('patient_id', patient_id))
+    connection = get_db_connection(lecture=True)
+    if not connection:
+        return jsonify({'erreur': 'base_indisponible'}), 503
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(f"""
+            SELECT {INDICE_TIMEOUT}
+                UNIX_TIMESTAMP(MIN(date_triage)) as debut,
+                UNIX_TIMESTAMP(MAX(date_triage)) as fin
+            FROM {source}
+            {filtre}
+        """, params)
+        bornes = cursor.fetchone()
+        if bornes['debut'] is None:
+            return jsonify({'mesures': mesures, 'points': 0, 'dates': [], 'series': {}})
+        
+        debut = float(bornes['debut'])
+        largeur = max((float(bornes['fin']) - debut) / points, 1.0)
+        # Moyenne, minimum et maximum par intervalle: les pics restent visibles
+        agregats = ",\n                ".join(
+            f"AVG({m}) as {m}_moy, MIN({m}) as {m}_min, MAX({m}) as {m}_max" for m in mesures
+        )
+        cursor.execute(f"""
+            SELECT {INDICE_TIMEOUT}
+                LEAST(FLOOR((UNIX_TIMESTAMP(date_triage) - %s) / %s), %s) as intervalle,
+                AVG(UNIX_TIMESTAMP(date_triage)) as instant,
+                COUNT(*) as nb,
+                {agregats}
+            FROM {source}
+            {filtre}
+            GROUP BY intervalle
+            ORDER BY intervalle
+        """, [debut, largeur, points - 1] + params)
+        lignes = cursor.fetchall()
+    except Error as e:
+        print(f"❌ Erreur tendances patient: {e}")
+        return jsonify({'erreur': 'base_indisponible'}), 503
+    finally:
+        connection.close()
+    
+    return jsonify({
+        'mesures': mesures,
+        'points': len(lignes),
+        'dates': [datetime.fromtimestamp(float(l['instant'])).isoformat(timespec='seconds') for l in lignes],
+        'nb': [l['nb'] for l in lignes],
+        'series': {
+            m: {stat: [round(float(l[f"{m}_{stat}"]), 1) for l in lignes] for stat in ('moy', 'min', 'max')}
+            for m in mesures
+        }
+    })
+
+@app.route('/api/derive')
+@login_required
+def api_derive():
+    """Dérive des données reçues par ce processus par rapport à la référence du modèle"""
+    if moniteur_derive is None:
+        return jsonify({'actif': False, 'message': 'Aucune référence de dérive pour le modèle chargé'})
+    return jsonify(dict(actif=True, **moniteur_derive.scores()))
+
+@app.route('/api/analytique/attentes')
+@login_required
+def api_analytique_attentes():
+    """Percentiles des temps d'attente et de traitement, lus dans les agrégats horaires"""
+    from analytique import rapport_attentes, GROUPES
+    
+    groupe = request.args.get('groupe', 'niveau')
+    if groupe not in GROUPES:
+        return jsonify({'erreur': f"Groupe invalide, attendu: {', '.join(GROUPES)}"}), 400
+    
+    try:
+        debut = datetime.strptime(request.args['debut'], '%Y-%m-%d') if request.args.get('debut') \
+            else datetime.now() - timedelta(days=7)
+        fin = datetime.strptime(request.args['fin'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('fin') \
+            else datetime.now() + timedelta(hours=1)
+    except ValueError:
+        return jsonify({'erreur': 'Dates attendues au format AAAA-MM-JJ'}), 400
+    
+    try:
+        resultats = rapport_attentes(get_db_connection, debut, fin, groupe, service_courant())
+    except (Error, RuntimeError) as e:
+        print(f"❌ Erreur analytique: {e}")
+        return jsonify({'erreur': 'Analyse indisponible'}), 503
+    
+    return jsonify({
+        'service': service_courant(),
+        'groupe': groupe,
+        'debut': debut.isoformat(),
+        'fin': fin.isoformat(),
+        'unite': 'secondes',
+        'resultats': resultats
+    })
+
+def demarrer_rafraichissement_analytique():
+    """Mettre à jour les agrégats d'analyse en arrière-plan, hors des requêtes"""
+    if ANALYTIQUE_INTERVALLE <= 0:
+        return
+    from analytique import mettre_a_jour_rollups
+    
+    def boucle():
+        while True:
+            try:
+                mettre_a_jour_rollups(get_db_connection)
+            except (Error, RuntimeError) as e:
+                print(f"⚠️ Mise à jour des agrégats d'analyse: {e}")
+            time.sleep(ANALYTIQUE_INTERVALLE)
+    
+    threading.Thread(target=boucle, daemon=True, name='analytique').start()
+
+def prechauffer():
+    """Charger d'avance le modèle et les bibliothèques lourdes, avant la première requête.
+    
+    Importer app ne charge ni numpy, ni scikit-learn, ni mysql.connector: les
+    commandes de maintenance et les processus qui ne servent que des pages
+    statiques ne paient que ce qu'ils utilisent.
+    """
+    debut = time.perf_counter()
+    charger_mysql()
+    model_loaded = load_ai_model()
+    if model_loaded and hasattr(model, 'predict_proba'):
+        # Premier appel de scikit-learn (validation des entrées, caches internes)
+        predire_triage_lot([[0.0] * len(FEATURES_MODELE)])
+    print(f"🔥 Préchauffage terminé en {(time.perf_counter() - debut) * 1000:.0f} ms")
+    return model_loaded
 
 @app.route('/create_test_user')
 def create_test_user():
@@ -886,15 +2245,15 @@ def create_test_user():
             
             medecin_email = "medecin@hopital.ma"
             medecin_password = "123456"
-            medecin_hash = generate_password_hash(medecin_password)
+            medecin_hash = generate_password_hash(medecin_password, method=METHODE_HACHAGE)
             
             infirmier_email = "infirmier@hopital.ma"
             infirmier_password = "123456"
-            infirmier_hash = generate_password_hash(infirmier_password)
+            infirmier_hash = generate_password_hash(infirmier_password, method=METHODE_HACHAGE)
             
             test_email = "test@hopital.ma"
             test_password = "123456"
-            test_hash = generate_password_hash(test_password)
+            test_hash = generate_password_hash(test_password, method=METHODE_HACHAGE)
             
             utilisateurs_test = [
                 ("dr_medecin", medecin_email, medecin_hash, "Alami", "Dr Ahmed", "medecin", "Urgences"),
@@ -971,6 +2330,15 @@ def system_check():
     except Exception as e:
         checks['ai_model'] = {'status': '❌ ERREUR', 'message': str(e)}
     
+    if pool_inference is not None:
+        sante = pool_inference.sante()
+        statut = '✅ OK' if sante['workers_actifs'] == sante['workers'] else '⚠️ WARNING'
+        checks['inference_pool'] = dict(sante, status=statut)
+    
+    checks['requetes_preparees'] = rapport_requetes_preparees()
+    checks['hachage'] = rapport_hachage()
+    checks['routage_bd'] = rapport_routage()
+    
     try:
         templates_required = ['login.html', 'dashboard.html', 'triage.html', 'historique.html']
         missing_templates = []
@@ -999,7 +2367,7 @@ def export_historique_pdf():
         from reportlab.lib import colors
         from reportlab.lib.units import cm
         
-        connection = get_db_connection()
+        connection = get_db_connection(lecture=True)
         if not connection:
             flash('Erreur de connexion', 'error')
             return redirect(url_for('historique'))
@@ -1109,7 +2477,11 @@ if __name__ == '__main__':
     print("=" * 60)
     
     print("🤖 Chargement du modèle IA...")
-    model_loaded = load_ai_model()
+    model_loaded = prechauffer()
+    demarrer_pool_inference()
+    demarrer_rafraichissement_analytique()
+    
+    print(f"🗜️ Fichiers statiques précompressés: {precompresser_statiques()}")
     
     print("\n📋 INFORMATIONS DE CONNEXION:")
     print("=" * 40)
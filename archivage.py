@@ -0,0 +1,283 @@
+"""
+Archivage des triages terminés et maintenance des partitions de `triages`.
+
+Les cas terminés plus anciens que la rétention sont déplacés par lots, chacun
+dans sa propre transaction, vers `triages_archive` (mode table) ou vers des
+fichiers Parquet compressés (mode parquet, export froid hors de la base).
+La table chaude et ses index ne contiennent ainsi que l'activité récente.
+Le journal des changements de la file (`triages_evenements`) est compacté
+au passage : seul le dernier état de chaque triage y est conservé.
+
+Usage :
+    python archivage.py --retention-jours 365
+    python archivage.py --mode parquet --dossier archives/
+    python archivage.py --boucle 24          # toutes les 24 heures
+    python archivage.py --retention-evenements 72
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from mysql.connector import Error
+
+from app import get_db_connection
+
+NIVEAUX = ('red', 'orange', 'yellow', 'green')
+
+
+def _ids_a_archiver(cursor, limite_date, taille_lot):
+    cursor.execute("""
+        SELECT id FROM triages
+        WHERE statut = 'termine' AND date_triage < %s
+        ORDER BY date_triage, id
+        LIMIT %s
+    """, (limite_date, taille_lot))
+    return [ligne[0] for ligne in cursor.fetchall()]
+
+
+def _mettre_a_jour_etat(cursor, marqueurs, ids, en_table=True):
+    """Reporter dans archivage_etat et archivage_service la limite et les compteurs du lot archivé.
+
+    La limite date_max_archivee décide de la lecture de `triages_archive` :
+    elle n'avance que pour un lot copié dans cette table, pas pour un export Parquet.
+    nb_patients ne compte que les patients dont c'est le premier triage archivé
+    dans le service (ensemble tenu dans archivage_patients).
+    """
+    date_max = ("GREATEST(COALESCE(e.date_max_archivee, lot.date_max), lot.date_max)"
+                if en_table else "e.date_max_archivee")
+    cursor.execute(f"""
+        UPDATE archivage_etat e
+        JOIN (
+            SELECT
+                MAX(date_triage) as date_max,
+                COUNT(*) as nb,
+                {", ".join(f"SUM(niveau_triage = '{n}') as nb_{n}" for n in NIVEAUX)}
+            FROM triages WHERE id IN ({marqueurs})
+        ) lot
+        SET e.date_max_archivee = {date_max},
+            e.nb_triages = e.nb_triages + lot.nb,
+            {", ".join(f"e.nb_{n} = e.nb_{n} + lot.nb_{n}" for n in NIVEAUX)},
+            e.date_execution = NOW()
+        WHERE e.id = 1
+    """, ids)
+    cursor.execute(f"""
+        INSERT INTO archivage_service (service, nb_patients, nb_triages, {", ".join(f"nb_{n}" for n in NIVEAUX)})
+        SELECT t.service,
+               COUNT(DISTINCT CASE WHEN a.patient_id IS NULL THEN t.patient_id END),
+               COUNT(*), {", ".join(f"SUM(t.niveau_triage = '{n}')" for n in NIVEAUX)}
+        FROM triages t
+        LEFT JOIN archivage_patients a ON a.service = t.service AND a.patient_id = t.patient_id
+        WHERE t.id IN ({marqueurs})
+        GROUP BY t.service
+        ON DUPLICATE KEY UPDATE
+            nb_patients = nb_patients + VALUES(nb_patients),
+            nb_triages = nb_triages + VALUES(nb_triages),
+            {", ".join(f"nb_{n} = nb_{n} + VALUES(nb_{n})" for n in NIVEAUX)}
+    """, ids)
+    cursor.execute(f"""
+        INSERT IGNORE INTO archivage_patients (service, patient_id)
+        SELECT DISTINCT service, patient_id FROM triages WHERE id IN ({marqueurs})
+    """, ids)
+
+
+def _exporter_parquet(connection, marqueurs, ids, dossier, numero_lot):
+    import pandas as pd
+
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute(f"SELECT * FROM triages WHERE id IN ({marqueurs})", ids)
+    df = pd.DataFrame(cursor.fetchall())
+    os.makedirs(dossier, exist_ok=True)
+    mois = df['date_triage'].min().strftime('%Y%m')
+    chemin = os.path.join(dossier, f"triages_{mois}_{datetime.now():%Y%m%d%H%M%S}_{numero_lot}.parquet")
+    df.to_parquet(chemin, compression='zstd', index=False)
+    return chemin
+
+
+def archiver(retention_jours=365, taille_lot=5000, mode='table', dossier='archives'):
+    """Déplacer les triages terminés anciens hors de la table chaude"""
+    limite_date = datetime.now() - timedelta(days=retention_jours)
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError("Connexion à la base de données impossible")
+
+    total = 0
+    debut = time.time()
+    try:
+        cursor = connection.cursor()
+        numero_lot = 0
+        while True:
+            ids = _ids_a_archiver(cursor, limite_date, taille_lot)
+            if not ids:
+                break
+            marqueurs = ", ".join(["%s"] * len(ids))
+            try:
+                if mode == 'parquet':
+                    # Le fichier est écrit avant la suppression: un échec ne perd rien
+                    chemin = _exporter_parquet(connection, marqueurs, ids, dossier, numero_lot)
+                    print(f"  ✓ {len(ids)} triages exportés vers {chemin}")
+                else:
+                    cursor.execute(f"INSERT INTO triages_archive SELECT * FROM triages WHERE id IN ({marqueurs})", ids)
+                _mettre_a_jour_etat(cursor, marqueurs, ids, en_table=mode != 'parquet')
+                cursor.execute(f"DELETE FROM triages WHERE id IN ({marqueurs})", ids)
+                connection.commit()
+            except Error:
+                connection.rollback()
+                raise
+            total += len(ids)
+            numero_lot += 1
+    finally:
+        connection.close()
+
+    print(f"✅ {total} triages archivés ({mode}) en {time.time() - debut:.1f}s")
+    return total
+
+
+def _evenements_a_compacter(cursor, limite_date, taille_lot, terminaux):
+    """Événements anciens remplacés par un plus récent du même triage, ou derniers d'un triage terminé"""
+    cursor.execute(f"""
+        SELECT e.service, e.seq FROM triages_evenements e
+        WHERE e.date_evenement < %s {"AND e.statut = 'termine'" if terminaux else ""}
+          AND {"NOT" if terminaux else ""} EXISTS (
+              SELECT 1 FROM triages_evenements s
+              WHERE s.triage_id = e.triage_id AND s.service = e.service AND s.seq > e.seq
+          )
+        LIMIT %s
+    """, (limite_date, taille_lot))
+    return cursor.fetchall()
+
+
+def compacter_evenements(retention_heures=72, taille_lot=5000):
+    """Compacter le journal des changements de la file.
+
+    Au-delà de la rétention, seul le dernier événement de chaque triage est
+    gardé, et celui d'un triage terminé est supprimé. Le compteur du service
+    retient le plus grand numéro ainsi purgé: un client resté en deçà doit
+    repartir de since=0.
+    """
+    limite_date = datetime.now() - timedelta(hours=retention_heures)
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError("Connexion à la base de données impossible")
+
+    total = 0
+    try:
+        cursor = connection.cursor()
+        for terminaux in (False, True):
+            while True:
+                lot = _evenements_a_compacter(cursor, limite_date, taille_lot, terminaux)
+                if not lot:
+                    break
+                try:
+                    if terminaux:
+                        purges = {}
+                        for service, seq in lot:
+                            purges[service] = max(seq, purges.get(service, 0))
+                        cursor.executemany(
+                            "UPDATE evenements_sequence SET seq_purge = GREATEST(seq_purge, %s) WHERE service = %s",
+                            [(seq, service) for service, seq in purges.items()]
+                        )
+                    cursor.execute(
+                        f"DELETE FROM triages_evenements WHERE (service, seq) IN ({', '.join(['(%s, %s)'] * len(lot))})",
+                        [valeur for ligne in lot for valeur in ligne]
+                    )
+                    connection.commit()
+                except Error:
+                    connection.rollback()
+                    raise
+                total += len(lot)
+    finally:
+        connection.close()
+
+    print(f"✅ {total} événements du journal compactés")
+    return total
+
+
+def _debut_mois(date, decalage=0):
+    mois = date.month - 1 + decalage
+    return date.replace(year=date.year + mois // 12, month=mois % 12 + 1, day=1,
+                        hour=0, minute=0, second=0, microsecond=0)
+
+
+def maintenir_partitions(mois_avance=3):
+    """Créer les partitions mensuelles manquantes et à venir, et supprimer les anciennes vides.
+
+    Les partitions sont créées sans trou, un mois par partition, à partir de la
+    dernière borne existante : les triages d'un mois non couvert (arrêt du
+    job, import historique) ne restent pas dans une seule partition pmax.
+    """
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError("Connexion à la base de données impossible")
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'triages' AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """)
+        lignes = cursor.fetchall()
+        partitions = [nom for nom, _ in lignes]
+        if not partitions:
+            print("⚠️ La table triages n'est pas partitionnée (voir database_partitionnement.sql)")
+            return
+
+        maintenant = datetime.now()
+        bornes = [borne for nom, borne in lignes if nom != 'pmax']
+        if bornes:
+            # Borne UNIX_TIMESTAMP convertie dans le fuseau de la session, comme à la création
+            cursor.execute("SELECT FROM_UNIXTIME(%s)", (int(bornes[-1]),))
+            mois = _debut_mois(cursor.fetchone()[0])
+        else:
+            mois = _debut_mois(maintenant)
+
+        dernier = _debut_mois(maintenant, mois_avance)
+        nouvelles = []
+        while mois <= dernier:
+            suivant = _debut_mois(mois, 1)
+            if f"p{mois:%Y%m}" not in partitions:
+                nouvelles.append(
+                    f"PARTITION p{mois:%Y%m} VALUES LESS THAN (UNIX_TIMESTAMP('{suivant:%Y-%m-%d %H:%M:%S}'))"
+                )
+            mois = suivant
+        if nouvelles:
+            cursor.execute(f"""
+                ALTER TABLE triages REORGANIZE PARTITION pmax INTO (
+                    {", ".join(nouvelles)},
+                    PARTITION pmax VALUES LESS THAN MAXVALUE
+                )
+            """)
+            print(f"  ✓ {len(nouvelles)} partition(s) ajoutée(s)")
+
+        # Une partition passée vidée par l'archivage est supprimée (opération instantanée)
+        mois_courant = f"p{maintenant:%Y%m}"
+        for nom in partitions:
+            if nom == 'pmax' or nom >= mois_courant:
+                continue
+            cursor.execute(f"SELECT EXISTS(SELECT 1 FROM triages PARTITION ({nom}))")
+            if not cursor.fetchone()[0]:
+                cursor.execute(f"ALTER TABLE triages DROP PARTITION {nom}")
+                print(f"  ✓ Partition vide {nom} supprimée")
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Archiver les triages terminés et maintenir les partitions")
+    parser.add_argument('--retention-jours', type=int, default=365)
+    parser.add_argument('--taille-lot', type=int, default=5000)
+    parser.add_argument('--mode', choices=['table', 'parquet'], default='table')
+    parser.add_argument('--dossier', default='archives', help="Dossier des fichiers Parquet")
+    parser.add_argument('--retention-evenements', type=float, default=72,
+                        help="Heures d'historique complet gardées dans le journal des changements")
+    parser.add_argument('--boucle', type=float, help="Relancer toutes les N heures")
+    args = parser.parse_args()
+
+    while True:
+        print(f"🗄️ Archivage du {datetime.now():%d/%m/%Y %H:%M}...")
+        archiver(args.retention_jours, args.taille_lot, args.mode, args.dossier)
+        maintenir_partitions()
+        compacter_evenements(args.retention_evenements, args.taille_lot)
+        if not args.boucle:
+            break
+        time.sleep(args.boucle * 3600)
@@ -0,0 +1,85 @@
+"""
+Mesure du surcoût des explications par rapport à la prédiction seule.
+
+Le modèle chargé est celui de l'application (TRIAGE_MODELE_DIR, ou le modèle
+de règles médicales à défaut). Le script vérifie aussi que biais + somme des
+contributions redonne bien les probabilités du modèle, et sort en erreur si
+le surcoût unitaire dépasse le budget.
+
+Usage :
+    python benchmark_explications.py
+    python benchmark_explications.py --repetitions 500 --budget-ms 5
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import app
+from donnees_synthetiques import patients_aleatoires
+from explications import compiler_explications, expliquer
+
+
+def chronometrer(fonction, repetitions):
+    """Durée médiane d'un appel, en millisecondes"""
+    fonction()
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append((time.perf_counter() - debut) * 1000)
+    return float(np.median(durees))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coût des explications par prédiction")
+    parser.add_argument('--repetitions', type=int, default=200)
+    parser.add_argument('--lots', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--budget-ms', type=float, default=5.0,
+                        help="Surcoût maximal accepté pour une prédiction unitaire")
+    args = parser.parse_args()
+
+    app.load_ai_model()
+    debut = time.perf_counter()
+    t = compiler_explications(app.model, app.scaler)
+    print(f"🧮 Compilation des explications: {(time.perf_counter() - debut) * 1000:.1f} ms")
+    if t is None:
+        print("❌ Modèle non pris en charge par les explications")
+        return 1
+
+    # Additivité: biais + contributions = probabilités du modèle
+    if t['unite'] == 'probabilite':
+        X = patients_aleatoires(500, graine=1)
+        biais, contributions = expliquer(t, X)
+        ecart = np.abs(biais + contributions.sum(axis=1) - app.model.predict_proba(app.scaler.transform(X))).max()
+        print(f"✅ Écart maximal biais + contributions / predict_proba: {ecart:.2e}")
+        if ecart > 1e-6:
+            print("❌ Les contributions ne redonnent pas les probabilités du modèle")
+            return 1
+
+    print(f"\n{'lot':>6} {'prédiction':>12} {'explication':>12} {'expl./ligne':>12}")
+    for taille in args.lots:
+        X = patients_aleatoires(taille)
+        repetitions = max(5, args.repetitions // taille)
+        prediction = chronometrer(lambda: app.calculer_probabilites(X), repetitions)
+        explication = chronometrer(lambda: expliquer(t, X), repetitions)
+        print(f"{taille:>6} {prediction:>10.3f}ms {explication:>10.3f}ms {explication / taille:>10.4f}ms")
+
+    # Chemin complet de l'application (conversion en dict JSON comprise)
+    niveau = app.predire_triage_patient(dict(zip(
+        app.FEATURES_MODELE[:14] + ['Residence_type', 'smoking_status'],
+        list(patients_aleatoires(1)[0, :14]) + ['Urban', 'smokes'])))[0]
+    X = patients_aleatoires(1)
+    complet = chronometrer(lambda: app.expliquer_predictions(X, [niveau]), args.repetitions)
+    print(f"\n⏱️ expliquer_predictions (1 patient): {complet:.3f} ms")
+
+    if complet > args.budget_ms:
+        print(f"❌ Budget dépassé: {complet:.3f} ms > {args.budget_ms} ms")
+        return 1
+    print(f"✅ Dans le budget de {args.budget_ms} ms par prédiction")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -40,7 +40,8 @@ CREATE TABLE patients (
          
     INDEX idx_nom_prenom (nom, prenom),
     INDEX idx_numero_dossier (numero_dossier),
-    INDEX idx_sexe (sexe)
+    INDEX idx_sexe (sexe),
+    INDEX idx_date_modification (date_modification)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ========================================
@@ -50,6 +51,8 @@ CREATE TABLE triages (
     id INT AUTO_INCREMENT PRIMARY KEY,
     patient_id INT NOT NULL,
     utilisateur_id INT NOT NULL,
+    -- Service de l'évaluateur (utilisateurs.service): file d'attente et compteurs par service
+    service VARCHAR(100) NOT NULL DEFAULT 'Urgences',
          
     -- Données démographiques du patient
     age INT NOT NULL,
@@ -75,6 +78,8 @@ CREATE TABLE triages (
     niveau_triage ENUM('red', 'orange', 'yellow', 'green') NOT NULL,
     score_urgence FLOAT NOT NULL,
     probabilites JSON,
+    -- Contributions de chaque variable au niveau prédit (voir explications.py)
+    contributions JSON NULL,
     priorite INT DEFAULT 999,
          
     -- Gestion du flux de patients
@@ -97,10 +102,21 @@ CREATE TABLE triages (
     INDEX idx_statut (statut),
     INDEX idx_date_triage (date_triage),
     INDEX idx_priorite_score (priorite, score_urgence),
-    INDEX idx_patient_id (patient_id),
     INDEX idx_utilisateur_id (utilisateur_id),
     INDEX idx_medecin_charge (medecin_charge_id),
-    INDEX idx_composite_attente (statut, priorite, score_urgence, date_triage)
+    INDEX idx_composite_attente (statut, priorite, score_urgence, date_triage),
+    INDEX idx_date_modification (date_modification),
+    -- Pagination par curseur de /api/patients/<id>/timeline
+    INDEX idx_patient_date (patient_id, date_triage, id),
+    -- Lecture incrémentale des triages terminés (voir analytique.py)
+    INDEX idx_fin_prise_en_charge (date_fin_prise_en_charge, id),
+    -- Les index par service commencent par `service`: les requêtes d'un service
+    -- ne parcourent que ses propres entrées, quel que soit le nombre de services.
+    -- File d'attente lue dans l'ordre de l'index, sans tri (score décroissant)
+    INDEX idx_service_attente (service, statut, priorite, score_urgence DESC, date_triage),
+    INDEX idx_service_niveau (service, niveau_triage),
+    INDEX idx_service_patient (service, patient_id),
+    INDEX idx_service_modification (service, date_modification)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ========================================
@@ -239,8 +255,8 @@ BEGIN
     WHERE utilisateur_id = user_id;
 END //
 
--- Procédure pour obtenir la file d'attente prioritaire
-CREATE PROCEDURE GetPriorityQueue()
+-- File d'attente prioritaire d'un service
+CREATE PROCEDURE GetPriorityQueue(IN p_service VARCHAR(100))
 BEGIN
     SELECT 
         t.id as triage_id,
@@ -259,12 +275,110 @@ BEGIN
     FROM triages t
     JOIN patients p ON t.patient_id = p.id
     JOIN utilisateurs u ON t.utilisateur_id = u.id
-    WHERE t.statut = 'en_attente'
+    WHERE t.service = p_service AND t.statut = 'en_attente'
     ORDER BY t.priorite ASC, t.score_urgence DESC, t.date_triage ASC;
 END //
 
 DELIMITER ;
 
+-- ========================================
+-- 10. AGRÉGATS D'ANALYSE DES TEMPS D'ATTENTE (voir analytique.py)
+-- ========================================
+-- Agrégats ventilés par service
+CREATE TABLE analytique_rollup (
+    service VARCHAR(100) NOT NULL DEFAULT 'Urgences',
+    heure DATETIME NOT NULL,
+    niveau_triage ENUM('red', 'orange', 'yellow', 'green') NOT NULL,
+    utilisateur_id INT NOT NULL,
+    nb INT NOT NULL DEFAULT 0,
+    nb_pris_en_charge INT NOT NULL DEFAULT 0,
+    somme_attente_s DOUBLE NOT NULL DEFAULT 0,
+    somme_traitement_s DOUBLE NOT NULL DEFAULT 0,
+         
+    PRIMARY KEY (service, heure, niveau_triage, utilisateur_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE analytique_histogramme (
+    service VARCHAR(100) NOT NULL DEFAULT 'Urgences',
+    heure DATETIME NOT NULL,
+    niveau_triage ENUM('red', 'orange', 'yellow', 'green') NOT NULL,
+    utilisateur_id INT NOT NULL,
+    metrique ENUM('attente', 'traitement') NOT NULL,
+    classe TINYINT NOT NULL,
+    nb INT NOT NULL DEFAULT 0,
+         
+    PRIMARY KEY (service, heure, niveau_triage, utilisateur_id, metrique, classe)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Position de la dernière mise à jour incrémentale
+CREATE TABLE analytique_etat (
+    id INT PRIMARY KEY,
+    derniere_fin TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:01',
+    dernier_id INT NOT NULL DEFAULT 0,
+    date_execution TIMESTAMP NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO analytique_etat (id) VALUES (1);
+
+-- ========================================
+-- 11. JOURNAL DES CHANGEMENTS DE LA FILE
+-- ========================================
+-- Numéro courant du journal de chaque service. La ligne reste verrouillée
+-- jusqu'au commit de l'écriture qui l'incrémente (voir journaliser_evenement):
+-- les numéros suivent l'ordre des commits. seq_purge: plus grand numéro
+-- supprimé par la compaction (voir archivage.py)
+CREATE TABLE evenements_sequence (
+    service VARCHAR(100) PRIMARY KEY,
+    valeur BIGINT NOT NULL DEFAULT 0,
+    seq_purge BIGINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Créations et changements de statut, en ajout seul; lu par /queue/changes?since=
+-- Pas de clé étrangère: l'archivage déplace les triages sans toucher au journal
+CREATE TABLE triages_evenements (
+    service VARCHAR(100) NOT NULL,
+    seq BIGINT NOT NULL,
+    triage_id INT NOT NULL,
+    type_evenement ENUM('creation', 'statut') NOT NULL,
+    statut ENUM('en_attente', 'en_cours', 'termine') NOT NULL,
+    niveau_triage ENUM('red', 'orange', 'yellow', 'green') NOT NULL,
+    priorite INT NOT NULL,
+    score_urgence FLOAT NOT NULL,
+    utilisateur_id INT NULL,
+    date_evenement TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (service, seq),
+    INDEX idx_triage_seq (triage_id, seq),
+    INDEX idx_date_evenement (date_evenement)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- État initial: un événement de création par triage non terminé
+INSERT INTO triages_evenements (
+    service, seq, triage_id, type_evenement, statut, niveau_triage, priorite, score_urgence, utilisateur_id
+)
+SELECT service, ROW_NUMBER() OVER (PARTITION BY service ORDER BY date_triage, id), id, 'creation',
+       statut, niveau_triage, priorite, score_urgence, utilisateur_id
+FROM triages
+WHERE statut <> 'termine';
+
+INSERT INTO evenements_sequence (service, valeur)
+SELECT service, MAX(seq) FROM triages_evenements GROUP BY service;
+
+-- ========================================
+-- 12. IMPORTS HISTORIQUES
+-- ========================================
+-- Progression de import_historique.py, écrite dans la transaction de chaque lot
+-- (reprise exacte après un échec); index_differes: index de triages à recréer
+CREATE TABLE imports_reprise (
+    source VARCHAR(255) PRIMARY KEY,
+    lignes BIGINT NOT NULL DEFAULT 0,
+    nb_importes BIGINT NOT NULL DEFAULT 0,
+    nb_rejetes BIGINT NOT NULL DEFAULT 0,
+    index_differes TEXT NULL,
+    termine BOOLEAN NOT NULL DEFAULT FALSE,
+    date_debut TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    date_maj TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Message de confirmation
 SELECT '✅ BASE DE DONNÉES CRÉÉE AVEC SUCCÈS!' as Status,
        'Utilisez les comptes test pour vous connecter' as Instructions,
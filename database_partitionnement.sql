@@ -0,0 +1,91 @@
+USE medicaal_triage_ai;
+
+-- ========================================
+-- CYCLE DE VIE DES DONNÉES: TRIAGES CHAUDS / FROIDS
+-- ========================================
+-- À exécuter une fois sur une base créée par database.sql (ou mise à niveau
+-- par migrations.sql), puis activer la lecture de l'archive dans
+-- l'application avec TRIAGE_ARCHIVAGE=1.
+-- Les partitions suivantes sont créées par `python archivage.py`.
+
+-- ========================================
+-- 1. PARTITIONNEMENT DE `triages` PAR MOIS
+-- ========================================
+-- MySQL n'accepte pas de clé étrangère sur une table partitionnée et exige
+-- que la colonne de partitionnement fasse partie de la clé primaire.
+-- L'intégrité référentielle est assurée par l'application.
+ALTER TABLE triages
+    DROP FOREIGN KEY triages_ibfk_1,
+    DROP FOREIGN KEY triages_ibfk_2,
+    DROP FOREIGN KEY triages_ibfk_3;
+
+ALTER TABLE triages
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, date_triage);
+
+ALTER TABLE triages
+PARTITION BY RANGE (UNIX_TIMESTAMP(date_triage)) (
+    PARTITION p202501 VALUES LESS THAN (UNIX_TIMESTAMP('2025-02-01 00:00:00')),
+    PARTITION p202502 VALUES LESS THAN (UNIX_TIMESTAMP('2025-03-01 00:00:00')),
+    PARTITION p202503 VALUES LESS THAN (UNIX_TIMESTAMP('2025-04-01 00:00:00')),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- ========================================
+-- 2. TABLE D'ARCHIVE DES CAS TERMINÉS
+-- ========================================
+-- Même structure que `triages`, sans partitionnement, stockage compressé
+CREATE TABLE triages_archive LIKE triages;
+ALTER TABLE triages_archive REMOVE PARTITIONING;
+ALTER TABLE triages_archive ROW_FORMAT=COMPRESSED;
+ALTER TABLE triages_archive ADD INDEX idx_utilisateur_date (utilisateur_id, date_triage);
+
+-- ========================================
+-- 3. ÉTAT DE L'ARCHIVAGE
+-- ========================================
+-- Une seule ligne: limite de l'archive et compteurs utilisés par le dashboard
+CREATE TABLE archivage_etat (
+    id INT PRIMARY KEY,
+    date_max_archivee TIMESTAMP NULL,
+    nb_triages INT NOT NULL DEFAULT 0,
+    nb_red INT NOT NULL DEFAULT 0,
+    nb_orange INT NOT NULL DEFAULT 0,
+    nb_yellow INT NOT NULL DEFAULT 0,
+    nb_green INT NOT NULL DEFAULT 0,
+    date_execution TIMESTAMP NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO archivage_etat (id) VALUES (1);
+
+-- ========================================
+-- 4. COMPTEURS D'ARCHIVE PAR SERVICE
+-- ========================================
+-- Les totaux du dashboard d'un service incluent ses triages archivés
+CREATE TABLE archivage_service (
+    service VARCHAR(100) PRIMARY KEY,
+    nb_patients INT NOT NULL DEFAULT 0,
+    nb_triages INT NOT NULL DEFAULT 0,
+    nb_red INT NOT NULL DEFAULT 0,
+    nb_orange INT NOT NULL DEFAULT 0,
+    nb_yellow INT NOT NULL DEFAULT 0,
+    nb_green INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Patients ayant au moins un triage archivé: un patient présent dans les deux
+-- tables n'est compté qu'une fois dans le total du service
+CREATE TABLE archivage_patients (
+    service VARCHAR(100) NOT NULL,
+    patient_id INT NOT NULL,
+    PRIMARY KEY (service, patient_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Reprise des triages déjà archivés
+INSERT INTO archivage_patients (service, patient_id)
+SELECT DISTINCT service, patient_id FROM triages_archive;
+
+INSERT INTO archivage_service (service, nb_patients, nb_triages, nb_red, nb_orange, nb_yellow, nb_green)
+SELECT service, COUNT(DISTINCT patient_id), COUNT(*),
+       SUM(niveau_triage = 'red'), SUM(niveau_triage = 'orange'),
+       SUM(niveau_triage = 'yellow'), SUM(niveau_triage = 'green')
+FROM triages_archive
+GROUP BY service;
@@ -0,0 +1,258 @@
+"""
+Surveillance en ligne de la dérive des données reçues par le modèle.
+
+Une référence est calculée sur les données d'entraînement et enregistrée
+avec les artefacts (reference_derive.json) : pour chaque variable, les bornes
+d'un histogramme (déciles, ou valeurs distinctes pour les variables
+discrètes), ses effectifs, la moyenne et la variance ; la distribution des
+classes prédites ; et les histogrammes de chaque variable par classe prédite.
+
+MoniteurDerive met à jour les mêmes esquisses à chaque prédiction, en pur
+Python : une recherche dichotomique par variable et une mise à jour de
+Welford, sans dépendre du nombre de patients déjà vus. La mémoire est bornée
+par deux fenêtres qui tournent toutes les `fenetre` observations : les scores
+portent sur les `fenetre` à 2 × `fenetre` prédictions les plus récentes.
+Le score par variable est le PSI (Population Stability Index) :
+< 0.1 stable, 0.1 à 0.25 à surveiller, > 0.25 dérive.
+"""
+import bisect
+import json
+import math
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+FICHIER_REFERENCE = 'reference_derive.json'
+NIVEAUX = ('red', 'orange', 'yellow', 'green')
+
+NB_INTERVALLES = 10
+SEUIL_SURVEILLANCE = 0.1
+# Observations minimales (fenêtres cumulées, ou par classe) avant de calculer un score
+OBSERVATIONS_MIN = 200
+# Les alertes sont réévaluées toutes les N observations
+VERIFICATION_ALERTES = 250
+
+
+def _bornes(colonne):
+    import numpy as np
+
+    valeurs = np.unique(colonne)
+    if len(valeurs) <= NB_INTERVALLES:
+        # Variable discrète: un intervalle par valeur
+        return ((valeurs[:-1] + valeurs[1:]) / 2).tolist()
+    return np.unique(np.quantile(colonne, np.linspace(0, 1, NB_INTERVALLES + 1)[1:-1])).tolist()
+
+
+def construire_reference(X, niveaux, features):
+    """Esquisses de référence (dict JSON) d'une matrice d'entraînement et des niveaux prédits"""
+    import numpy as np
+
+    X = np.asarray(X, dtype=np.float64)
+    niveaux = np.asarray(niveaux).astype(str)
+    reference = {
+        'date': datetime.now().isoformat(),
+        'n': int(len(X)),
+        'features': {},
+        'classes': {niveau: int((niveaux == niveau).sum()) for niveau in NIVEAUX},
+        'par_classe': {niveau: {} for niveau in NIVEAUX},
+    }
+    for j, nom in enumerate(features):
+        bornes = _bornes(X[:, j])
+        intervalles = np.searchsorted(bornes, X[:, j], side='right')
+        reference['features'][nom] = {
+            'bornes': bornes,
+            'comptes': np.bincount(intervalles, minlength=len(bornes) + 1).tolist(),
+            'moyenne': float(X[:, j].mean()),
+            'variance': float(X[:, j].var()),
+        }
+        for niveau in NIVEAUX:
+            reference['par_classe'][niveau][nom] = np.bincount(
+                intervalles[niveaux == niveau], minlength=len(bornes) + 1).tolist()
+    return reference
+
+
+def sauvegarder_reference(dossier, reference):
+    with open(os.path.join(dossier, FICHIER_REFERENCE), 'w', encoding='utf-8') as f:
+        json.dump(reference, f)
+
+
+def charger_reference(dossier):
+    """Référence enregistrée avec les artefacts, ou None si absente"""
+    chemin = os.path.join(dossier, FICHIER_REFERENCE)
+    if not os.path.exists(chemin):
+        print(f"⚠️ Pas de référence de dérive dans '{dossier}': surveillance désactivée")
+        return None
+    with open(chemin, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def psi(comptes, comptes_reference):
+    """Population Stability Index entre deux histogrammes (lissage de 0.5 par intervalle)"""
+    n = sum(comptes) + 0.5 * len(comptes)
+    n_ref = sum(comptes_reference) + 0.5 * len(comptes_reference)
+    total = 0.0
+    for c, r in zip(comptes, comptes_reference):
+        p, q = (c + 0.5) / n, (r + 0.5) / n_ref
+        total += (p - q) * math.log(p / q)
+    return total
+
+
+class _Fenetre:
+    """Esquisses d'une fenêtre d'observations"""
+    __slots__ = ('n', 'comptes', 'moyennes', 'm2', 'classes', 'comptes_classes')
+
+    def __init__(self, tailles):
+        self.n = 0
+        self.comptes = [[0] * t for t in tailles]
+        self.moyennes = [0.0] * len(tailles)
+        self.m2 = [0.0] * len(tailles)
+        self.classes = dict.fromkeys(NIVEAUX, 0)
+        self.comptes_classes = {niveau: [[0] * t for t in tailles] for niveau in NIVEAUX}
+
+
+class MoniteurDerive:
+    """Esquisses en ligne des vecteurs reçus, comparées à la référence du modèle"""
+
+    def __init__(self, reference, features, fenetre=5000, seuil_alerte=0.25):
+        manquantes = set(features) - set(reference['features'])
+        if manquantes:
+            raise ValueError(f"Référence de dérive incomplète: {', '.join(sorted(manquantes))}")
+        self.reference = reference
+        self.features = list(features)
+        self.bornes = [reference['features'][nom]['bornes'] for nom in self.features]
+        self.tailles = [len(b) + 1 for b in self.bornes]
+        self.taille_fenetre = fenetre
+        self.seuil_alerte = seuil_alerte
+        self.courante = _Fenetre(self.tailles)
+        self.precedente = _Fenetre(self.tailles)
+        self.total = 0
+        self.en_alerte = set()
+        self.alertes = deque(maxlen=50)
+        self.verrou = threading.Lock()
+
+    def observer(self, vecteur, niveau):
+        """Ajouter une prédiction: O(nombre de variables), indépendant du volume déjà vu"""
+        with self.verrou:
+            f = self.courante
+            f.n += 1
+            classe = f.comptes_classes.get(niveau)
+            if classe is not None:
+                f.classes[niveau] += 1
+            for j, x in enumerate(vecteur):
+                i = bisect.bisect_right(self.bornes[j], x)
+                f.comptes[j][i] += 1
+                if classe is not None:
+                    classe[j][i] += 1
+                # Welford
+                ecart = x - f.moyennes[j]
+                f.moyennes[j] += ecart / f.n
+                f.m2[j] += ecart * (x - f.moyennes[j])
+
+            if f.n >= self.taille_fenetre:
+                self.precedente, self.courante = f, _Fenetre(self.tailles)
+            self.total += 1
+            verifier = self.total % VERIFICATION_ALERTES == 0
+        if verifier:
+            self.verifier_alertes()
+
+    def _cumul(self):
+        """Effectifs, moyennes et variances des deux fenêtres réunies (formule de Chan)"""
+        a, b = self.precedente, self.courante
+        n = a.n + b.n
+        comptes = [[x + y for x, y in zip(ca, cb)] for ca, cb in zip(a.comptes, b.comptes)]
+        moyennes, variances = [], []
+        for j in range(len(self.features)):
+            if not n:
+                moyennes.append(0.0)
+                variances.append(0.0)
+                continue
+            delta = b.moyennes[j] - a.moyennes[j]
+            moyennes.append(a.moyennes[j] + delta * b.n / n)
+            variances.append((a.m2[j] + b.m2[j] + delta * delta * a.n * b.n / n) / n)
+        classes = {niveau: a.classes[niveau] + b.classes[niveau] for niveau in NIVEAUX}
+        par_classe = {
+            niveau: [[x + y for x, y in zip(ca, cb)]
+                     for ca, cb in zip(a.comptes_classes[niveau], b.comptes_classes[niveau])]
+            for niveau in NIVEAUX
+        }
+        return n, comptes, moyennes, variances, classes, par_classe
+
+    def _etat(self, score):
+        if score is None:
+            return 'insuffisant'
+        if score > self.seuil_alerte:
+            return 'alerte'
+        return 'surveillance' if score > SEUIL_SURVEILLANCE else 'stable'
+
+    def scores(self):
+        """Scores de dérive par variable, des classes prédites et par classe"""
+        with self.verrou:
+            n, comptes, moyennes, variances, classes, par_classe = self._cumul()
+            alertes = list(self.alertes)
+
+        suffisant = n >= OBSERVATIONS_MIN
+        features = {}
+        for j, nom in enumerate(self.features):
+            ref = self.reference['features'][nom]
+            score = round(psi(comptes[j], ref['comptes']), 4) if suffisant else None
+            ecart_type = math.sqrt(ref['variance']) or 1.0
+            features[nom] = {
+                'psi': score,
+                'etat': self._etat(score),
+                'moyenne': round(moyennes[j], 3),
+                'moyenne_reference': round(ref['moyenne'], 3),
+                # Décalage de la moyenne en écarts-types de la référence
+                'decalage': round((moyennes[j] - ref['moyenne']) / ecart_type, 3) if n else None,
+                'variance': round(variances[j], 3),
+                'variance_reference': round(ref['variance'], 3),
+            }
+
+        reference_classes = [self.reference['classes'].get(niveau, 0) for niveau in NIVEAUX]
+        score_classes = round(psi([classes[niveau] for niveau in NIVEAUX], reference_classes), 4) if suffisant else None
+
+        par_niveau = {}
+        for niveau in NIVEAUX:
+            assez = classes[niveau] >= OBSERVATIONS_MIN
+            par_niveau[niveau] = {
+                nom: round(psi(par_classe[niveau][j], self.reference['par_classe'][niveau][nom]), 4) if assez else None
+                for j, nom in enumerate(self.features)
+            }
+
+        return {
+            'observations': n,
+            'total': self.total,
+            'fenetre': self.taille_fenetre,
+            'seuil_alerte': self.seuil_alerte,
+            'reference': {'date': self.reference.get('date'), 'n': self.reference['n']},
+            'features': features,
+            'classes': {
+                'psi': score_classes,
+                'etat': self._etat(score_classes),
+                'distribution': classes,
+                'reference': dict(zip(NIVEAUX, reference_classes)),
+            },
+            'par_classe': par_niveau,
+            'en_alerte': sorted(self.en_alerte),
+            'alertes': alertes,
+        }
+
+    def verifier_alertes(self):
+        """Signaler les variables qui franchissent le seuil d'alerte (et leur retour à la normale)"""
+        resultat = self.scores()
+        scores = {nom: f['psi'] for nom, f in resultat['features'].items()}
+        scores['classes_predites'] = resultat['classes']['psi']
+        en_alerte = {nom for nom, score in scores.items() if score is not None and score > self.seuil_alerte}
+
+        maintenant = datetime.now().isoformat(timespec='seconds')
+        with self.verrou:
+            nouvelles, resolues = en_alerte - self.en_alerte, self.en_alerte - en_alerte
+            for nom in sorted(nouvelles):
+                self.alertes.append({'date': maintenant, 'variable': nom, 'psi': scores[nom], 'etat': 'alerte'})
+            for nom in sorted(resolues):
+                self.alertes.append({'date': maintenant, 'variable': nom, 'psi': scores[nom], 'etat': 'resolue'})
+            self.en_alerte = en_alerte
+        for nom in sorted(nouvelles):
+            print(f"🚨 Dérive détectée sur {nom}: PSI {scores[nom]:.3f} > {self.seuil_alerte}")
+        for nom in sorted(resolues):
+            print(f"✅ Dérive résorbée sur {nom}")
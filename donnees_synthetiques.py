@@ -0,0 +1,31 @@
+"""
+Patients synthétiques pour les benchmarks et la simulation.
+
+Les vecteurs suivent l'ordre de FEATURES_MODELE, avec des distributions
+plausibles pour chaque variable : ils servent à mesurer des coûts, pas à
+entraîner ni à évaluer le modèle.
+"""
+import numpy as np
+
+
+def patients_aleatoires(nb, graine=0):
+    """Vecteurs de 16 valeurs plausibles, dans l'ordre de FEATURES_MODELE"""
+    rng = np.random.default_rng(graine)
+    return np.column_stack([
+        rng.normal(50, 15, nb).clip(18, 90),
+        rng.integers(0, 2, nb),
+        rng.integers(0, 5, nb),
+        rng.normal(130, 20, nb).clip(80, 200),
+        rng.normal(240, 50, nb).clip(150, 400),
+        rng.normal(150, 30, nb).clip(60, 220),
+        rng.integers(0, 2, nb),
+        rng.normal(100, 30, nb).clip(50, 300),
+        rng.normal(25, 10, nb).clip(5, 50),
+        rng.normal(80, 40, nb).clip(10, 200),
+        rng.normal(26, 5, nb).clip(15, 40),
+        rng.uniform(0.1, 2.0, nb),
+        rng.integers(0, 2, nb),
+        rng.integers(0, 2, nb),
+        rng.integers(0, 2, nb),
+        rng.integers(0, 3, nb),
+    ]).astype(np.float64)
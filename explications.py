@@ -0,0 +1,78 @@
+"""
+Contributions des variables à chaque prédiction, lues sur les chemins de
+décision de la forêt.
+
+Dans un arbre, le passage d'un noeud à son fils modifie la distribution des
+classes de valeurs[fils] - valeurs[noeud] ; cette variation est attribuée à la
+variable testée au noeud. En moyenne sur les arbres :
+
+    probabilité(classe) = biais(classe) + somme des contributions(classe)
+
+le biais étant la distribution moyenne des racines. Les chemins de tous les
+arbres et de toutes les lignes d'un lot sont parcourus ensemble, niveau par
+niveau, sur les tableaux de pool_inference.compiler_modele.
+
+Pour un modèle linéaire, la contribution est coef * x (échelle des logits).
+"""
+import numpy as np
+
+from pool_inference import compiler_modele
+
+
+def compiler_explications(model, scaler):
+    """Tableaux nécessaires aux explications, ou None si le modèle n'est pas pris en charge"""
+    if hasattr(model, 'estimators_') and hasattr(model.estimators_[0], 'tree_'):
+        t = compiler_modele(model, scaler)
+        t['biais'] = t['valeurs'][t['racines']].mean(axis=0)
+        t['unite'] = 'probabilite'
+        return t
+    if hasattr(model, 'coef_'):
+        return {
+            'mean': np.asarray(scaler.mean_, dtype=np.float64),
+            'scale': np.asarray(scaler.scale_, dtype=np.float64),
+            'coef': np.asarray(model.coef_, dtype=np.float64),
+            'biais': np.asarray(model.intercept_, dtype=np.float64),
+            'unite': 'logit'
+        }
+    return None
+
+
+def contributions_foret(t, X_scaled):
+    """Contributions (lignes x variables x classes) et probabilités de la forêt"""
+    # Les arbres scikit-learn comparent en float32
+    X32 = X_scaled.astype(np.float32)
+    nb_lignes, nb_variables = X32.shape
+    nb_arbres, nb_classes = len(t['racines']), t['valeurs'].shape[1]
+    lignes = np.arange(nb_lignes)[:, None]
+    # Indice à plat (ligne, variable) de chaque variable testée
+    base = (np.arange(nb_lignes) * nb_variables)[:, None]
+
+    contributions = np.zeros((nb_classes, nb_lignes * nb_variables))
+    noeuds = np.broadcast_to(t['racines'], (nb_lignes, nb_arbres)).copy()
+    for _ in range(int(t['profondeur'][0])):
+        variables = t['feature'][noeuds]
+        a_gauche = X32[lignes, variables] <= t['seuil'][noeuds]
+        fils = np.where(a_gauche, t['gauche'][noeuds], t['droite'][noeuds])
+        # Une feuille pointe sur elle-même: seuls les chemins encore actifs comptent
+        actifs = fils != noeuds
+        if not actifs.any():
+            break
+        indices = (base + variables)[actifs]
+        variations = t['valeurs'][fils[actifs]] - t['valeurs'][noeuds[actifs]]
+        for classe in range(nb_classes):
+            contributions[classe] += np.bincount(indices, weights=variations[:, classe],
+                                                 minlength=nb_lignes * nb_variables)
+        noeuds = fils
+
+    contributions = contributions.reshape(nb_classes, nb_lignes, nb_variables).transpose(1, 2, 0) / nb_arbres
+    return contributions, t['valeurs'][noeuds].mean(axis=1)
+
+
+def expliquer(t, X):
+    """Biais par classe et contributions (lignes x variables x classes) pour un lot non normalisé"""
+    X_scaled = (np.asarray(X, dtype=np.float64) - t['mean']) / t['scale']
+    if 'racines' in t:
+        contributions, _ = contributions_foret(t, X_scaled)
+    else:
+        contributions = X_scaled[:, :, None] * t['coef'].T[None, :, :]
+    return t['biais'], contributions
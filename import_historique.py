@@ -0,0 +1,447 @@
+"""
+Import en masse de jeux de triages historiques (patient_priority.csv, exports
+de l'ancien système) dans `patients` et `triages`.
+
+Le fichier est lu en flux par lots (pandas, chunksize). Chaque lot est validé
+colonne par colonne avec les règles de validation.SCHEMA_TRIAGE, trié en une
+seule prédiction, puis inséré avec des INSERT multi-lignes (executemany) dans
+une seule transaction. Les patients sont dédoublonnés sur (nom, prenom) grâce
+à un index en mémoire chargé au départ ; un patient créé sans numero_dossier,
+ou dont le numéro est déjà attribué, reçoit un numéro d'import
+(IMP-<source>-<ligne>).
+
+La progression est enregistrée dans `imports_reprise` dans la transaction de
+chaque lot : après un échec, relancer la même commande reprend au premier lot
+non validé, sans doublon. Les triages importés sont historiques et enregistrés
+avec le statut 'termine' : ils n'entrent pas dans la file d'attente.
+
+Ils comptent dans l'analyse des temps d'attente (analytique.py) : la fin de
+prise en charge vaut date_fin_prise_en_charge, sinon date_triage. Sans
+date_prise_en_charge, ils comptent dans les volumes mais pas dans les durées.
+Les triages déjà dépassés par la mise à jour incrémentale des agrégats y sont
+ajoutés dans la transaction du lot, les autres le seront par analytique.py.
+
+Colonnes reconnues (casse et espaces ignorés) : les 16 variables du modèle,
+et en option nom, prenom, date_naissance, numero_dossier, date_triage,
+date_prise_en_charge, date_fin_prise_en_charge et triage / niveau_triage
+(niveau historique, sinon celui du modèle).
+
+Usage :
+    python import_historique.py patient_priority.csv
+    python import_historique.py export.csv --taille-lot 20000 --differer-index
+    python import_historique.py patient_priority.csv --defaut-tabagisme "never smoked"
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import analytique
+import app
+from validation import SCHEMA_TRIAGE, CODES_TABAGISME
+
+NIVEAUX = ('red', 'orange', 'yellow', 'green')
+
+# Colonnes des clés étrangères: leur index ne peut pas être supprimé
+COLONNES_CLES_ETRANGERES = ('patient_id', 'utilisateur_id', 'medecin_charge_id')
+
+COLONNES_TRIAGES = (
+    'patient_id', 'utilisateur_id', 'service', 'age', 'sexe_code', 'chest_pain_type',
+    'blood_pressure', 'cholesterol', 'max_heart_rate', 'exercise_angina',
+    'plasma_glucose', 'skin_thickness', 'insulin', 'bmi', 'diabetes_pedigree',
+    'hypertension', 'heart_disease', 'residence_type', 'smoking_status',
+    'niveau_triage', 'score_urgence', 'probabilites', 'contributions', 'priorite', 'statut', 'date_triage',
+    'date_prise_en_charge', 'date_fin_prise_en_charge'
+)
+
+
+def normaliser_colonnes(df):
+    """Noms de colonnes en minuscules avec '_' ('chest pain type' -> 'chest_pain_type')"""
+    noms = {cle.lower(): cle for cle, _, _ in SCHEMA_TRIAGE}
+    df.columns = [noms.get(c, c) for c in (str(c).strip().lower().replace(' ', '_') for c in df.columns)]
+    return df
+
+
+def valider_lot(df, defaut_tabagisme=None):
+    """Valider un lot colonne par colonne; renvoie (lignes valides typées, rejets {ligne, erreur})"""
+    erreurs = pd.Series('', index=df.index)
+
+    if defaut_tabagisme:
+        tabagisme = df['smoking_status'].str.strip()
+        df['smoking_status'] = tabagisme.where(tabagisme.isin(CODES_TABAGISME), defaut_tabagisme)
+
+    for cle, type_champ, contrainte in SCHEMA_TRIAGE:
+        if type_champ == 'choix':
+            valeurs = df[cle].astype('string').str.strip()
+            ok = valeurs.isin(contrainte).fillna(False).astype(bool)
+            message = f"valeur attendue parmi: {', '.join(contrainte)}"
+        else:
+            valeurs = pd.to_numeric(df[cle], errors='coerce')
+            ok = valeurs.notna() & np.isfinite(valeurs)
+            if type_champ == 'binaire':
+                ok &= valeurs.isin((0, 1))
+                message = "0 ou 1 attendu"
+            else:
+                minimum, maximum = contrainte
+                ok &= valeurs.between(minimum, maximum)
+                if type_champ == 'entier':
+                    ok &= (valeurs % 1 == 0)
+                message = f"{'entier' if type_champ == 'entier' else 'nombre'} attendu entre {minimum} et {maximum}"
+        df[cle] = valeurs
+        erreurs = erreurs.mask((erreurs == '') & ~ok, f"{cle}: {message}")
+
+    for cle in ('nom', 'prenom'):
+        if cle in df:
+            df[cle] = df[cle].fillna('').str.strip()
+            erreurs = erreurs.mask((erreurs == '') & (df[cle] == ''), f"{cle}: champ requis")
+
+    if 'niveau_triage' in df:
+        df['niveau_triage'] = df['niveau_triage'].str.strip().str.lower()
+        ok = df['niveau_triage'].isin(NIVEAUX).fillna(False).astype(bool)
+        erreurs = erreurs.mask((erreurs == '') & ~ok, f"niveau_triage: valeur attendue parmi: {', '.join(NIVEAUX)}")
+
+    rejet = erreurs != ''
+    return df[~rejet], pd.DataFrame({'ligne': df.index[rejet], 'erreur': erreurs[rejet]})
+
+
+def encoder_lot(df):
+    """Matrice des 16 variables du modèle (même encodage que EnregistrementTriage.vecteur)"""
+    X = np.empty((len(df), 16), dtype=np.float64)
+    X[:, :14] = df[[cle for cle, _, _ in SCHEMA_TRIAGE[:14]]].to_numpy(dtype=np.float64)
+    X[:, 14] = (df['Residence_type'] == 'Urban').to_numpy()
+    X[:, 15] = df['smoking_status'].map(CODES_TABAGISME).to_numpy(dtype=np.float64)
+    return X
+
+
+def dates_colonne(df, cle):
+    """Colonne de dates (NaT si absente ou illisible)"""
+    if cle not in df:
+        return pd.Series(pd.NaT, index=df.index)
+    return pd.to_datetime(df[cle], errors='coerce')
+
+
+class IndexPatients:
+    """Identifiants des patients par (nom, prenom), chargés une fois puis tenus à jour"""
+
+    def __init__(self, connection):
+        self.ids = {}
+        cursor = connection.cursor(buffered=False)
+        cursor.execute("SELECT id, nom, prenom FROM patients")
+        for patient_id, nom, prenom in cursor:
+            self.ids.setdefault(self.cle(nom, prenom), patient_id)
+        cursor.close()
+
+    @staticmethod
+    def cle(nom, prenom):
+        # Même égalité que la collation utf8mb4_unicode_ci de patients (casse ignorée)
+        return nom.strip().casefold(), prenom.strip().casefold()
+
+    def resoudre(self, cursor, lot):
+        """Identifiant de chaque ligne du lot, en insérant d'un bloc les patients inconnus.
+        
+        `lot` contient (nom, prenom, sexe, naissance, dossier du fichier ou None,
+        numéro d'import). Un dossier du fichier déjà attribué, en base ou à un
+        autre nouveau patient du lot, est signalé et remplacé par le numéro
+        d'import. Les identifiants attribués sont relus sur
+        (numero_dossier, nom, prenom), sans ambiguïté possible.
+        """
+        nouveaux = {}
+        for nom, prenom, sexe, naissance, dossier, dossier_import in lot:
+            cle = self.cle(nom, prenom)
+            if cle not in self.ids and cle not in nouveaux:
+                nouveaux[cle] = [nom, prenom, naissance, sexe, '', dossier or dossier_import, dossier_import]
+        if not nouveaux:
+            return [self.ids[self.cle(nom, prenom)] for nom, prenom, *_ in lot], 0
+
+        candidats = {patient[5] for patient in nouveaux.values()} | {patient[6] for patient in nouveaux.values()}
+        cursor.execute(f"""
+            SELECT numero_dossier FROM patients
+            WHERE numero_dossier IN ({", ".join(["%s"] * len(candidats))})
+        """, list(candidats))
+        pris = {ligne[0] for ligne in cursor.fetchall()}
+        reattribues = []
+        for patient in nouveaux.values():
+            dossier, dossier_import = patient[5], patient[6]
+            if dossier_import in pris:
+                raise RuntimeError(f"Numéro d'import {dossier_import} déjà attribué: "
+                                   f"source déjà importée (utiliser un autre --source)")
+            if dossier in pris:
+                reattribues.append(dossier)
+                patient[5] = dossier_import
+            pris.add(patient[5])
+        if reattribues:
+            print(f"⚠️ {len(reattribues)} numéro(s) de dossier déjà attribué(s), remplacés par un numéro d'import: "
+                  f"{', '.join(reattribues[:10])}{'...' if len(reattribues) > 10 else ''}")
+
+        cursor.executemany("""
+            INSERT INTO patients (nom, prenom, date_naissance, sexe, telephone, numero_dossier)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, [tuple(patient[:6]) for patient in nouveaux.values()])
+        # Relecture des identifiants attribués (l'INSERT multi-lignes ne renvoie que le premier)
+        cles_dossiers = {(patient[5], patient[0], patient[1]): cle for cle, patient in nouveaux.items()}
+        cursor.execute(f"""
+            SELECT id, numero_dossier, nom, prenom FROM patients
+            WHERE (numero_dossier, nom, prenom) IN ({", ".join(["(%s, %s, %s)"] * len(cles_dossiers))})
+        """, [valeur for cle in cles_dossiers for valeur in cle])
+        for patient_id, dossier, nom, prenom in cursor.fetchall():
+            self.ids[cles_dossiers[(dossier, nom, prenom)]] = patient_id
+        return [self.ids[self.cle(nom, prenom)] for nom, prenom, *_ in lot], len(nouveaux)
+
+
+def lire_reprise(cursor, source):
+    cursor.execute("""
+        SELECT lignes, nb_importes, nb_rejetes, index_differes, termine
+        FROM imports_reprise WHERE source = %s
+    """, (source,))
+    return cursor.fetchone()
+
+
+def enregistrer_reprise(cursor, source, lignes, importes, rejetes, index_differes=None, termine=False):
+    cursor.execute("""
+        INSERT INTO imports_reprise (source, lignes, nb_importes, nb_rejetes, index_differes, termine)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE lignes = VALUES(lignes), nb_importes = VALUES(nb_importes),
+            nb_rejetes = VALUES(nb_rejetes), index_differes = VALUES(index_differes), termine = VALUES(termine)
+    """, (source, lignes, importes, rejetes, index_differes, termine))
+
+
+def integrer_agregats(cursor, lignes_triages):
+    """Ajouter aux agrégats d'analyse les triages du lot que leur mise à jour incrémentale a dépassés.
+    
+    analytique.py lit les triages terminés après sa position (derniere_fin, dernier_id);
+    les ids importés étant plus grands que dernier_id, seuls ceux terminés strictement
+    avant derniere_fin lui échapperaient. Le verrou sur l'état l'empêche d'avancer pendant le lot.
+    """
+    cursor.execute("SELECT derniere_fin FROM analytique_etat WHERE id = 1 FOR UPDATE")
+    etat = cursor.fetchone()
+    if not etat:
+        return
+    i = {colonne: COLONNES_TRIAGES.index(colonne) for colonne in (
+        'utilisateur_id', 'niveau_triage', 'date_triage', 'date_prise_en_charge', 'date_fin_prise_en_charge', 'service')}
+    depassees = [
+        (0, ligne[i['utilisateur_id']], ligne[i['niveau_triage']], ligne[i['date_triage']],
+         ligne[i['date_prise_en_charge']], ligne[i['date_fin_prise_en_charge']], ligne[i['service']])
+        for ligne in lignes_triages if ligne[i['date_fin_prise_en_charge']] < etat[0]
+    ]
+    if depassees:
+        analytique.integrer_lot(cursor, depassees)
+
+
+def index_secondaires(cursor):
+    """Définitions (nom -> clause ADD INDEX) des index secondaires non uniques de `triages`"""
+    cursor.execute("""
+        SELECT INDEX_NAME, COLUMN_NAME, COLLATION, SUB_PART
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'triages' AND NON_UNIQUE = 1
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """)
+    colonnes = {}
+    for nom, colonne, collation, sous_partie in cursor.fetchall():
+        colonnes.setdefault(nom, []).append(
+            f"{colonne}{f'({sous_partie})' if sous_partie else ''}{' DESC' if collation == 'D' else ''}"
+        )
+    return {nom: f"ADD INDEX {nom} ({', '.join(cols)})" for nom, cols in colonnes.items()}
+
+
+def differer_index(connection, cursor, source, progression):
+    """Supprimer les index secondaires avant l'import; leur définition est gardée pour la reprise.
+    
+    Refusé tant que `triages` contient des cas non terminés: sans ses index,
+    la file d'attente et le dashboard parcourraient toute la table.
+    """
+    if progression and progression[3]:
+        definitions = json.loads(progression[3])
+    else:
+        definitions = {nom: clause for nom, clause in index_secondaires(cursor).items()
+                       if not clause.split('(')[1].startswith(COLONNES_CLES_ETRANGERES)}
+        enregistrer_reprise(cursor, source, *(progression[:3] if progression else (0, 0, 0)),
+                            index_differes=json.dumps(definitions))
+        connection.commit()
+
+    presents = index_secondaires(cursor)
+    a_supprimer = [nom for nom in definitions if nom in presents]
+    if a_supprimer:
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM triages WHERE statut <> 'termine')")
+        if cursor.fetchone()[0]:
+            raise RuntimeError("--differer-index refusé: la table triages contient des cas non terminés "
+                               "(file d'attente active)")
+        cursor.execute(f"ALTER TABLE triages {', '.join(f'DROP INDEX {nom}' for nom in a_supprimer)}")
+        print(f"⚠️ {len(a_supprimer)} index de triages supprimés pendant l'import: {', '.join(a_supprimer)}")
+    return definitions
+
+
+def recreer_index(cursor, definitions):
+    presents = index_secondaires(cursor)
+    clauses = [clause for nom, clause in definitions.items() if nom not in presents]
+    if clauses:
+        debut = time.perf_counter()
+        cursor.execute(f"ALTER TABLE triages {', '.join(clauses)}")
+        print(f"  ✓ {len(clauses)} index recréés en {time.perf_counter() - debut:.1f}s")
+
+
+def importer(chemin, source=None, taille_lot=5000, service=None, utilisateur_id=1, date_defaut=None,
+             defaut_tabagisme=None, rescorer=False, differer=False, recommencer=False, rejets=None):
+    """Importer le fichier; renvoie (lignes importées, lignes rejetées)"""
+    source = source or os.path.basename(chemin)
+    service = service or app.SERVICE_DEFAUT
+    date_defaut = date_defaut or pd.Timestamp.now().to_pydatetime()
+    prefixe_dossier = f"IMP-{hashlib.sha1(source.encode()).hexdigest()[:10]}"
+    anonyme = None
+
+    connection = app.get_db_connection()
+    if not connection:
+        raise RuntimeError("Connexion à la base de données impossible")
+
+    try:
+        cursor = connection.cursor()
+        progression = None if recommencer else lire_reprise(cursor, source)
+        if progression and progression[4]:
+            print(f"✅ {source} déjà importé ({progression[1]} lignes, {progression[2]} rejetées)")
+            return progression[1], progression[2]
+        lignes, importes, rejetes = progression[:3] if progression else (0, 0, 0)
+        if lignes:
+            print(f"🔁 Reprise de {source} après {lignes} lignes")
+
+        definitions = differer_index(connection, cursor, source, progression) if differer else None
+        index_differes = json.dumps(definitions) if definitions else None
+
+        debut_chargement = time.perf_counter()
+        patients = IndexPatients(connection)
+        print(f"👥 {len(patients.ids)} patients indexés en {time.perf_counter() - debut_chargement:.1f}s")
+
+        debut = time.perf_counter()
+        lignes_session = 0
+        lecteur = pd.read_csv(chemin, chunksize=taille_lot, skiprows=range(1, lignes + 1), dtype=str)
+        for df in lecteur:
+            debut_lot = time.perf_counter()
+            df = normaliser_colonnes(df)
+            # Numéro de ligne dans le fichier (1 = première ligne de données)
+            df.index = pd.RangeIndex(lignes + 1, lignes + 1 + len(df))
+
+            manquantes = [cle for cle, _, _ in SCHEMA_TRIAGE if cle not in df]
+            if manquantes:
+                raise ValueError(f"Colonnes manquantes dans {chemin}: {', '.join(manquantes)}")
+            if 'triage' in df and 'niveau_triage' not in df:
+                df = df.rename(columns={'triage': 'niveau_triage'})
+            if anonyme is None:
+                anonyme = not {'nom', 'prenom'} <= set(df.columns)
+
+            valides, refus = valider_lot(df, defaut_tabagisme)
+
+            X = encoder_lot(valides)
+            resultats = app.predire_triage_lot(X) if len(valides) else []
+            if 'niveau_triage' in valides and not rescorer:
+                niveaux = valides['niveau_triage'].tolist()
+            else:
+                niveaux = [str(niveau) for niveau, *_ in resultats]
+            explications = app.expliquer_predictions(X, niveaux) if len(valides) else []
+
+            if anonyme:
+                noms = [source[:100]] * len(valides)
+                prenoms = [f"Ligne {n}" for n in valides.index]
+            else:
+                noms = valides['nom'].tolist()
+                prenoms = valides['prenom'].tolist()
+            sexes = np.where(valides['gender'] == 1, 'M', 'F').tolist()
+            dossiers = (valides['numero_dossier'].str.strip().where(valides['numero_dossier'].notna(), None).tolist()
+                        if 'numero_dossier' in valides else [None] * len(valides))
+            dossiers = [dossier or None for dossier in dossiers]
+            # Numéro d'import déterministe (source, ligne): patients sans dossier ou dossier déjà pris
+            dossiers_import = [f"{prefixe_dossier}-{n}" for n in valides.index]
+            naissances = [d.date() if not pd.isna(d) else '1990-01-01'
+                          for d in dates_colonne(valides, 'date_naissance')]
+            dates = [d.to_pydatetime() if not pd.isna(d) else date_defaut
+                     for d in dates_colonne(valides, 'date_triage')]
+            prises = [d.to_pydatetime() if not pd.isna(d) else None
+                      for d in dates_colonne(valides, 'date_prise_en_charge')]
+            fins = [d.to_pydatetime() if not pd.isna(d) else date
+                    for d, date in zip(dates_colonne(valides, 'date_fin_prise_en_charge'), dates)]
+
+            try:
+                patient_ids, nb_nouveaux = patients.resoudre(
+                    cursor, list(zip(noms, prenoms, sexes, naissances, dossiers, dossiers_import)))
+                colonnes = [valides[cle].tolist() for cle, _, _ in SCHEMA_TRIAGE]
+                colonnes = [[int(v) for v in col] if type_champ in ('entier', 'binaire') else col
+                            for col, (_, type_champ, _) in zip(colonnes, SCHEMA_TRIAGE)]
+                lignes_triages = [
+                    (patient_id, utilisateur_id, service) + tuple(valeurs) + (
+                        niveau, app.URGENCE_SCORES.get(niveau, 50), json.dumps(probabilites),
+                        json.dumps(explication) if explication else None, app.PRIORITES.get(niveau, 3),
+                        'termine', date, prise, fin
+                    )
+                    for patient_id, valeurs, niveau, (_, probabilites, _, _), explication, date, prise, fin in zip(
+                        patient_ids, zip(*colonnes), niveaux, resultats, explications, dates, prises, fins)
+                ] if len(valides) else []
+                if lignes_triages:
+                    cursor.executemany(f"""
+                        INSERT INTO triages ({", ".join(COLONNES_TRIAGES)})
+                        VALUES ({", ".join(["%s"] * len(COLONNES_TRIAGES))})
+                    """, lignes_triages)
+                    integrer_agregats(cursor, lignes_triages)
+
+                lignes += len(df)
+                importes += len(lignes_triages)
+                rejetes += len(refus)
+                enregistrer_reprise(cursor, source, lignes, importes, rejetes, index_differes)
+                connection.commit()
+            except app.Error:
+                connection.rollback()
+                raise
+
+            if rejets and len(refus):
+                refus.to_csv(rejets, mode='a', index=False, header=not os.path.exists(rejets))
+            lignes_session += len(df)
+            duree_lot = time.perf_counter() - debut_lot
+            print(f"  ✓ {lignes} lignes: {len(lignes_triages)} importées, {len(refus)} rejetées, "
+                  f"{nb_nouveaux} nouveaux patients • {len(df) / duree_lot:,.0f} lignes/s")
+
+        if definitions:
+            recreer_index(cursor, definitions)
+        enregistrer_reprise(cursor, source, lignes, importes, rejetes, termine=True)
+        connection.commit()
+    finally:
+        connection.close()
+
+    duree = time.perf_counter() - debut
+    print(f"✅ {importes} triages importés, {rejetes} lignes rejetées en {duree:.1f}s "
+          f"({lignes_session / duree if duree else 0:,.0f} lignes/s)")
+    return importes, rejetes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import en masse de triages historiques")
+    parser.add_argument('fichier')
+    parser.add_argument('--source', help="Nom de la reprise (par défaut le nom du fichier)")
+    parser.add_argument('--taille-lot', type=int, default=5000)
+    parser.add_argument('--service', help=f"Service des triages importés (défaut: {app.SERVICE_DEFAUT})")
+    parser.add_argument('--utilisateur', type=int, default=1, help="Évaluateur enregistré pour les triages importés")
+    parser.add_argument('--date', help="Date des triages sans date_triage (défaut: maintenant)")
+    parser.add_argument('--defaut-tabagisme', choices=list(CODES_TABAGISME),
+                        help="Remplace les valeurs de smoking_status hors énumération (ex: 'Unknown')")
+    parser.add_argument('--rescorer', action='store_true',
+                        help="Niveau du modèle même si le fichier contient un niveau historique")
+    parser.add_argument('--differer-index', action='store_true',
+                        help="Supprimer les index secondaires de triages pendant l'import "
+                             "(refusé si des cas ne sont pas terminés)")
+    parser.add_argument('--recommencer', action='store_true', help="Ignorer la progression enregistrée")
+    parser.add_argument('--rejets', help="Fichier CSV recevant les lignes rejetées et leur motif")
+    args = parser.parse_args()
+
+    app.load_ai_model()
+    try:
+        date_defaut = pd.to_datetime(args.date).to_pydatetime() if args.date else None
+        importer(args.fichier, args.source, args.taille_lot, args.service, args.utilisateur, date_defaut,
+                 args.defaut_tabagisme, args.rescorer, args.differer_index, args.recommencer, args.rejets)
+    except (OSError, ValueError, RuntimeError, app.Error) as e:
+        print(f"❌ Import interrompu: {e} (relancer la même commande pour reprendre)")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+USE medicaal_triage_ai;
+
+-- ========================================
+-- MISE À NIVEAU D'UNE BASE EXISTANTE
+-- ========================================
+-- database.sql crée directement le schéma final. Ce script amène au même
+-- schéma une base créée par une version antérieure de database.sql, sans
+-- perte de données. À exécuter une seule fois, dans l'ordre.
+
+-- ========================================
+-- 1. TABLE DES TRIAGES
+-- ========================================
+-- Service de l'évaluateur, contributions du modèle et nouveaux index
+ALTER TABLE triages
+    ADD COLUMN service VARCHAR(100) NOT NULL DEFAULT 'Urgences' AFTER utilisateur_id,
+    ADD COLUMN contributions JSON NULL AFTER probabilites,
+    ADD INDEX idx_patient_date (patient_id, date_triage, id),
+    ADD INDEX idx_fin_prise_en_charge (date_fin_prise_en_charge, id),
+    ADD INDEX idx_service_attente (service, statut, priorite, score_urgence DESC, date_triage),
+    ADD INDEX idx_service_niveau (service, niveau_triage),
+    ADD INDEX idx_service_patient (service, patient_id),
+    ADD INDEX idx_service_modification (service, date_modification),
+    -- Filigrane des réponses conditionnelles (MAX lu sur l'index)
+    ADD INDEX idx_date_modification (date_modification),
+    -- idx_patient_date en reprend le préfixe
+    DROP INDEX idx_patient_id;
+
+UPDATE triages t JOIN utilisateurs u ON t.utilisateur_id = u.id
+SET t.service = COALESCE(u.service, 'Urgences');
+
+-- Si database_partitionnement.sql a déjà été appliqué, l'archive doit garder
+-- les mêmes colonnes dans le même ordre (lectures en UNION ALL):
+-- ALTER TABLE triages_archive
+--     ADD COLUMN service VARCHAR(100) NOT NULL DEFAULT 'Urgences' AFTER utilisateur_id,
+--     ADD COLUMN contributions JSON NULL AFTER probabilites,
+--     ADD INDEX idx_patient_date (patient_id, date_triage, id),
+--     DROP INDEX idx_patient_id;
+-- UPDATE triages_archive t JOIN utilisateurs u ON t.utilisateur_id = u.id
+-- SET t.service = COALESCE(u.service, 'Urgences');
+
+-- ========================================
+-- 2. TABLE DES PATIENTS
+-- ========================================
+-- Filigrane des réponses conditionnelles (MAX lu sur l'index)
+ALTER TABLE patients ADD INDEX idx_date_modification (date_modification);
+
+-- ========================================
+-- 3. FILE D'ATTENTE PAR SERVICE
+-- ========================================
+DROP PROCEDURE IF EXISTS GetPriorityQueue;
+
+DELIMITER //
+
+CREATE PROCEDURE GetPriorityQueue(IN p_service VARCHAR(100))
+BEGIN
+    SELECT
+        t.id as triage_id,
+        t.niveau_triage,
+        t.date_triage,
+        t.score_urgence,
+        t.priorite,
+        p.nom,
+        p.prenom,
+        p.sexe,
+        t.age,
+        u.nom as evaluateur_nom,
+        u.prenom as evaluateur_prenom,
+        u.role as evaluateur_role,
+        t.statut
+    FROM triages t
+    JOIN patients p ON t.patient_id = p.id
+    JOIN utilisateurs u ON t.utilisateur_id = u.id
+    WHERE t.service = p_service AND t.statut = 'en_attente'
+    ORDER BY t.priorite ASC, t.score_urgence DESC, t.date_triage ASC;
+END //
+
+DELIMITER ;
+
+-- ========================================
+-- 4. NOUVELLES TABLES
+-- ========================================
+-- Mêmes définitions que les sections 10 à 12 de database.sql
+CREATE TABLE IF NOT EXISTS analytique_rollup (
+    service VARCHAR(100) NOT NULL DEFAULT 'Urgences',
+    heure DATETIME NOT NULL,
+    niveau_triage ENUM('red', 'orange', 'yellow', 'green') NOT NULL,
+    utilisateur_id INT NOT NULL,
+    nb INT NOT NULL DEFAULT 0,
+    nb_pris_en_charge INT NOT NULL DEFAULT 0,
+    somme_attente_s DOUBLE NOT NULL DEFAULT 0,
+    somme_traitement_s DOUBLE NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (service, heure, niveau_triage, utilisateur_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS analytique_histogramme (
+    service VARCHAR(100) NOT NULL DEFAULT 'Urgences',
+    heure DATETIME NOT NULL,
+    niveau_triage ENUM('red', 'orange', 'yellow', 'green') NOT NULL,
+    utilisateur_id INT NOT NULL,
+    metrique ENUM('attente', 'traitement') NOT NULL,
+    classe TINYINT NOT NULL,
+    nb INT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (service, heure, niveau_triage, utilisateur_id, metrique, classe)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS analytique_etat (
+    id INT PRIMARY KEY,
+    derniere_fin TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:01',
+    dernier_id INT NOT NULL DEFAULT 0,
+    date_execution TIMESTAMP NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO analytique_etat (id) VALUES (1);
+
+CREATE TABLE IF NOT EXISTS evenements_sequence (
+    service VARCHAR(100) PRIMARY KEY,
+    valeur BIGINT NOT NULL DEFAULT 0,
+    seq_purge BIGINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS triages_evenements (
+    service VARCHAR(100) NOT NULL,
+    seq BIGINT NOT NULL,
+    triage_id INT NOT NULL,
+    type_evenement ENUM('creation', 'statut') NOT NULL,
+    statut ENUM('en_attente', 'en_cours', 'termine') NOT NULL,
+    niveau_triage ENUM('red', 'orange', 'yellow', 'green') NOT NULL,
+    priorite INT NOT NULL,
+    score_urgence FLOAT NOT NULL,
+    utilisateur_id INT NULL,
+    date_evenement TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (service, seq),
+    INDEX idx_triage_seq (triage_id, seq),
+    INDEX idx_date_evenement (date_evenement)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- État initial du journal: un événement de création par triage non terminé
+INSERT INTO triages_evenements (
+    service, seq, triage_id, type_evenement, statut, niveau_triage, priorite, score_urgence, utilisateur_id
+)
+SELECT service, ROW_NUMBER() OVER (PARTITION BY service ORDER BY date_triage, id), id, 'creation',
+       statut, niveau_triage, priorite, score_urgence, utilisateur_id
+FROM triages
+WHERE statut <> 'termine';
+
+INSERT INTO evenements_sequence (service, valeur)
+SELECT service, MAX(seq) FROM triages_evenements GROUP BY service;
+
+CREATE TABLE IF NOT EXISTS imports_reprise (
+    source VARCHAR(255) PRIMARY KEY,
+    lignes BIGINT NOT NULL DEFAULT 0,
+    nb_importes BIGINT NOT NULL DEFAULT 0,
+    nb_rejetes BIGINT NOT NULL DEFAULT 0,
+    index_differes TEXT NULL,
+    termine BOOLEAN NOT NULL DEFAULT FALSE,
+    date_debut TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    date_maj TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+SELECT '✅ BASE MISE À NIVEAU' as Status;
@@ -0,0 +1,246 @@
+"""
+Backend d'inférence optionnel : le modèle tourne dans un pool de processus.
+
+Les tableaux du modèle (noeuds de tous les arbres de la forêt, paramètres du
+scaler) sont copiés une seule fois dans un bloc de mémoire partagée ; chaque
+worker les lit sans copie et parcourt toutes les forêts en numpy. Les modèles
+qui ne sont pas des forêts sont placés sérialisés dans ce même bloc.
+
+Activation : TRIAGE_INFERENCE=pool (TRIAGE_INFERENCE_WORKERS pour la taille).
+"""
+import itertools
+import multiprocessing as mp
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def compiler_modele(model, scaler):
+    """Aplatir le modèle en tableaux numpy contigus"""
+    tableaux = {
+        'mean': np.asarray(scaler.mean_, dtype=np.float64),
+        'scale': np.asarray(scaler.scale_, dtype=np.float64),
+    }
+    if hasattr(model, 'estimators_') and hasattr(model.estimators_[0], 'tree_'):
+        arbres = [e.tree_ for e in model.estimators_]
+        tailles = np.array([t.node_count for t in arbres])
+        decalages = np.concatenate([[0], np.cumsum(tailles)[:-1]])
+
+        gauche, droite = [], []
+        for arbre, decalage in zip(arbres, decalages):
+            feuille = arbre.children_left == -1
+            # Indices globaux ; une feuille pointe sur elle-même
+            noeuds = np.arange(arbre.node_count) + decalage
+            gauche.append(np.where(feuille, noeuds, arbre.children_left + decalage))
+            droite.append(np.where(feuille, noeuds, arbre.children_right + decalage))
+
+        valeurs = np.concatenate([t.value[:, 0, :] for t in arbres])
+        valeurs = valeurs / valeurs.sum(axis=1, keepdims=True)
+
+        tableaux.update({
+            'racines': decalages.astype(np.int64),
+            'gauche': np.concatenate(gauche).astype(np.int64),
+            'droite': np.concatenate(droite).astype(np.int64),
+            'feature': np.concatenate([np.maximum(t.feature, 0) for t in arbres]).astype(np.int64),
+            'seuil': np.concatenate([t.threshold for t in arbres]).astype(np.float64),
+            'valeurs': valeurs.astype(np.float64),
+            'profondeur': np.array([max(t.max_depth for t in arbres)], dtype=np.int64),
+        })
+    else:
+        tableaux['modele_pickle'] = np.frombuffer(pickle.dumps(model), dtype=np.uint8)
+    return tableaux
+
+
+def probabilites_foret(t, X_scaled):
+    """predict_proba de la forêt, vectorisé sur les lignes et sur les arbres"""
+    # Les arbres scikit-learn comparent en float32
+    X32 = X_scaled.astype(np.float32)
+    lignes = np.arange(len(X32))[:, None]
+    noeuds = np.broadcast_to(t['racines'], (len(X32), len(t['racines']))).copy()
+    for _ in range(int(t['profondeur'][0])):
+        a_gauche = X32[lignes, t['feature'][noeuds]] <= t['seuil'][noeuds]
+        noeuds = np.where(a_gauche, t['gauche'][noeuds], t['droite'][noeuds])
+    return t['valeurs'][noeuds].mean(axis=1)
+
+
+def _creer_bloc(tableaux):
+    taille = sum(a.nbytes for a in tableaux.values())
+    shm = shared_memory.SharedMemory(create=True, size=max(taille, 1))
+    descripteur = {}
+    decalage = 0
+    for nom, a in tableaux.items():
+        vue = np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf, offset=decalage)
+        vue[...] = a
+        descripteur[nom] = (a.dtype.str, a.shape, decalage)
+        decalage += a.nbytes
+    return shm, descripteur
+
+
+def _ouvrir_bloc(nom_shm, descripteur):
+    shm = shared_memory.SharedMemory(name=nom_shm)
+    tableaux = {
+        nom: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=decalage)
+        for nom, (dtype, shape, decalage) in descripteur.items()
+    }
+    return shm, tableaux
+
+
+def _boucle_worker(nom_shm, descripteur, taches, resultats, worker_id):
+    shm, t = _ouvrir_bloc(nom_shm, descripteur)
+    modele = pickle.loads(t['modele_pickle'].tobytes()) if 'modele_pickle' in t else None
+    try:
+        while True:
+            tache = taches.get()
+            if tache is None:
+                break
+            req_id, brut, nb_colonnes = tache
+            try:
+                X = np.frombuffer(brut, dtype=np.float64).reshape(-1, nb_colonnes)
+                X_scaled = (X - t['mean']) / t['scale']
+                if modele is None:
+                    proba = probabilites_foret(t, X_scaled)
+                else:
+                    proba = modele.predict_proba(X_scaled)
+                resultats.put((req_id, worker_id, proba.tobytes(), proba.shape, None))
+            except Exception as e:
+                resultats.put((req_id, worker_id, None, None, str(e)))
+    finally:
+        del t
+        shm.close()
+
+
+class PoolInference:
+    """Pool de workers d'inférence avec surveillance et redémarrage"""
+
+    def __init__(self, model, scaler, nb_workers=None, timeout=2.0):
+        self.nb_workers = nb_workers or max(1, mp.cpu_count() - 1)
+        self.timeout = timeout
+        self._ctx = mp.get_context('spawn')
+        self._shm, self._descripteur = _creer_bloc(compiler_modele(model, scaler))
+        self._resultats = self._ctx.Queue()
+        self._workers = [None] * self.nb_workers
+        self._taches = [None] * self.nb_workers
+        self._en_cours = {}  # req_id -> (worker_id, future, tache)
+        # Protège _en_cours et stats, mis à jour par les threads des requêtes et du collecteur
+        self._verrou = threading.Lock()
+        self._compteur = itertools.count()
+        self._tourniquet = itertools.cycle(range(self.nb_workers))
+        self._actif = True
+        self.stats = {'requetes': 0, 'erreurs': 0, 'redemarrages': 0, 'latence_totale_ms': 0.0}
+
+        for worker_id in range(self.nb_workers):
+            self._demarrer_worker(worker_id)
+
+        threading.Thread(target=self._collecter, daemon=True, name='inference-collecteur').start()
+        threading.Thread(target=self._surveiller, daemon=True, name='inference-surveillance').start()
+
+    def _demarrer_worker(self, worker_id):
+        self._taches[worker_id] = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_boucle_worker,
+            args=(self._shm.name, self._descripteur, self._taches[worker_id], self._resultats, worker_id),
+            daemon=True,
+            name=f'inference-{worker_id}'
+        )
+        process.start()
+        self._workers[worker_id] = process
+
+    def _collecter(self):
+        while self._actif:
+            try:
+                req_id, worker_id, brut, shape, erreur = self._resultats.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            with self._verrou:
+                entree = self._en_cours.pop(req_id, None)
+                if entree is not None and erreur:
+                    self.stats['erreurs'] += 1
+            # Réponse arrivée après l'expiration de la requête
+            if entree is None:
+                continue
+            future = entree[1]
+            if erreur:
+                future.set_exception(RuntimeError(erreur))
+            else:
+                future.set_result(np.frombuffer(brut, dtype=np.float64).reshape(shape))
+
+    def _surveiller(self):
+        while self._actif:
+            time.sleep(1.0)
+            for worker_id, process in enumerate(self._workers):
+                if process.is_alive() or not self._actif:
+                    continue
+                print(f"⚠️ Worker d'inférence {worker_id} arrêté (code {process.exitcode}), redémarrage...")
+                self._demarrer_worker(worker_id)
+                # Les requêtes perdues avec le worker sont renvoyées au nouveau
+                with self._verrou:
+                    self.stats['redemarrages'] += 1
+                    perdues = [(r, e) for r, e in self._en_cours.items() if e[0] == worker_id]
+                for req_id, (_, future, tache) in perdues:
+                    self._taches[worker_id].put(tache)
+
+    def soumettre(self, X):
+        """Soumettre un lot (n x 16, non normalisé) ; renvoie un Future de probabilités"""
+        return self._soumettre(X)[1]
+
+    def _soumettre(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        req_id = next(self._compteur)
+        worker_id = next(self._tourniquet)
+        tache = (req_id, X.tobytes(), X.shape[1])
+        future = Future()
+        with self._verrou:
+            self._en_cours[req_id] = (worker_id, future, tache)
+        self._taches[worker_id].put(tache)
+        return req_id, future
+
+    def predire_proba(self, X):
+        debut = time.perf_counter()
+        req_id, future = self._soumettre(X)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # La requête n'est plus attendue: elle ne doit pas rester dans _en_cours
+            with self._verrou:
+                self._en_cours.pop(req_id, None)
+                self.stats['erreurs'] += 1
+            raise
+        finally:
+            with self._verrou:
+                self.stats['requetes'] += 1
+                self.stats['latence_totale_ms'] += (time.perf_counter() - debut) * 1000
+
+    def sante(self):
+        with self._verrou:
+            stats = dict(self.stats)
+            en_attente = len(self._en_cours)
+        return {
+            'workers': self.nb_workers,
+            'workers_actifs': sum(p.is_alive() for p in self._workers),
+            'en_attente': en_attente,
+            'requetes': stats['requetes'],
+            'erreurs': stats['erreurs'],
+            'redemarrages': stats['redemarrages'],
+            'latence_moyenne_ms': round(stats['latence_totale_ms'] / stats['requetes'], 2)
+            if stats['requetes'] else None
+        }
+
+    def arreter(self):
+        """Arrêter les workers et libérer la mémoire partagée (appel répété sans effet)"""
+        if not self._actif:
+            return
+        self._actif = False
+        for worker_id, process in enumerate(self._workers):
+            if process.is_alive():
+                self._taches[worker_id].put(None)
+        for process in self._workers:
+            process.join(timeout=2)
+        self._shm.close()
+        self._shm.unlink()
@@ -0,0 +1,82 @@
+"""
+Profil du temps d'import de l'application (démarrage à froid).
+
+Lance `python -X importtime -c "import app"` dans un processus neuf, affiche
+les modules les plus coûteux (temps cumulé) et sort en erreur si l'import
+dépasse le budget ou si une bibliothèque lourde est chargée à l'import :
+elles ne doivent l'être qu'au premier usage ou par app.prechauffer().
+Les mêmes contrôles sont exécutés par la suite de tests (test_demarrage.py).
+
+Usage :
+    python profil_demarrage.py
+    python profil_demarrage.py --budget-ms 500 --top 30
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Bibliothèques qui ne doivent pas être importées avec app
+MODULES_LOURDS = ('numpy', 'pandas', 'sklearn', 'scipy', 'joblib', 'mysql', 'reportlab')
+
+BUDGET_MS = float(os.environ.get('TRIAGE_BUDGET_DEMARRAGE_MS', '800'))
+
+
+def mesurer_import(module):
+    """Temps cumulé (µs) par module importé, lu sur la sortie de -X importtime"""
+    resultat = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True
+    )
+    if resultat.returncode != 0:
+        raise RuntimeError(resultat.stderr.strip().splitlines()[-1] if resultat.stderr.strip() else "import impossible")
+
+    cumuls = {}
+    for ligne in resultat.stderr.splitlines():
+        if not ligne.startswith('import time:') or 'imported package' in ligne:
+            continue
+        _, cumul, nom = ligne[len('import time:'):].split('|')
+        cumuls[nom.strip()] = int(cumul)
+    return cumuls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps d'import de l'application")
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS)
+    parser.add_argument('--repetitions', type=int, default=3,
+                        help="Imports mesurés (la médiane est comparée au budget)")
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        mesures = [mesurer_import(args.module) for _ in range(max(1, args.repetitions))]
+    except RuntimeError as e:
+        print(f"❌ Import de {args.module} impossible: {e}")
+        return 1
+
+    cumuls = mesures[-1]
+    print(f"{'cumulé (ms)':>12}  module")
+    for nom, cumul in sorted(cumuls.items(), key=lambda m: m[1], reverse=True)[:args.top]:
+        print(f"{cumul / 1000:>12.1f}  {nom}")
+
+    total = statistics.median(m[args.module] for m in mesures) / 1000
+    print(f"\n⏱️ Import de {args.module}: {total:.1f} ms (médiane de {len(mesures)})")
+
+    ok = True
+    lourds = sorted({nom.split('.')[0] for nom in cumuls} & set(MODULES_LOURDS))
+    if lourds:
+        print(f"❌ Bibliothèques lourdes chargées à l'import: {', '.join(lourds)}")
+        ok = False
+    if total > args.budget_ms:
+        print(f"❌ Budget dépassé: {total:.1f} ms > {args.budget_ms} ms")
+        ok = False
+    if ok:
+        print(f"✅ Dans le budget de {args.budget_ms} ms, sans bibliothèque lourde")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
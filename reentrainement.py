@@ -0,0 +1,248 @@
+"""
+Réentraînement hors-mémoire du modèle de triage à partir de la table `triages`.
+
+Les lignes sont lues par lots de taille fixe, paginés sur la clé primaire
+(id > dernier id lu) : la mémoire utilisée dépend de la taille d'un lot, pas de
+celle de la table, et aucun résultat ni instantané de lecture ne reste ouvert
+sur le serveur pendant l'apprentissage d'un lot. Deux apprenants sont disponibles :
+
+- `sgd`   : régression logistique incrémentale (SGDClassifier.partial_fit)
+- `foret` : forêt aléatoire en warm-start, quelques arbres ajoutés par lot
+
+Usage :
+    python reentrainement.py --apprenant foret --taille-lot 20000
+    TRIAGE_MODELE_DIR=artefacts/20250130_120000 python app.py
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler, LabelEncoder
+
+from app import get_db_connection, FICHIERS_MODELE, FEATURES_MODELE, CODES_TABAGISME
+from derive import construire_reference, sauvegarder_reference
+
+CLASSES_TRIAGE = ['green', 'orange', 'red', 'yellow']
+
+# id, puis les colonnes de `triages` dans l'ordre de FEATURES_MODELE, suivies de la cible
+REQUETE_LOT_TRIAGES = """
+    SELECT id, age, sexe_code, chest_pain_type, blood_pressure, cholesterol,
+           max_heart_rate, exercise_angina, plasma_glucose, skin_thickness,
+           insulin, bmi, diabetes_pedigree, hypertension, heart_disease,
+           residence_type, smoking_status, niveau_triage
+    FROM triages
+    WHERE id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+NB_COLONNES_NUMERIQUES = 14
+
+# Lignes tirées au hasard pendant la passe 1 pour la référence de dérive
+TAILLE_ECHANTILLON_REFERENCE = 20000
+
+
+def encoder_lot(lignes):
+    """Construire la matrice 16 colonnes (même encodage que predire_triage_patient) et la cible"""
+    brut = np.array(lignes, dtype=object)
+    X = np.empty((len(lignes), len(FEATURES_MODELE)), dtype=np.float64)
+    X[:, :NB_COLONNES_NUMERIQUES] = brut[:, :NB_COLONNES_NUMERIQUES].astype(np.float64)
+    X[:, 14] = brut[:, 14] == 'Urban'
+    X[:, 15] = [CODES_TABAGISME.get(v, 0) for v in brut[:, 15]]
+    y = brut[:, 16].astype(str)
+    return X, y
+
+
+def iterer_lots(taille_lot):
+    """Parcourir `triages` par pages sur l'id, un lot encodé à la fois"""
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError("Connexion à la base de données impossible")
+    try:
+        cursor = connection.cursor()
+        dernier_id = 0
+        while True:
+            cursor.execute(REQUETE_LOT_TRIAGES, (dernier_id, taille_lot))
+            lignes = cursor.fetchall()
+            # Fin de la transaction de lecture avant l'apprentissage du lot
+            connection.rollback()
+            if not lignes:
+                break
+            dernier_id = lignes[-1][0]
+            yield encoder_lot([ligne[1:] for ligne in lignes])
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def premiere_passe(taille_lot):
+    """Ajuster le scaler, compter les classes et échantillonner la table sans la charger"""
+    scaler = StandardScaler()
+    comptes = dict.fromkeys(CLASSES_TRIAGE, 0)
+    nb_lots = 0
+    rng = np.random.default_rng(42)
+    echantillon = np.empty((TAILLE_ECHANTILLON_REFERENCE, len(FEATURES_MODELE)))
+    vus = 0
+    for X, y in iterer_lots(taille_lot):
+        scaler.partial_fit(X)
+        classes, nb = np.unique(y, return_counts=True)
+        for classe, n in zip(classes, nb):
+            comptes[classe] = comptes.get(classe, 0) + int(n)
+        # Échantillonnage par réservoir: chaque ligne de la table a la même chance d'être gardée
+        rangs = np.arange(vus, vus + len(X))
+        places = np.where(rangs < TAILLE_ECHANTILLON_REFERENCE, rangs, rng.integers(0, rangs + 1))
+        gardees = places < TAILLE_ECHANTILLON_REFERENCE
+        echantillon[places[gardees]] = X[gardees]
+        vus += len(X)
+        nb_lots += 1
+    return scaler, comptes, nb_lots, echantillon[:min(vus, TAILLE_ECHANTILLON_REFERENCE)]
+
+
+def poids_equilibres(comptes, target_encoder):
+    """Poids par classe encodée, équivalent à class_weight='balanced'"""
+    total = sum(comptes.values())
+    presentes = [c for c in target_encoder.classes_ if comptes.get(c)]
+    poids = np.ones(len(target_encoder.classes_))
+    for i, classe in enumerate(target_encoder.classes_):
+        if comptes.get(classe):
+            poids[i] = total / (len(presentes) * comptes[classe])
+    return poids
+
+
+def entrainer_sgd(taille_lot, scaler, target_encoder, poids_classes):
+    model = SGDClassifier(loss='log_loss', alpha=1e-4, random_state=42)
+    classes = np.arange(len(target_encoder.classes_))
+    corrects = evalues = 0
+
+    for X, y in iterer_lots(taille_lot):
+        X_scaled = scaler.transform(X)
+        y_encoded = target_encoder.transform(y)
+        # Validation progressive : chaque lot est évalué avant d'être appris
+        if hasattr(model, 'coef_'):
+            corrects += int((model.predict(X_scaled) == y_encoded).sum())
+            evalues += len(y_encoded)
+        model.partial_fit(X_scaled, y_encoded, classes=classes,
+                          sample_weight=poids_classes[y_encoded])
+
+    return model, (corrects / evalues if evalues else None)
+
+
+def entrainer_foret(taille_lot, scaler, target_encoder, nb_lots, n_arbres, max_depth):
+    """Forêt en warm-start : chaque lot apporte ses propres arbres"""
+    model = RandomForestClassifier(n_estimators=0, max_depth=max_depth, warm_start=True,
+                                   class_weight='balanced', random_state=42, n_jobs=-1)
+    arbres_par_lot = max(1, n_arbres // max(nb_lots, 1))
+    # Plus de lots que d'arbres : un lot sur `pas` suffit (bagging par lots)
+    pas = max(1, -(-nb_lots // n_arbres))
+    nb_classes = len(target_encoder.classes_)
+    corrects = evalues = 0
+    report_X, report_y = [], []
+
+    for i, (X, y) in enumerate(iterer_lots(taille_lot)):
+        if i % pas:
+            continue
+        X_scaled = scaler.transform(X)
+        y_encoded = target_encoder.transform(y)
+
+        if model.n_estimators:
+            corrects += int((model.predict(X_scaled) == y_encoded).sum())
+            evalues += len(y_encoded)
+
+        # Tous les arbres doivent voir toutes les classes : un lot incomplet est
+        # reporté sur le suivant (au plus 4 lots en mémoire)
+        report_X.append(X_scaled)
+        report_y.append(y_encoded)
+        y_cumul = np.concatenate(report_y)
+        if len(np.unique(y_cumul)) < nb_classes:
+            if len(report_y) < 4:
+                continue
+            print(f"⚠️ Lot {i}: classes manquantes, {len(y_cumul)} lignes ignorées")
+            report_X, report_y = [], []
+            continue
+
+        model.n_estimators += arbres_par_lot
+        model.fit(np.concatenate(report_X), y_cumul)
+        report_X, report_y = [], []
+
+    if not model.n_estimators:
+        raise RuntimeError("Aucun lot ne contient toutes les classes de triage")
+    return model, (corrects / evalues if evalues else None)
+
+
+def sauvegarder_artefacts(dossier, model, scaler, target_encoder, metadata, reference=None):
+    os.makedirs(dossier, exist_ok=True)
+    composants = {
+        'model': model,
+        'scaler': scaler,
+        'label_encoders': {},
+        'target_encoder': target_encoder
+    }
+    for nom, fichier in FICHIERS_MODELE.items():
+        joblib.dump(composants[nom], os.path.join(dossier, fichier))
+    with open(os.path.join(dossier, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    if reference:
+        sauvegarder_reference(dossier, reference)
+
+
+def reentrainer(apprenant='foret', taille_lot=20000, n_arbres=100, max_depth=15, sortie=None):
+    debut = time.time()
+    sortie = sortie or os.path.join('artefacts', datetime.now().strftime('%Y%m%d_%H%M%S'))
+
+    print("📊 Passe 1: normalisation et distribution des classes...")
+    scaler, comptes, nb_lots, echantillon = premiere_passe(taille_lot)
+    total = sum(comptes.values())
+    if not total:
+        raise RuntimeError("La table triages est vide")
+    print(f"  ✓ {total} triages en {nb_lots} lots: {comptes}")
+
+    target_encoder = LabelEncoder()
+    target_encoder.fit(CLASSES_TRIAGE)
+
+    print(f"🤖 Passe 2: apprentissage ({apprenant})...")
+    if apprenant == 'sgd':
+        model, precision = entrainer_sgd(taille_lot, scaler, target_encoder,
+                                         poids_equilibres(comptes, target_encoder))
+    else:
+        model, precision = entrainer_foret(taille_lot, scaler, target_encoder,
+                                           nb_lots, n_arbres, max_depth)
+
+    metadata = {
+        'date': datetime.now().isoformat(),
+        'apprenant': apprenant,
+        'taille_lot': taille_lot,
+        'nb_lignes': total,
+        'nb_lots': nb_lots,
+        'distribution': comptes,
+        'precision_progressive': precision,
+        'features': FEATURES_MODELE,
+        'duree_secondes': round(time.time() - debut, 1)
+    }
+    # Référence de dérive: l'échantillon et les niveaux que le nouveau modèle lui attribue
+    reference = construire_reference(
+        echantillon, target_encoder.inverse_transform(model.predict(scaler.transform(echantillon))), FEATURES_MODELE)
+    sauvegarder_artefacts(sortie, model, scaler, target_encoder, metadata, reference)
+
+    if precision is not None:
+        print(f"  ✓ Précision progressive: {precision * 100:.1f}%")
+    print(f"✅ Artefacts sauvegardés dans '{sortie}'")
+    print(f"   Pour les utiliser: TRIAGE_MODELE_DIR={sortie}")
+    return sortie
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Réentraîner le modèle de triage depuis la table triages")
+    parser.add_argument('--apprenant', choices=['foret', 'sgd'], default='foret')
+    parser.add_argument('--taille-lot', type=int, default=20000)
+    parser.add_argument('--arbres', type=int, default=100, help="Nombre total d'arbres visé (forêt)")
+    parser.add_argument('--profondeur', type=int, default=15, help="Profondeur maximale des arbres (forêt)")
+    parser.add_argument('--sortie', help="Dossier du nouveau jeu d'artefacts")
+    args = parser.parse_args()
+
+    reentrainer(args.apprenant, args.taille_lot, args.arbres, args.profondeur, args.sortie)
@@ -0,0 +1,346 @@
+"""
+Simulation à événements discrets d'un service d'urgences.
+
+Les arrivées suivent un profil horaire (patients par heure pour chacune des
+24 heures de la journée, multiplié par --charge). Chaque journée simulée est
+triée d'un seul lot par le chemin de prédiction de l'application
+(predire_triage_lot, utilisé aussi par predire_triage_patient). Les médecins
+prennent en charge les patients dans l'ordre de la file du dashboard
+(priorite, score_urgence DESC, date_triage), pour une durée de soins tirée
+selon le niveau.
+
+Le rapport donne la distribution des temps d'attente par niveau, l'occupation
+des médecins et le coût par heure simulée : CPU du triage et de la
+simulation, transactions du chemin réel (enregistrement, prise en charge,
+clôture). Avec --bd, ces écritures sont rejouées sur la base, dans un service
+dédié supprimé à la fin, pour mesurer leur durée et le nombre de requêtes SQL
+réellement exécutées (compteur Questions de la session MySQL).
+
+Usage :
+    python simulation.py --heures 2000 --medecins 6
+    python simulation.py --heures 2000 --charge 3 --profil profil.json
+    python simulation.py --heures 24 --bd
+"""
+import argparse
+import heapq
+import json
+import sys
+import time
+import uuid
+
+import numpy as np
+
+import app
+from donnees_synthetiques import patients_aleatoires
+from validation import SCHEMA_TRIAGE, CODES_TABAGISME, EnregistrementTriage
+
+# Arrivées par heure (0h ... 23h) d'un service d'urgences type
+PROFILS = {
+    'semaine': [3, 2.5, 2, 2, 2, 2.5, 4, 6, 8, 9, 9.5, 9, 8.5, 8.5, 8, 8, 8, 8.5, 9, 8.5, 7, 6, 5, 4],
+    'week-end': [5, 4.5, 4, 3, 2.5, 2.5, 3, 4, 6, 7, 8, 8.5, 8.5, 8, 8, 8, 8, 8.5, 9, 9, 8.5, 8, 7, 6],
+    'constant': [6] * 24,
+}
+
+# Durée des soins par niveau: (médiane en minutes, sigma de la loi log-normale)
+DUREES_SOINS = {'red': (90, 0.5), 'orange': (60, 0.5), 'yellow': (40, 0.6), 'green': (20, 0.6)}
+
+SERVICE_SIMULATION = 'Simulation'
+NIVEAUX = ('red', 'orange', 'yellow', 'green')
+
+ARRIVEE, FIN, JOURNEE = 0, 1, 2
+
+
+def charger_profil(nom):
+    """Profil nommé, ou fichier JSON contenant la liste des 24 taux horaires"""
+    if nom in PROFILS:
+        return PROFILS[nom]
+    with open(nom) as f:
+        profil = json.load(f)
+    if len(profil) != 24 or any(taux < 0 for taux in profil):
+        raise ValueError("Le profil doit contenir 24 taux horaires positifs")
+    return profil
+
+
+def enregistrement_depuis_vecteur(vecteur):
+    """EnregistrementTriage (types Python) à partir d'un vecteur de FEATURES_MODELE"""
+    valeurs = [int(round(v)) if type_champ in ('entier', 'binaire') else round(float(v), 2)
+               for (_, type_champ, _), v in zip(SCHEMA_TRIAGE[:14], vecteur)]
+    valeurs.append('Urban' if vecteur[14] else 'Rural')
+    valeurs.append(list(CODES_TABAGISME)[int(vecteur[15])])
+    return EnregistrementTriage(*valeurs)
+
+
+def requetes_session(connection):
+    """Compteur des requêtes exécutées par la session (SHOW SESSION STATUS comprise)"""
+    cursor = connection.cursor()
+    cursor.execute("SHOW SESSION STATUS LIKE 'Questions'")
+    questions = int(cursor.fetchone()[1])
+    cursor.close()
+    return questions
+
+
+class RejeuBD:
+    """Rejoue les écritures de la simulation sur la base, dans un service dédié.
+
+    Les patients créés portent un nom propre à l'exécution : la recherche par
+    (nom, prenom) de enregistrer_triage ne retrouve jamais un patient réel, et
+    le nettoyage ne supprime que les triages et patients créés par le rejeu.
+    """
+
+    def __init__(self, connection, utilisateur_id):
+        self.connection = connection
+        self.utilisateur_id = utilisateur_id
+        self.nom_patients = f"{SERVICE_SIMULATION} {uuid.uuid4().hex[:12]}"
+        self.triages = []
+        self.duree = 0.0
+        self.nb_patients = 0
+        self._questions = requetes_session(connection)
+        self.requetes = 0
+
+    def compter_requetes(self):
+        """Requêtes SQL exécutées depuis le début du rejeu, hors mesure du compteur"""
+        questions = requetes_session(self.connection)
+        self.requetes += questions - self._questions - 1
+        self._questions = questions
+        return self.requetes
+
+    def _mesurer(self, fonction, *args):
+        debut = time.perf_counter()
+        try:
+            return fonction(*args)
+        finally:
+            self.duree += time.perf_counter() - debut
+
+    def arrivee(self, vecteur, niveau, probabilites, score, priorite):
+        def ecrire():
+            self.nb_patients += 1
+            with app.app.test_request_context():
+                app.session['user_id'] = self.utilisateur_id
+                app.session['service'] = SERVICE_SIMULATION
+                self.triages.append(app.enregistrer_triage(
+                    self.connection, enregistrement_depuis_vecteur(vecteur), self.nom_patients,
+                    f"Patient {self.nb_patients}", niveau, probabilites, None, score, priorite))
+            self.connection.commit()
+        self._mesurer(ecrire)
+
+    def prise_en_charge(self):
+        triage = self._mesurer(app.prendre_patient_suivant, self.connection, SERVICE_SIMULATION,
+                               self.utilisateur_id)
+        return triage['triage_id'] if triage else None
+
+    def fin(self, triage_id):
+        def ecrire():
+            app.changer_statut(self.connection, triage_id, 'termine', self.utilisateur_id, SERVICE_SIMULATION)
+            self.connection.commit()
+        self._mesurer(ecrire)
+
+    def nettoyer(self, taille_lot=1000):
+        self.connection.rollback()
+        cursor = self.connection.cursor()
+        for i in range(0, len(self.triages), taille_lot):
+            ids = self.triages[i:i + taille_lot]
+            marqueurs = ", ".join(["%s"] * len(ids))
+            cursor.execute(f"SELECT DISTINCT patient_id FROM triages WHERE id IN ({marqueurs})", ids)
+            patients = [ligne[0] for ligne in cursor.fetchall()]
+            cursor.execute(f"DELETE FROM triages WHERE id IN ({marqueurs})", ids)
+            if patients:
+                cursor.execute(f"""
+                    DELETE FROM patients WHERE nom = %s AND id IN ({", ".join(["%s"] * len(patients))})
+                """, [self.nom_patients] + patients)
+            self.connection.commit()
+        cursor.execute("DELETE FROM triages_evenements WHERE service = %s", (SERVICE_SIMULATION,))
+        cursor.execute("DELETE FROM evenements_sequence WHERE service = %s", (SERVICE_SIMULATION,))
+        self.connection.commit()
+        cursor.close()
+
+
+def simuler(heures, medecins, profil, charge=1.0, graine=0, rejeu=None):
+    """Dérouler la simulation et renvoyer les mesures brutes"""
+    rng = np.random.default_rng(graine)
+    evenements = [(0.0, 0, JOURNEE, 0)]
+    file = []
+    sequence = 1
+    libres = medecins
+    occupation = 0.0
+    file_max = 0
+    attentes = {niveau: [] for niveau in NIVEAUX}
+    compteurs = {'arrivee': 0, 'prise_en_charge': 0, 'fin': 0}
+    cpu_triage = 0.0
+    fin_simulation = heures * 60.0
+
+    debut_cpu = time.process_time()
+    while evenements:
+        instant, _, type_evenement, donnees = heapq.heappop(evenements)
+        if instant >= fin_simulation:
+            break
+
+        if type_evenement == JOURNEE:
+            # Arrivées de la journée (Poisson par heure), triées en un seul lot
+            jour = donnees
+            heures_jour = range(jour * 24, min(heures, jour * 24 + 24))
+            instants = np.concatenate([
+                h * 60.0 + np.sort(rng.uniform(0, 60, rng.poisson(profil[h % 24] * charge)))
+                for h in heures_jour
+            ])
+            if len(instants):
+                X = patients_aleatoires(len(instants), graine=rng.integers(1 << 31))
+                debut = time.process_time()
+                triages = app.predire_triage_lot(X)
+                cpu_triage += time.process_time() - debut
+                for t, vecteur, triage in zip(instants, X, triages):
+                    heapq.heappush(evenements, (float(t), sequence, ARRIVEE, (vecteur, triage)))
+                    sequence += 1
+            if heures_jour.stop < heures:
+                heapq.heappush(evenements, (heures_jour.stop * 60.0, sequence, JOURNEE, jour + 1))
+                sequence += 1
+            continue
+
+        if type_evenement == ARRIVEE:
+            vecteur, (niveau, probabilites, score, priorite) = donnees
+            compteurs['arrivee'] += 1
+            if rejeu:
+                rejeu.arrivee(vecteur, niveau, probabilites, score, priorite)
+            # Même ordre que la file du dashboard: priorite, score_urgence DESC, date_triage
+            heapq.heappush(file, (priorite, -score, instant, sequence, niveau))
+            sequence += 1
+            file_max = max(file_max, len(file))
+        else:
+            compteurs['fin'] += 1
+            if rejeu and donnees is not None:
+                rejeu.fin(donnees)
+            libres += 1
+
+        while libres and file:
+            _, _, arrivee, _, niveau = heapq.heappop(file)
+            compteurs['prise_en_charge'] += 1
+            attentes[niveau].append(instant - arrivee)
+            mediane, sigma = DUREES_SOINS.get(niveau, (40, 0.6))
+            duree = float(rng.lognormal(np.log(mediane), sigma))
+            occupation += min(duree, fin_simulation - instant)
+            triage_id = rejeu.prise_en_charge() if rejeu else None
+            heapq.heappush(evenements, (instant + duree, sequence, FIN, triage_id))
+            sequence += 1
+            libres -= 1
+
+    return {
+        'attentes': attentes,
+        'restants': {niveau: sum(1 for *_, n in file if n == niveau) for niveau in NIVEAUX},
+        'compteurs': compteurs,
+        'file_max': file_max,
+        'occupation': occupation / (medecins * fin_simulation) if medecins else 0.0,
+        'cpu_triage': cpu_triage,
+        'cpu_total': time.process_time() - debut_cpu,
+    }
+
+
+def rapport(mesures, heures, rejeu=None):
+    """Distribution des attentes par niveau et coût par heure simulée"""
+    niveaux = {}
+    for niveau, attentes in mesures['attentes'].items():
+        valeurs = np.array(attentes)
+        stats = {'nb': len(valeurs), 'restants': mesures['restants'][niveau]}
+        if len(valeurs):
+            stats.update({
+                'moyenne': round(float(valeurs.mean()), 1),
+                'p50': round(float(np.percentile(valeurs, 50)), 1),
+                'p90': round(float(np.percentile(valeurs, 90)), 1),
+                'p99': round(float(np.percentile(valeurs, 99)), 1),
+                'max': round(float(valeurs.max()), 1),
+            })
+        niveaux[niveau] = stats
+
+    compteurs = mesures['compteurs']
+    cout = {
+        'cpu_triage_ms': round(mesures['cpu_triage'] * 1000 / heures, 3),
+        'cpu_total_ms': round(mesures['cpu_total'] * 1000 / heures, 3),
+        'transactions': round(sum(compteurs.values()) / heures, 1),
+    }
+    if rejeu:
+        cout['requetes_sql'] = round(rejeu.requetes / heures, 1)
+        cout['bd_ms'] = round(rejeu.duree * 1000 / heures, 1)
+
+    return {
+        'heures': heures,
+        'arrivees': compteurs['arrivee'],
+        'arrivees_par_heure': round(compteurs['arrivee'] / heures, 2),
+        'occupation_medecins': round(mesures['occupation'], 3),
+        'file_max': mesures['file_max'],
+        'attentes_minutes': niveaux,
+        'cout_par_heure': cout,
+    }
+
+
+def afficher(resultat):
+    print(f"\n🏥 {resultat['heures']} h simulées • {resultat['arrivees']} arrivées "
+          f"({resultat['arrivees_par_heure']}/h) • occupation médecins {resultat['occupation_medecins']:.0%} "
+          f"• file max {resultat['file_max']}")
+    print(f"\n{'niveau':>8} {'nb':>8} {'moy':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>9} {'restants':>9}")
+    for niveau, stats in resultat['attentes_minutes'].items():
+        if not stats['nb']:
+            print(f"{niveau:>8} {0:>8} {'-':>8} {'-':>8} {'-':>8} {'-':>8} {'-':>9} {stats['restants']:>9}")
+            continue
+        print(f"{niveau:>8} {stats['nb']:>8} {stats['moyenne']:>8} {stats['p50']:>8} {stats['p90']:>8} "
+              f"{stats['p99']:>8} {stats['max']:>9} {stats['restants']:>9}")
+    cout = resultat['cout_par_heure']
+    print(f"\n⏱️ Par heure simulée: CPU triage {cout['cpu_triage_ms']} ms • CPU total {cout['cpu_total_ms']} ms "
+          f"• {cout['transactions']} transactions")
+    if 'bd_ms' in cout:
+        print(f"🗄️ Mesuré sur la base: {cout['requetes_sql']} requêtes SQL (commits compris) "
+              f"en {cout['bd_ms']} ms par heure simulée")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulation de la file d'attente des urgences")
+    parser.add_argument('--heures', type=int, default=1000)
+    parser.add_argument('--medecins', type=int, default=4)
+    parser.add_argument('--profil', default='semaine',
+                        help=f"{', '.join(PROFILS)} ou fichier JSON de 24 taux horaires")
+    parser.add_argument('--charge', type=float, default=1.0, help="Multiplicateur des taux d'arrivée")
+    parser.add_argument('--graine', type=int, default=0)
+    parser.add_argument('--bd', action='store_true',
+                        help="Rejouer les écritures sur la base (service dédié, supprimé à la fin)")
+    parser.add_argument('--utilisateur', type=int, default=1, help="Médecin des écritures rejouées")
+    parser.add_argument('--json', action='store_true', help="Rapport au format JSON")
+    args = parser.parse_args()
+
+    if args.heures <= 0 or args.medecins < 0:
+        parser.error("--heures doit être positif et --medecins positif ou nul")
+    try:
+        profil = charger_profil(args.profil)
+    except (OSError, ValueError) as e:
+        print(f"❌ Profil invalide: {e}")
+        return 1
+
+    app.load_ai_model()
+
+    rejeu = None
+    if args.bd:
+        connection = app.get_db_connection()
+        if connection is None:
+            print("❌ Base de données indisponible")
+            return 1
+        rejeu = RejeuBD(connection, args.utilisateur)
+
+    debut = time.perf_counter()
+    try:
+        mesures = simuler(args.heures, args.medecins, profil, args.charge, args.graine, rejeu)
+        if rejeu:
+            rejeu.compter_requetes()
+    finally:
+        if rejeu:
+            rejeu.nettoyer()
+            rejeu.connection.close()
+    duree = time.perf_counter() - debut
+
+    resultat = rapport(mesures, args.heures, rejeu)
+    resultat['duree_secondes'] = round(duree, 2)
+    if args.json:
+        print(json.dumps(resultat, indent=2, ensure_ascii=False))
+    else:
+        afficher(resultat)
+        print(f"\n✅ Simulation terminée en {duree:.2f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+// Fonction pour supprimer une activité individuelle
+function deleteActivity(activityId) {
+    const activityElement = document.querySelector(`[data-activity-id="${activityId}"]`);
+    if (activityElement) {
+        // Animation de disparition
+        activityElement.classList.add('hiding');
+        
+        // Supprimer complètement après l'animation
+        setTimeout(() => {
+            activityElement.remove();
+            updateActivityCount();
+            showNotification('Activité supprimée', 'success');
+            
+            // Vérifier s'il reste des activités
+            const remainingActivities = document.querySelectorAll('.activity-item:not(.hidden)');
+            if (remainingActivities.length === 0) {
+                showEmptyState();
+            }
+        }, 300);
+    }
+}
+
+// Fonction pour effacer toutes les activités
+function clearAllActivities() {
+    if (confirm('Êtes-vous sûr de vouloir effacer toutes vos activités récentes ?')) {
+        const activityItems = document.querySelectorAll('.activity-item');
+        let delay = 0;
+        
+        activityItems.forEach((item, index) => {
+            setTimeout(() => {
+                item.classList.add('hiding');
+                setTimeout(() => {
+                    item.remove();
+                }, 300);
+            }, delay);
+            delay += 100; // Animation échelonnée
+        });
+        
+        setTimeout(() => {
+            showEmptyState();
+            showNotification('Toutes les activités ont été supprimées', 'success');
+        }, activityItems.length * 100 + 300);
+    }
+}
+
+// Mettre à jour le compteur d'activités
+function updateActivityCount() {
+    const activityCount = document.querySelectorAll('.activity-item:not(.hidden)').length;
+    const countElement = document.getElementById('activity-count');
+    if (countElement) {
+        countElement.textContent = `${activityCount} activité(s)`;
+    }
+}
+
+// Afficher l'état vide quand toutes les activités sont supprimées
+function showEmptyState() {
+    const activityList = document.getElementById('activity-list');
+    const activityHeader = document.querySelector('.activity-header');
+    const cardBody = activityList.parentElement;
+    
+    if (activityHeader) activityHeader.style.display = 'none';
+    if (activityList) activityList.style.display = 'none';
+    
+    const emptyState = document.createElement('div');
+    emptyState.className = 'empty-state';
+    emptyState.id = 'empty-state';
+    emptyState.innerHTML = `
+        <div>📋</div>
+        <h3>Aucune activité récente</h3>
+        <p>Vos patients pris en charge apparaîtront ici</p>
+        <a href="/triage" class="btn-action" style="margin-top: 15px; display: inline-block;">
+            🩺 Effectuer un triage
+        </a>
+    `;
+    
+    cardBody.appendChild(emptyState);
+}
+
+// Système de notifications
+function showNotification(message, type = 'success') {
+    const notification = document.getElementById('notification');
+    notification.textContent = message;
+    notification.className = `notification ${type}`;
+    notification.classList.add('show');
+    
+    setTimeout(() => {
+        notification.classList.remove('show');
+    }, 3000);
+}
+
+// Auto-refresh toutes les 30 secondes
+setInterval(function() {
+    location.reload();
+}, 30000);
+
+// Notification sonore pour les nouveaux cas critiques
+function checkForCriticalCases() {
+    const criticalCases = document.querySelectorAll('.patient-item.red').length;
+    if (criticalCases > 0) {
+        document.title = `(${criticalCases}) 🚨 Dashboard - Cas Critiques!`;
+    } else {
+        document.title = '📊 Dashboard - Système de Triage IA';
+    }
+}
+
+// Exécuter au chargement
+checkForCriticalCases();
+
+
+// Panneau des temps d'attente (lu dans les agrégats horaires)
+const NOMS_NIVEAUX = {red: '🔴 CRITIQUE', orange: '🟠 URGENT', yellow: '🟡 MODÉRÉ', green: '🟢 STABLE'};
+
+function formaterDuree(secondes) {
+    if (secondes === null || secondes === undefined) return '—';
+    if (secondes < 3600) return `${Math.round(secondes / 60)} min`;
+    return `${Math.floor(secondes / 3600)} h ${String(Math.round(secondes % 3600 / 60)).padStart(2, '0')}`;
+}
+
+function chargerAnalytique() {
+    const groupe = document.getElementById('analytique-groupe').value;
+    const corps = document.getElementById('analytique-corps');
+
+    fetch(`/api/analytique/attentes?groupe=${groupe}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.resultats || data.resultats.length === 0) {
+                corps.innerHTML = '<tr><td colspan="6">Aucune donnée sur la période</td></tr>';
+                return;
+            }
+            // Cellules en textContent: le nom de l'évaluateur est saisi à l'inscription
+            corps.replaceChildren();
+            data.resultats.forEach(r => {
+                let nom = r.groupe;
+                if (groupe === 'niveau') nom = NOMS_NIVEAUX[r.groupe] || r.groupe;
+                else if (groupe === 'evaluateur') nom = r.evaluateur || `#${r.groupe}`;
+                else nom = `${String(r.groupe).padStart(2, '0')}h`;
+                const ligne = corps.insertRow();
+                [
+                    nom,
+                    r.nb_termines,
+                    formaterDuree(r.attente.p50),
+                    formaterDuree(r.attente.p90),
+                    formaterDuree(r.traitement.p50),
+                    formaterDuree(r.traitement.p90)
+                ].forEach(valeur => {
+                    ligne.insertCell().textContent = valeur;
+                });
+            });
+        })
+        .catch(() => {
+            corps.innerHTML = '<tr><td colspan="6">Analyse indisponible</td></tr>';
+        });
+}
+
+chargerAnalytique();
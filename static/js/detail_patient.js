@@ -0,0 +1,99 @@
+// Dossier patient: la chronologie et les tendances sont chargées après la page
+const patientId = document.getElementById('patient').dataset.patientId;
+const NIVEAUX = {red: '🔴 CRITIQUE', orange: '🟠 URGENT', yellow: '🟡 MODÉRÉ', green: '🟢 STABLE'};
+const STATUTS = {en_attente: '⏳ En attente', en_cours: '🔄 En cours', termine: '✅ Terminé'};
+const CHAMPS = 'niveau_triage,score_urgence,statut,blood_pressure,max_heart_rate,plasma_glucose,evaluateur';
+
+let curseurSuivant = null;
+
+function formaterDate(iso) {
+    const d = new Date(iso);
+    return d.toLocaleDateString('fr-FR') + ' ' + d.toLocaleTimeString('fr-FR', {hour: '2-digit', minute: '2-digit'});
+}
+
+// Cellule construite avec textContent: les valeurs (nom de l'évaluateur...) ne sont jamais interprétées en HTML
+function cellule(ligne, texte, classeBadge, balise = 'span') {
+    const td = ligne.insertCell();
+    if (!classeBadge) {
+        td.textContent = texte;
+        return td;
+    }
+    const badge = document.createElement(balise);
+    if (classeBadge !== true) badge.className = classeBadge;
+    badge.textContent = texte;
+    td.appendChild(badge);
+    return td;
+}
+
+function chargerTimeline() {
+    const bouton = document.getElementById('charger-plus');
+    let url = `/api/patients/${patientId}/timeline?limite=20&champs=${CHAMPS}`;
+    if (curseurSuivant) url += `&curseur=${encodeURIComponent(curseurSuivant)}`;
+    bouton.disabled = true;
+
+    fetch(url)
+        .then(response => response.json())
+        .then(data => {
+            const corps = document.getElementById('timeline');
+            data.triages.forEach(t => {
+                const ligne = corps.insertRow();
+                cellule(ligne, formaterDate(t.date_triage));
+                cellule(ligne, NIVEAUX[t.niveau_triage] || t.niveau_triage, `niveau-badge ${t.niveau_triage}`);
+                cellule(ligne, `${t.score_urgence}%`, true, 'strong');
+                cellule(ligne, STATUTS[t.statut] || t.statut, `statut-badge ${t.statut}`);
+                cellule(ligne, `${t.blood_pressure} mmHg • ${t.max_heart_rate} bpm • ${t.plasma_glucose} mg/dl`);
+                cellule(ligne, t.evaluateur || '');
+            });
+            curseurSuivant = data.curseur_suivant;
+            bouton.style.display = curseurSuivant ? '' : 'none';
+            bouton.disabled = false;
+        })
+        .catch(() => {
+            bouton.disabled = false;
+        });
+}
+
+function tracer(dates, serie) {
+    const svg = document.getElementById('graphique');
+    const largeur = 800, hauteur = 250, marge = 20;
+    const valeurs = serie.min.concat(serie.max);
+    const bas = Math.min(...valeurs), haut = Math.max(...valeurs);
+    const etendue = haut - bas || 1;
+    const x = i => dates.length > 1 ? marge + i * (largeur - 2 * marge) / (dates.length - 1) : largeur / 2;
+    const y = v => hauteur - marge - (v - bas) * (hauteur - 2 * marge) / etendue;
+
+    // Bande min-max de chaque intervalle, puis la moyenne
+    const bande = serie.max.map((v, i) => `${x(i)},${y(v)}`)
+        .concat(serie.min.map((v, i) => `${x(i)},${y(v)}`).reverse()).join(' ');
+    const moyenne = serie.moy.map((v, i) => `${x(i)},${y(v)}`).join(' ');
+    svg.innerHTML = `
+        <polygon points="${bande}" fill="#3498db" fill-opacity="0.2"></polygon>
+        <polyline points="${moyenne}" fill="none" stroke="#2c3e50" stroke-width="2"></polyline>
+        ${serie.moy.map((v, i) => `<circle cx="${x(i)}" cy="${y(v)}" r="3" fill="#2c3e50"></circle>`).join('')}`;
+    return {bas, haut};
+}
+
+function chargerTendances() {
+    const mesure = document.getElementById('mesure').value;
+    const legende = document.getElementById('legende');
+
+    fetch(`/api/patients/${patientId}/tendances?mesures=${mesure}&points=100`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.points) {
+                legende.textContent = 'Aucune mesure';
+                return;
+            }
+            const {bas, haut} = tracer(data.dates, data.series[mesure]);
+            legende.textContent = `${formaterDate(data.dates[0])} → ${formaterDate(data.dates[data.dates.length - 1])}` +
+                ` • ${data.points} point(s) • min ${bas} / max ${haut}`;
+        })
+        .catch(() => {
+            legende.textContent = 'Tendances indisponibles';
+        });
+}
+
+if (document.getElementById('timeline')) {
+    chargerTendances();
+    chargerTimeline();
+}
@@ -0,0 +1,10 @@
+function resetFilters() {
+    // Réinitialiser tous les champs du formulaire
+    document.getElementById('niveau').value = '';
+    document.getElementById('date_debut').value = '';
+    document.getElementById('date_fin').value = '';
+    
+    // Rediriger vers la page sans paramètres pour afficher tous les résultats
+    window.location.href = window.location.pathname;
+}
+
@@ -0,0 +1,22 @@
+document.getElementById('triageForm').addEventListener('submit', function(e) {
+    // Afficher l'overlay de chargement
+    document.getElementById('loadingOverlay').style.display = 'flex';
+    document.getElementById('submitBtn').disabled = true;
+});
+
+// Validation en temps réel
+document.querySelectorAll('input, select').forEach(element => {
+    element.addEventListener('change', function() {
+        if (this.checkValidity()) {
+            this.style.borderColor = '#27ae60';
+        } else {
+            this.style.borderColor = '#e74c3c';
+        }
+    });
+});
+
+// Auto-focus sur le premier champ
+window.addEventListener('load', function() {
+    document.getElementById('nom').focus();
+});
+
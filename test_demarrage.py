@@ -0,0 +1,27 @@
+import os
+import statistics
+import subprocess
+import sys
+
+import pytest
+
+from profil_demarrage import BUDGET_MS, MODULES_LOURDS, mesurer_import
+
+# Sans les dépendances de l'application, `import app` échoue avant toute mesure
+pytest.importorskip('flask')
+
+DOSSIER = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_import_dans_le_budget():
+    mesures = [mesurer_import('app')['app'] / 1000 for _ in range(3)]
+    assert statistics.median(mesures) < BUDGET_MS
+
+
+def test_aucune_bibliotheque_lourde_a_l_import():
+    resultat = subprocess.run(
+        [sys.executable, '-c', 'import sys, app; print("\\n".join(sys.modules))'],
+        cwd=DOSSIER, capture_output=True, text=True, check=True
+    )
+    modules = {nom.split('.')[0] for nom in resultat.stdout.split()}
+    assert not modules & set(MODULES_LOURDS)
@@ -0,0 +1,43 @@
+import pytest
+
+from validation import ErreurValidation, valider
+
+DONNEES = {
+    'age': 54, 'gender': 1, 'chest_pain_type': 2, 'blood_pressure': 130,
+    'cholesterol': 240, 'max_heart_rate': 150, 'exercise_angina': 0,
+    'plasma_glucose': 110.5, 'skin_thickness': 20, 'insulin': 80, 'bmi': 27.3,
+    'diabetes_pedigree': 0.5, 'hypertension': 0, 'heart_disease': 0,
+    'Residence_type': 'Urban', 'smoking_status': 'never smoked',
+}
+
+
+def erreurs(**champs):
+    with pytest.raises(ErreurValidation) as e:
+        valider({**DONNEES, **champs})
+    return {erreur['champ']: erreur['code'] for erreur in e.value.erreurs}
+
+
+def test_donnees_valides():
+    enregistrement = valider(DONNEES)
+    assert enregistrement.age == 54
+    assert len(enregistrement.vecteur()) == 16
+
+
+def test_formulaire_en_texte():
+    enregistrement = valider({cle: str(valeur) for cle, valeur in DONNEES.items()})
+    assert enregistrement.blood_pressure == 130
+    assert enregistrement.bmi == 27.3
+
+
+def test_erreurs_collectees():
+    assert erreurs(age='abc', bmi=500, smoking_status=None) == {
+        'age': 'type', 'bmi': 'plage', 'smoking_status': 'requis'}
+
+
+@pytest.mark.parametrize('valeur', [10 ** 400, '1e999', 'inf', 'nan', float('inf')])
+def test_nombres_hors_limites_refuses(valeur):
+    assert erreurs(age=valeur, bmi=valeur).keys() == {'age', 'bmi'}
+
+
+def test_booleen_refuse_pour_un_entier():
+    assert erreurs(age=True) == {'age': 'type'}
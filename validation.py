@@ -0,0 +1,147 @@
+"""
+Validation des données cliniques d'un triage (formulaire et API JSON).
+
+Le schéma est compilé une seule fois, au chargement du module, en une suite
+de vérificateurs (un par champ). `valider` parcourt les champs en une passe :
+conversion, contrôle de plage ou d'énumération, et construction d'un
+EnregistrementTriage typé, utilisé tel quel par l'inférence et par l'INSERT.
+Toutes les erreurs sont collectées, pas seulement la première.
+"""
+import math
+
+CODES_TABAGISME = {'never smoked': 0, 'formerly smoked': 1, 'smokes': 2}
+
+# (clé reçue, type, contrainte), dans l'ordre des colonnes du modèle et de `triages`
+SCHEMA_TRIAGE = (
+    ('age', 'entier', (0, 120)),
+    ('gender', 'binaire', None),
+    ('chest_pain_type', 'entier', (0, 4)),
+    ('blood_pressure', 'entier', (40, 300)),
+    ('cholesterol', 'entier', (50, 700)),
+    ('max_heart_rate', 'entier', (20, 250)),
+    ('exercise_angina', 'binaire', None),
+    ('plasma_glucose', 'reel', (20, 1000)),
+    ('skin_thickness', 'reel', (0, 100)),
+    ('insulin', 'reel', (0, 1000)),
+    ('bmi', 'reel', (10, 80)),
+    ('diabetes_pedigree', 'reel', (0, 3)),
+    ('hypertension', 'binaire', None),
+    ('heart_disease', 'binaire', None),
+    ('Residence_type', 'choix', ('Urban', 'Rural')),
+    ('smoking_status', 'choix', tuple(CODES_TABAGISME)),
+)
+
+
+class ErreurValidation(Exception):
+    """Données refusées; `erreurs` liste un dict {'champ', 'code', 'message'} par champ"""
+
+    def __init__(self, erreurs):
+        super().__init__(", ".join(f"{e['champ']}: {e['message']}" for e in erreurs))
+        self.erreurs = erreurs
+
+
+class _ErreurChamp(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class EnregistrementTriage:
+    """Données cliniques validées et typées d'un triage"""
+    __slots__ = tuple(cle.lower() for cle, _, _ in SCHEMA_TRIAGE)
+
+    def __init__(self, *valeurs):
+        for nom, valeur in zip(self.__slots__, valeurs):
+            setattr(self, nom, valeur)
+
+    def vecteur(self):
+        """Les 16 valeurs du modèle (résidence et tabagisme encodés)"""
+        valeurs = [float(getattr(self, nom)) for nom in self.__slots__[:14]]
+        valeurs.append(1.0 if self.residence_type == 'Urban' else 0.0)
+        valeurs.append(float(CODES_TABAGISME[self.smoking_status]))
+        return valeurs
+
+    def valeurs_sql(self):
+        """Valeurs des colonnes age ... smoking_status de `triages`"""
+        return tuple(getattr(self, nom) for nom in self.__slots__)
+
+    def en_dict(self):
+        return {cle: getattr(self, nom) for (cle, _, _), nom in zip(SCHEMA_TRIAGE, self.__slots__)}
+
+
+def _entier(brut):
+    if isinstance(brut, bool):
+        raise _ErreurChamp('type', "entier attendu")
+    if isinstance(brut, int):
+        return brut
+    try:
+        valeur = float(brut.strip() if isinstance(brut, str) else brut)
+    except (TypeError, ValueError, OverflowError):
+        raise _ErreurChamp('type', "entier attendu")
+    if not valeur.is_integer():
+        raise _ErreurChamp('type', "entier attendu")
+    return int(valeur)
+
+
+def _reel(brut):
+    if isinstance(brut, bool):
+        raise _ErreurChamp('type', "nombre attendu")
+    try:
+        valeur = float(brut.strip() if isinstance(brut, str) else brut)
+    except (TypeError, ValueError, OverflowError):
+        raise _ErreurChamp('type', "nombre attendu")
+    if not math.isfinite(valeur):
+        raise _ErreurChamp('type', "nombre attendu")
+    return valeur
+
+
+def _compiler_champ(type_champ, contrainte):
+    """Vérificateur d'un champ: convertit la valeur brute ou lève _ErreurChamp"""
+    if type_champ == 'binaire':
+        def verifier(brut):
+            # Les booléens JSON sont acceptés pour les champs oui/non
+            valeur = int(brut) if isinstance(brut, bool) else _entier(brut)
+            if valeur not in (0, 1):
+                raise _ErreurChamp('valeur', "0 ou 1 attendu")
+            return valeur
+        return verifier
+
+    if type_champ == 'choix':
+        valeurs = frozenset(contrainte)
+        attendu = ", ".join(contrainte)
+
+        def verifier(brut):
+            if not isinstance(brut, str) or brut not in valeurs:
+                raise _ErreurChamp('valeur', f"valeur attendue parmi: {attendu}")
+            return brut
+        return verifier
+
+    convertir = _entier if type_champ == 'entier' else _reel
+    minimum, maximum = contrainte
+
+    def verifier(brut):
+        valeur = convertir(brut)
+        if not minimum <= valeur <= maximum:
+            raise _ErreurChamp('plage', f"valeur attendue entre {minimum} et {maximum}")
+        return valeur
+    return verifier
+
+
+VERIFICATEURS = tuple((cle, _compiler_champ(type_champ, contrainte)) for cle, type_champ, contrainte in SCHEMA_TRIAGE)
+
+
+def valider(donnees):
+    """Valider un mapping (request.form ou JSON) et renvoyer un EnregistrementTriage"""
+    valeurs, erreurs = [], []
+    for cle, verifier in VERIFICATEURS:
+        brut = donnees.get(cle)
+        if brut is None or brut == '':
+            erreurs.append({'champ': cle, 'code': 'requis', 'message': "champ requis"})
+            continue
+        try:
+            valeurs.append(verifier(brut))
+        except _ErreurChamp as e:
+            erreurs.append({'champ': cle, 'code': e.code, 'message': str(e)})
+    if erreurs:
+        raise ErreurValidation(erreurs)
+    return EnregistrementTriage(*valeurs)